@@ -0,0 +1,488 @@
+'''
+Benchmarks for the simulators
+
+Run all of them with `python benchmark.py` or call the individual functions.
+'''
+
+import os
+import time
+import numpy as np
+
+from circuit import QuantumCircuit
+from gate import *
+import gateOperators
+from fullStateUtil import *
+import simFullState
+import sweep
+from util import pi
+
+
+def timeIt(f, repeat=3):
+    ''' Best wall time of f() in seconds '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def randomState(n, seed=0):
+    rng = np.random.default_rng(seed)
+    psi = rng.standard_normal(2**n) + 1j*rng.standard_normal(2**n)
+    return (psi / np.linalg.norm(psi)).astype(stateDtype)
+
+
+def benchGateClasses(n=20, repeat=3):
+    ''' Compare the generic dense tensor kernel with the diagonal and
+        permutation kernels for each gate class '''
+    gates = [('Z', ()), ('S', ()), ('T', ()), ('Rz', (pi/3,)), ('CRz', (pi/3,)),
+             ('CCRz', (pi/3,)), ('P', (pi/3,)),
+             ('X', ()), ('Y', ()), ('CX', ()), ('SWAP', ()), ('CCX', ())]
+    psi = randomState(n)
+    shapedPsi = psi.reshape((2,)*n)
+    print('Gate class kernels, {} qubits'.format(n))
+    print('{:6} {:12} {:>10} {:>10} {:>8}'.format('gate', 'class', 'dense ms', 'fast ms', 'speedup'))
+    for name, args in gates:
+        gateOp = simFullState.findGateOp(name, args)
+        kind, data = simFullState.findGateKernel(name, args, gateOp)
+        bits = tuple(range(n//2, n//2 + len(gateOp).bit_length() - 1))
+        if kind == 'diagonal':
+            fast = lambda: applyDiagonal(shapedPsi, data, bits)
+        else:
+            fast = lambda: applyPermutation(shapedPsi, *data, bits)
+        dense = lambda: applyGateTensor(shapedPsi, gateOp, bits)
+        tDense, tFast = timeIt(dense, repeat), timeIt(fast, repeat)
+        print('{:6} {:12} {:10.2f} {:10.2f} {:7.1f}x'.format(
+            name, kind, tDense*1e3, tFast*1e3, tDense/tFast))
+
+
+def variationalCircuit(n, layers, theta):
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg)
+    for _ in range(layers):
+        for i in range(n-1):
+            CRz(theta)(reg[i], reg[i+1])
+        for bit in reg:
+            Rx(theta)(bit)
+    M(reg)
+    return circuit
+
+def benchSweep(n=10, layers=4, points=1000):
+    ''' Compare one batched sweep with simulating each parameter point '''
+    thetas = np.linspace(0, 2*pi, points)
+    tBatch = timeIt(lambda: sweep.sweep(
+        variationalCircuit(n, layers, Param('theta')), {'theta': thetas}).registerProbs(), 1)
+    tLoop = timeIt(lambda: [simFullState.simulate(variationalCircuit(n, layers, t)).registerProbs()
+                            for t in thetas], 1)
+    print('Parameter sweep, {} qubits, {} points: loop {:.2f} s, batched {:.2f} s, {:.1f}x'.format(
+        n, points, tLoop, tBatch, tLoop/tBatch))
+
+
+def layeredCircuit(n, layers):
+    ''' Alternating layers of dense single qubit gates and CX chains '''
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    for l in range(layers):
+        H(reg)
+        for bit in reg:
+            Ry(pi/(l+3))(bit)
+        for i in range(l % 2, n-1, 2):
+            CX(reg[i], reg[i+1])
+    return circuit
+
+def benchParallel(n=22, layers=2, maxWorkers=None):
+    ''' Scaling of simulate() with the number of worker threads '''
+    maxWorkers = maxWorkers or os.cpu_count()
+    circuit = layeredCircuit(n, layers)
+    counts = sorted({1, maxWorkers} | {2**i for i in range(maxWorkers.bit_length()) if 2**i <= maxWorkers})
+    print('Parallel scaling, {} qubits, {} gates'.format(n, len(circuit.history)))
+    base = None
+    for workers in counts:
+        t = timeIt(lambda: simFullState.simulate(circuit, workers=workers), 1)
+        base = base or t
+        print('{:3} workers {:8.2f} s {:6.2f}x'.format(workers, t, base/t))
+
+
+def benchHistory(numGates=10**6, n=32):
+    ''' Memory and gate counting of the columnar history against a list '''
+    import tracemalloc
+    from gateHistory import GateHistory
+    reg = QuantumCircuit(n)[:]
+    def gateInsts():
+        for i in range(numGates):
+            if i % 3:
+                yield CX.makeInstance((reg[i%n], reg[(i+1)%n]))
+            else:
+                yield Rz(i*1e-3).makeInstance((reg[i%n],))
+    sizes = []
+    for build in (list, GateHistory):
+        tracemalloc.start()
+        history = build(gateInsts())
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+    asList, history = list(gateInsts()), GateHistory(gateInsts())
+    tList = timeIt(lambda: sum(g.name == 'CX' for g in asList), 1)
+    tHistory = timeIt(lambda: history.countName('CX'), 1)
+    print('History of {} gates: list {:.1f} MB, columns {:.1f} MB; '
+          'count list {:.1f} ms, columns {:.4f} ms'.format(
+          numGates, sizes[0]/2**20, sizes[1]/2**20, tList*1e3, tHistory*1e3))
+
+def benchCircuitFile(numGates=10**6, n=32):
+    ''' Round trip and throughput of the binary circuit format '''
+    import tempfile
+    import circuitFile
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    for i in range(numGates):
+        if i % 3:
+            CX(reg[i%n], reg[(i+1)%n])
+        else:
+            Rz(i*1e-3)(reg[i%n])
+    with tempfile.TemporaryDirectory() as d:
+        fileName = os.path.join(d, 'bench.qcirc')
+        tWrite = timeIt(lambda: circuitFile.writeCircuit(circuit, fileName), 1)
+        tLoad = timeIt(lambda: circuitFile.readCircuit(fileName), 1)
+        tMmap = timeIt(lambda: circuitFile.readCircuit(fileName, mmap=True), 1)
+        tStream = timeIt(lambda: sum(1 for _ in circuitFile.iterGates(fileName)[1]), 1)
+        loaded = circuitFile.readCircuit(fileName, mmap=True)
+        assert all(np.array_equal(a, b) for a, b in
+                   zip(loaded.history.columns(), circuit.history.columns()))
+        size = os.path.getsize(fileName)
+    print('Circuit file of {} gates ({:.1f} MB): write {:.0f} ms, load {:.0f} ms, '
+          'mmap {:.1f} ms, stream {:.0f} ms'.format(
+          numGates, size/2**20, tWrite*1e3, tLoad*1e3, tMmap*1e3, tStream*1e3))
+
+def trotterGates(n, steps, dt=0.01):
+    ''' Generate the gates of a first order Trotterized Ising evolution '''
+    for _ in range(steps):
+        for i in range(n-1):
+            yield CX.makeInstance((i, i+1))
+            yield Rz(2*dt).makeInstance((i+1,))
+            yield CX.makeInstance((i, i+1))
+        for i in range(n):
+            yield Rx(2*dt).makeInstance((i,))
+
+def benchStream(n=12, steps=1000):
+    ''' Peak memory and time of simulating a generated circuit as a stream
+        against building the circuit first '''
+    import tracemalloc
+    def built():
+        circuit = QuantumCircuit(n)
+        circuit.history.extend(trotterGates(n, steps))
+        return simFullState.simulate(circuit)
+    def streamed():
+        return simFullState.simulateStream(trotterGates(n, steps), n)
+    for name, run in (('built', built), ('stream', streamed)):
+        tracemalloc.start()
+        t = timeIt(run, 1)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('Trotter {} x {} gates ({}): {:.2f} s, peak {:.1f} MB'.format(
+              steps, 4*n-3, name, t, peak/2**20))
+
+def benchOptimize(n=16, steps=10, dt=0.01):
+    ''' Gate counts and simulation time with and without the peephole
+        optimizer on a second order Trotter circuit in the X basis (the
+        Hadamards between steps cancel and the field half steps merge) '''
+    import optimize
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    for _ in range(steps):
+        H(reg)
+        Rz(dt)(reg)
+        for i in range(n-1):
+            CX(reg[i], reg[i+1])
+            Rz(2*dt)(reg[i+1])
+            CX(reg[i], reg[i+1])
+        Rz(dt)(reg)
+        H(reg)
+    stats = optimize.OptimizeStats()
+    optimized = optimize.optimizeCircuit(circuit, stats=stats)
+    assert optimize.checkEquivalence(circuit, optimized)
+    tBefore = timeIt(lambda: simFullState.simulate(circuit), 1)
+    tAfter = timeIt(lambda: simFullState.simulate(optimized), 1)
+    print('Optimize {} qubits: {} -> {} gates, simulate {:.2f} s -> {:.2f} s'.format(
+          n, stats.gatesIn, stats.gatesOut, tBefore, tAfter))
+
+def adderCircuit(k, a, b):
+    ''' Ripple carry adder of two k bit numbers into b and a carry register '''
+    circuit = QuantumCircuit()
+    regA, regB = circuit.newRegister(k), circuit.newRegister(k)
+    carry = circuit.newRegister(k+1)
+    X(regA, mask=a, littleEndian=True)
+    X(regB, mask=b, littleEndian=True)
+    for i in range(k):
+        CCX(regA[i], regB[i], carry[i+1])
+        CX(regA[i], regB[i])
+        CCX(carry[i], regB[i], carry[i+1])
+        CX(carry[i], regB[i])
+    M(circuit[:])
+    return circuit
+
+def benchSparse(smallK=6, largeK=20):
+    ''' Dense against sparse simulation of a classical adder '''
+    small = adderCircuit(smallK, 37, 21)
+    tDense = timeIt(lambda: simFullState.simulate(small), 1)
+    tSparse = timeIt(lambda: simFullState.simulate(small, engine='sparse'), 1)
+    large = adderCircuit(largeK, 123456, 654321)
+    tLarge = timeIt(lambda: simFullState.simulate(large, engine='sparse'), 1)
+    print('Adder {} qubits: dense {:.3f} s, sparse {:.4f} s; {} qubits sparse {:.4f} s'.format(
+          small.n, tDense, tSparse, large.n, tLarge))
+
+def benchStabilizer(n=1000, shots=1000):
+    ''' Simulation and sampling of a large Clifford circuit as a tableau '''
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg[0])
+    for i in range(n-1):
+        CX(reg[i], reg[i+1])
+    S(reg[::2])
+    H(reg[::3])
+    M(reg)
+    result = None
+    def run():
+        nonlocal result
+        result = simFullState.simulate(circuit, engine='auto')
+    tSim = timeIt(run, 1)
+    tSample = timeIt(lambda: result.sample(shots), 1)
+    print('Clifford {} qubits ({}): simulate {:.1f} ms, {} shots {:.1f} ms'.format(
+          n, result.engine, tSim*1e3, shots, tSample*1e3))
+
+@composite('QFT', -1)
+def qftGate(*bits):
+    for i, b in enumerate(bits):
+        H(b)
+        for j in range(i+1, len(bits)):
+            CRz(pi/2**(j-i))(bits[j], b)
+
+def benchTemplates(n=30, repeat=20):
+    ''' Circuit construction time of repeated composite gates with and
+        without the template cache '''
+    import gate
+    def build():
+        circuit = QuantumCircuit(n+repeat)
+        reg = circuit[:]
+        for i in range(repeat):
+            qftGate(reg[i:i+n])
+        return circuit
+    maxTemplates = gate.templateCache.maxTemplates
+    gate.templateCache.maxTemplates = 0
+    tPlain = timeIt(build, 1)
+    gate.templateCache.maxTemplates = maxTemplates
+    gate.templateCache.clear()
+    tCached = timeIt(build, 1)
+    print('Build {} QFTs on {} qubits ({} gates): {:.0f} ms, templates {:.0f} ms'.format(
+          repeat, n, len(build().history), tPlain*1e3, tCached*1e3))
+
+def benchRemap(n=8, rounds=6):
+    ''' Width and simulation time of a circuit that holds each ancilla pair
+        until the next pair is borrowed, with and without remapping '''
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg)
+    held = None
+    for i in range(rounds):
+        anc = circuit.borrowAncilla(2)
+        CCX(reg[i%n], reg[(i+1)%n], anc[0])
+        CX(anc[0], anc[1])
+        CRz(0.3)(anc[1], reg[(i+2)%n])
+        CX(anc[0], anc[1])
+        CCX(reg[i%n], reg[(i+1)%n], anc[0])
+        if held:
+            circuit.returnAncilla(held)
+        held = anc
+    circuit.returnAncilla(held)
+    M(circuit[:])
+    tFull = timeIt(lambda: simFullState.simulate(circuit), 1)
+    result = simFullState.simulate(circuit, remap=True)
+    tRemap = timeIt(lambda: simFullState.simulate(circuit, remap=True), 1)
+    print('Remap {} -> {} qubits ({:.1f} -> {:.1f} MB): simulate {:.3f} s -> {:.3f} s'.format(
+          circuit.n, result.n, *(b/2**20 for b in result.remapStats.stateBytes()),
+          tFull, tRemap))
+
+def benchFactored(groups=25, size=4, layers=3):
+    ''' Memory and time of a circuit of independent groups of entangled
+        qubits with the factored engine, against a dense state where it fits '''
+    n = groups * size
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    for layer in range(layers):
+        for g in range(groups):
+            block = reg[g*size:(g+1)*size]
+            Ry(0.3 + 0.1*layer)(block)
+            for i in range(size-1):
+                CX(block[i], block[i+1])
+    M(reg)
+    result = simFullState.simulate(circuit, engine='factored')
+    tFactored = timeIt(lambda: simFullState.simulate(circuit, engine='factored'), 1)
+    tSample = timeIt(lambda: result.sample(1000), 1)
+    print('Factored {} qubits in {} groups: {} bytes (dense {:.3g} bytes), simulate {:.3f} s, '
+          '1000 samples {:.3f} s'.format(n, len(result.components), result.nbytes,
+          16.0 * 2**n, tFactored, tSample))
+
+
+def benchMarginals(n=22, repeat=3):
+    ''' Per-qubit P(1) from one probOfMeasureBit() call per qubit against the
+        cached bitProbs() '''
+    result = simFullState.Result(n)
+    result.psi[:] = randomState(n)
+    tBits = timeIt(lambda: [result.probOfMeasureBit(q, 1) for q in range(n)], repeat)
+    result.bitProbs()
+    tCached = timeIt(result.bitProbs, repeat)
+    tPairs = timeIt(lambda: result.marginals([(q, q+1) for q in range(n-1)]), repeat)
+    print('P(1) of {} qubits: probOfMeasureBit {:.1f} ms, bitProbs {:.1f} ms; '
+          '{} pair marginals {:.1f} ms'.format(n, tBits*1e3, tCached*1e3, n-1, tPairs*1e3))
+
+def benchObservables(n=16):
+    ''' Bulk Pauli expectations of a Heisenberg model with all ZZ
+        correlations against copying the result and applying the X, Y, Z
+        gates of each term '''
+    from observable import pauliExpectations
+    result = simFullState.simulate(variationalCircuit(n, 4, 0.37), ignoreMGates=True)
+    terms = [{i: 'Z', j: 'Z'} for i in range(n) for j in range(i+1, n)]
+    terms += [{i: letter, i+1: letter} for letter in 'XY' for i in range(n-1)]
+    terms += [{i: letter} for letter in 'XZ' for i in range(n)]
+    terms = [(1.0, ''.join(t.get(q, 'I') for q in range(n))) for t in terms]
+    phaseOf = {'X': 1j, 'Y': 1j, 'Z': -1j}  # The gates are these multiples of the Paulis
+    def naive():
+        norm = np.vdot(result.psi, result.psi).real
+        values = []
+        for coef, pauli in terms:
+            other = result.copy()
+            phase = 1
+            for q, letter in enumerate(pauli):
+                if letter != 'I':
+                    op = getattr(gateOperators, letter)
+                    other._applyKernel(simFullState.findGateKernel(letter, (), op), (q,))
+                    phase *= phaseOf[letter]
+            values.append(coef * (np.vdot(result.psi, other.psi) / phase).real / norm)
+        return np.array(values)
+    assert np.allclose(naive(), pauliExpectations(result.psi, terms))
+    tNaive = timeIt(naive, 1)
+    tBulk = timeIt(lambda: pauliExpectations(result.psi, terms), 1)
+    print('{} Pauli terms on {} qubits: per term copies {:.3f} s, bulk {:.3f} s'.format(
+          len(terms), n, tNaive, tBulk))
+
+def benchGradient(n=12, layers=4):
+    ''' Adjoint gradient against central finite differences (two
+        simulations per parameter) of a variational circuit with a Param per
+        rotation '''
+    from gradient import adjointGradient
+    from observable import pauliExpectations
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg)
+    params = []
+    for layer in range(layers):
+        for i in range(n-1):
+            params.append(Param('c{}_{}'.format(layer, i)))
+            CRz(params[-1])(reg[i], reg[i+1])
+        for i, bit in enumerate(reg):
+            params.append(Param('x{}_{}'.format(layer, i)))
+            Rx(params[-1])(bit)
+    values = np.random.default_rng(0).uniform(0, 2*pi, len(params))
+    terms = [(1.0, 'Z'*n), (0.5, 'X'*n)]
+    def energy(x):
+        psi = sweep.sweep(circuit, dict(zip(params, x[:, None])), ignoreMGates=True).psi[0]
+        return pauliExpectations(psi, terms).sum()
+    def finiteDifferences(eps=1e-6):
+        steps = np.identity(len(params)) * eps
+        return np.array([(energy(values + d) - energy(values - d)) / (2*eps) for d in steps])
+    tAdjoint = timeIt(lambda: adjointGradient(circuit, values, terms), 1)
+    tFinite = timeIt(finiteDifferences, 1)
+    print('Gradient of {} parameters on {} qubits: adjoint {:.3f} s, finite differences '
+          '{:.3f} s'.format(len(params), n, tAdjoint, tFinite))
+
+def benchUnitary(n=12, chunkColumns=512):
+    ''' Check the unitary of a QFT against the DFT matrix, building the
+        columns in chunks, and estimate the time of one simulation per basis
+        state '''
+    from unitary import unitaryMatches
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    qftGate(*reg)
+    for i in range(n//2):
+        SWAP(reg[i], reg[n-1-i])
+    dft = np.exp(2j*pi*np.outer(np.arange(2**n), np.arange(2**n)) / 2**n)
+    assert unitaryMatches(circuit, dft, chunkColumns=chunkColumns, fuse=2)
+    tBlock = timeIt(lambda: unitaryMatches(circuit, dft, chunkColumns=chunkColumns, fuse=2), 1)
+    tColumn = timeIt(lambda: simFullState.simulate(circuit), 1)
+    print('Unitary of a {} qubit QFT in chunks of {} columns: {:.2f} s, one simulation per '
+          'column {:.0f} s'.format(n, chunkColumns, tBlock, tColumn * 2**n))
+
+def benchBlocked(n=24, layers=2, blockBits=14):
+    ''' Time of a layered circuit with the tensor and cache-blocked engines,
+        and the state traffic the batching saves '''
+    circuit = layeredCircuit(n, layers)
+    tTensor = timeIt(lambda: simFullState.simulate(circuit), 1)
+    result = simFullState.simulate(circuit, engine='blocked', blockBits=blockBits)
+    tBlocked = timeIt(lambda: simFullState.simulate(circuit, engine='blocked',
+                                                    blockBits=blockBits), 1)
+    unblocked, blocked = result.blockStats.trafficBytes(result.psi.nbytes)
+    print('Blocked {} qubits, {} gates: tensor {:.2f} s, blocked {:.2f} s, '
+          'traffic {:.1f} -> {:.1f} GB'.format(n, len(circuit.history), tTensor, tBlocked,
+          unblocked / 1e9, blocked / 1e9))
+    print(result.blockStats)
+
+def ghzCircuit(n):
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg[0])
+    for i in range(n-1):
+        CX(reg[i], reg[i+1])
+    M(reg)
+    return circuit
+
+def qftCircuit(n):
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    X(reg[::3])
+    for i in range(n):
+        H(reg[i])
+        for j in range(i+1, n):
+            CRz(pi/2**(j-i))(reg[j], reg[i])
+    M(reg)
+    return circuit
+
+def referenceCircuits(n=12):
+    return {
+        'ghz': ghzCircuit(n),
+        'qft': qftCircuit(n),
+        'layered': layeredCircuit(n, 8),
+        'variational': variationalCircuit(n, 6, 0.37),
+    }
+
+def accuracyReport(n=12, dtype=np.complex64):
+    ''' Compare a reduced precision simulation with complex128 on the reference
+        circuits '''
+    print('Accuracy of {} vs complex128, {} qubits'.format(np.dtype(dtype).name, n))
+    print('{:12} {:>12} {:>12} {:>12}'.format('circuit', 'max |dpsi|', 'tot var', '1-fidelity'))
+    for name, circuit in referenceCircuits(n).items():
+        ref = simFullState.simulate(circuit).psi
+        low = simFullState.simulate(circuit, dtype=dtype).psi.astype(ref.dtype)
+        ref, low = ref / np.linalg.norm(ref), low / np.linalg.norm(low)
+        pRef, pLow = np.abs(ref)**2, np.abs(low)**2
+        print('{:12} {:12.3e} {:12.3e} {:12.3e}'.format(name, np.max(np.abs(ref - low)),
+              0.5*np.sum(np.abs(pRef - pLow)), 1 - np.abs(np.vdot(ref, low))**2))
+
+
+if __name__ == '__main__':
+    benchGateClasses()
+    benchSweep()
+    benchParallel()
+    accuracyReport()
+    benchHistory()
+    benchCircuitFile()
+    benchStream()
+    benchOptimize()
+    benchSparse()
+    benchStabilizer()
+    benchTemplates()
+    benchRemap()
+    benchFactored()
+    benchMarginals()
+    benchObservables()
+    benchGradient()
+    benchUnitary()
+    benchBlocked()
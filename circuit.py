@@ -2,7 +2,7 @@
 
 import gate
 from gate import Gate, GenericGate
-import util
+from gateHistory import GateHistory
 
 
 class Qubit(int):
@@ -20,7 +20,8 @@ class QuantumCircuit:
         self.bitObjs = ()
         self.ancillaBits = ()
         self.availableAncillaBits = ()
-        self.history = []
+        self.ancillaReturns = []  # (len(history), bit) when each ancilla was returned
+        self.history = GateHistory(qubits=self)
         self.regNames = {}
         self.nameGenIndex = 0
         self.nameGenList = [chr(i) for i in reversed(range(ord('a'), ord('z'))) if i != ord('q')]
@@ -57,9 +58,9 @@ class QuantumCircuit:
         return reg
     def returnAncilla(self, bits):
         ''' Bits must be returned to zero before returning.
-            Return in the reverse order that they were borrowed. '''
-        # TODO: Keep sorted
-        self.availableAncillaBits = bits + self.availableAncillaBits
+            The free list is kept sorted so the lowest ancillas are reused first. '''
+        self.ancillaReturns.extend((len(self.history), int(b)) for b in bits)
+        self.availableAncillaBits = tuple(sorted(tuple(bits) + self.availableAncillaBits))
 
     def applyGate(self, gate, bits):
         self.history.append(gate.makeInstance(bits))
@@ -72,7 +73,7 @@ class QuantumCircuit:
     def countGate(self, gateOrName):
         if isinstance(gateOrName, (Gate, GenericGate)):
             gateOrName = gateOrName.name
-        return util.countMatching(self.history, lambda g: g.name == gateOrName)
+        return self.history.countName(gateOrName)
     def countM(self):
         return self.countGate(gate.M)
 
@@ -80,7 +81,7 @@ class QuantumCircuit:
         with open(fName, 'w') as f:
             self.writeToFile(f)
     def writeToFile(self, f):
-        for gate in s.history:
+        for gate in self.history:
             f.write(str(gate))
             f.write('\n')
 
@@ -0,0 +1,155 @@
+'''
+Binary circuit file format
+
+Layout (little endian):
+    8 bytes   magic b'QCIRC\\x00\\x01\\x00'
+    8 bytes   uint64 length of the JSON header
+    header    JSON with n, register names, ancillas, gate table, array lengths
+              and the arguments of gates not stored in the args array
+    arrays    gateIds int32, bitStart int64, bits int32, argStart int64 and
+              args float64 (see gateHistory.GateHistory), each 8 byte aligned
+
+The arrays can be memory mapped so loading does no per-gate Python work and
+files larger than RAM can be simulated or streamed gate by gate.
+
+Example:
+```
+    import circuitFile
+    from simFullState import simulate
+
+    circuitFile.writeCircuit(circuit, 'adder.qcirc')
+    circuit = circuitFile.readCircuit('adder.qcirc', mmap=True)
+    result = simulate(circuit)
+```
+'''
+
+import json
+import numbers
+import numpy as np
+
+from circuit import Qubit, QuantumCircuit
+from gate import Param
+from gateHistory import GateHistory
+
+
+magic = b'QCIRC\x00\x01\x00'
+_arrayDtypes = (('gateIds', '<i4'), ('bitStart', '<i8'), ('bits', '<i4'),
+                ('argStart', '<i8'), ('args', '<f8'))
+
+
+class CircuitFileError(Exception): pass
+
+
+def _encodeArg(arg):
+    if isinstance(arg, Param):
+        return {'param': arg.name}
+    if isinstance(arg, numbers.Integral):
+        return int(arg)
+    if isinstance(arg, numbers.Real):
+        return float(arg)
+    if isinstance(arg, numbers.Complex):
+        return {'complex': [arg.real, arg.imag]}
+    raise CircuitFileError('Cannot store gate argument {!r}'.format(arg))
+def _decodeArg(arg):
+    if isinstance(arg, dict):
+        if 'complex' in arg:
+            return complex(*arg['complex'])
+        return Param(arg['param'])
+    return arg
+
+def _align(f):
+    pad = -f.tell() % 8
+    f.write(b'\x00' * pad)
+
+def writeCircuit(circuit, fileOrName):
+    ''' Write the circuit in the binary format.  The history columns are written
+        in bulk. '''
+    if isinstance(fileOrName, str):
+        with open(fileOrName, 'wb') as f:
+            return writeCircuit(circuit, f)
+    f = fileOrName
+    history = circuit.history
+    if not isinstance(history, GateHistory):
+        history = GateHistory(history)
+    arrays = history.columns()
+    header = {
+        'n': circuit.n,
+        'regNames': {name: [int(b) for b in bits] for name, bits in circuit.regNames.items()},
+        'ancillaBits': [int(b) for b in circuit.ancillaBits],
+        'availableAncillaBits': [int(b) for b in circuit.availableAncillaBits],
+        'ancillaReturns': [[int(i), int(b)] for i, b in circuit.ancillaReturns],
+        'gateTable': history.gateTable,
+        'lengths': [len(a) for a in arrays],
+        'objArgs': {str(i): [_encodeArg(a) for a in args]
+                    for i, args in history._objArgs.items()},
+    }
+    headerBytes = json.dumps(header).encode('utf-8')
+    f.write(magic)
+    f.write(np.uint64(len(headerBytes)).tobytes())
+    f.write(headerBytes)
+    for array, (_, dtype) in zip(arrays, _arrayDtypes):
+        _align(f)
+        f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+def _readHeader(f):
+    if f.read(len(magic)) != magic:
+        raise CircuitFileError('Not a circuit file')
+    headerLen = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+    header = json.loads(f.read(headerLen).decode('utf-8'))
+    offsets = []
+    offset = f.tell()
+    for length, (_, dtype) in zip(header['lengths'], _arrayDtypes):
+        offset += -offset % 8
+        offsets.append(offset)
+        offset += length * np.dtype(dtype).itemsize
+    return header, offsets
+
+def _readArrays(fileName, header, offsets, mmap):
+    arrays = []
+    with open(fileName, 'rb') as f:
+        for length, offset, (_, dtype) in zip(header['lengths'], offsets, _arrayDtypes):
+            if mmap:
+                arrays.append(np.memmap(fileName, dtype=dtype, mode='r', offset=offset,
+                                        shape=(length,)) if length else np.zeros(0, dtype))
+            else:
+                f.seek(offset)
+                arrays.append(np.fromfile(f, dtype=dtype, count=length))
+    return arrays
+
+def _newCircuit(header):
+    circuit = QuantumCircuit()
+    n = header['n']
+    circuit.n = n
+    circuit.bitObjs = tuple(Qubit(i, circuit) for i in range(n))
+    circuit.regNames = {name: tuple(bits) for name, bits in header['regNames'].items()}
+    circuit.ancillaBits = tuple(circuit.bitObjs[b] for b in header['ancillaBits'])
+    circuit.availableAncillaBits = tuple(circuit.bitObjs[b] for b in
+                                         header.get('availableAncillaBits', header['ancillaBits']))
+    circuit.ancillaReturns = [tuple(r) for r in header.get('ancillaReturns', ())]
+    circuit.nameGenList = [name for name in circuit.nameGenList if name not in circuit.regNames]
+    return circuit
+
+def _readHistory(fileName, header, offsets, qubits, mmap):
+    arrays = _readArrays(fileName, header, offsets, mmap)
+    objArgs = {int(i): tuple(_decodeArg(a) for a in args)
+               for i, args in header['objArgs'].items()}
+    return GateHistory.fromColumns(*arrays, header['gateTable'], objArgs=objArgs,
+                                   qubits=qubits)
+
+def readCircuit(fileName, mmap=False):
+    ''' Load a QuantumCircuit.  The history columns are read in bulk or, with
+        mmap, memory mapped from the file. '''
+    with open(fileName, 'rb') as f:
+        header, offsets = _readHeader(f)
+    circuit = _newCircuit(header)
+    circuit.history = _readHistory(fileName, header, offsets, circuit, mmap)
+    return circuit
+
+def iterGates(fileName, blockSize=2**16):
+    ''' Stream the GateInstances of a circuit file without loading it, reading
+        blockSize gates at a time.  Bits are plain ints.
+        Returns (n, iterator of GateInstances). '''
+    with open(fileName, 'rb') as f:
+        header, offsets = _readHeader(f)
+    history = _readHistory(fileName, header, offsets, None, True)
+    return header['n'], history.iterRange(0, len(history), blockSize=blockSize)
@@ -20,8 +20,8 @@ def tensorProductSparse(v1, *vals):
         out = sparse.kron(out, v)
     return out
 
-def createZeroState(n):
-    psi = np.zeros(2**n, dtype=stateDtype)
+def createZeroState(n, dtype=stateDtype):
+    psi = np.zeros(2**n, dtype=dtype)
     psi[0] = 1
     return psi
 def createInitialState(*bitStates):
@@ -48,7 +48,7 @@ def expandGate(baseGate, finalN):
 
 def swapGateDense(*bitMap):
     n = len(bitMap)
-    gate = np.zeros((2**n,)*2, dtype=np.int)
+    gate = np.zeros((2**n,)*2, dtype=np.int_)
     for idxs in itertools.product((0,1), repeat=n):
         x, xr = 0, 0
         for i in range(n):
@@ -58,7 +58,7 @@ def swapGateDense(*bitMap):
     return gate
 def swapGate(*bitMap):
     n = len(bitMap)
-    gate = sparse.lil_matrix((2**n,)*2, dtype=np.int)
+    gate = sparse.lil_matrix((2**n,)*2, dtype=np.int_)
     rows = [None] * 2**n
     for idxs in itertools.product((0,1), repeat=n):
         x, xr = 0, 0
@@ -75,19 +75,132 @@ def swapGates(*bitMap):
     return gate, gate.T
 
 
+def applyGateTensor(shapedPsi, gate, axes):
+    ''' Apply gate in place to the given axes of a state reshaped to (2,)*n.
+        The gate is contracted directly into the target axes so no permutation
+        matrix is built.  Axes not listed (including any extra non-qubit axes)
+        are carried along unchanged. '''
+    k = len(axes)
+    if k <= 0:
+        shapedPsi *= gate[0,0]
+        return shapedPsi
+    axes = tuple(int(a) for a in axes)
+    shapedGate = gate.reshape((2,)*(2*k))
+    out = np.tensordot(shapedGate, shapedPsi, axes=(tuple(range(k, 2*k)), axes))
+    shapedPsi[...] = np.moveaxis(out, tuple(range(k)), axes)
+    return shapedPsi
+
+def axesIndex(ndim, axes, vals):
+    index = [slice(None)] * ndim
+    for a, v in zip(axes, vals):
+        index[a] = v
+    return (*index, Ellipsis)  # Ellipsis keeps a view when every axis is fixed
+def applyDiagonal(shapedPsi, diag, axes):
+    ''' Apply a diagonal gate in place as a phase multiply of each strided
+        slice of the target axes.  diag is the diagonal of the gate matrix. '''
+    k = len(axes)
+    for j, d in enumerate(diag):
+        if d != 1:
+            shapedPsi[axesIndex(shapedPsi.ndim, axes, util.toTupleBE(j, k))] *= d
+    return shapedPsi
+def applyPermutation(shapedPsi, perm, phases, axes):
+    ''' Apply a gate with one nonzero per row in place by moving whole slices
+        of the target axes.  Row j of the gate is phases[j] at column perm[j]. '''
+    k = len(axes)
+    slices = [shapedPsi[axesIndex(shapedPsi.ndim, axes, util.toTupleBE(j, k))]
+              for j in range(len(perm))]
+    done = set()
+    for start in range(len(perm)):
+        if start in done:
+            continue
+        cycle = [start]
+        j = perm[start]
+        while j != start:
+            cycle.append(j)
+            j = perm[j]
+        done.update(cycle)
+        first = slices[start].copy() if len(cycle) > 1 else slices[start]
+        sources = [slices[j] for j in cycle[1:]] + [first]
+        for j, src in zip(cycle, sources):
+            if phases[j] == 1:
+                if src is not slices[j]:
+                    slices[j][...] = src
+            else:
+                np.multiply(src, phases[j], out=slices[j])
+    return shapedPsi
+
+def applyGateStack(shapedPsi, gates, axes):
+    ''' Apply a different gate to each entry of the leading batch axis in
+        place.  gates has shape (batch, 2**k, 2**k) and axes count the qubit
+        axes after the batch axis. '''
+    k, n = len(axes), shapedPsi.ndim - 1
+    if k <= 0:
+        shapedPsi *= gates[:,0,0].reshape((-1,) + (1,)*n)
+        return shapedPsi
+    letters = [chr(ord('a')+i) if i < 26 else chr(ord('A')+i-26) for i in range(n+k+1)]
+    batch, psiSub, outSub = letters[0], letters[1:n+1], letters[n+1:]
+    resultSub = list(psiSub)
+    for a, o in zip(axes, outSub):
+        resultSub[a] = o
+    subscripts = '{}{}{},{}{}->{}{}'.format(
+        batch, ''.join(outSub), ''.join(psiSub[a] for a in axes),
+        batch, ''.join(psiSub), batch, ''.join(resultSub))
+    shapedGates = gates.reshape((len(gates),) + (2,)*(2*k))
+    shapedPsi[...] = np.einsum(subscripts, shapedGates, shapedPsi)
+    return shapedPsi
+def applyDiagonalStack(shapedPsi, diags, axes):
+    ''' Like applyGateStack for diagonal gates given as a (batch, 2**k) array
+        of their diagonals '''
+    k, n = len(axes), shapedPsi.ndim - 1
+    axes = tuple(a+1 for a in axes)
+    for j in range(diags.shape[1]):
+        d = diags[:,j].reshape((-1,) + (1,)*(n-k))
+        shapedPsi[axesIndex(shapedPsi.ndim, axes, util.toTupleBE(j, k))] *= d
+    return shapedPsi
+
+
 def apply(psi, *gates):
     for gate in gates:
         psi2 = np.dot(gate, psi)
     return psi2
 
 def probabilityOfMeasure(psi, bitI, state=0):
-    n = len(psi).bit_length() - 1
-    # TODO: No temp array creation
-    shapedPsi = psi.reshape((2,)*n)
-    squaredPsi = (shapedPsi.conj() * shapedPsi).real
-    sums = np.sum(squaredPsi, axis=tuple(i for i in range(n) if i!=bitI))
+    # Sum the squared real and imaginary parts through a float view of psi
+    parts = np.ascontiguousarray(psi).view(psi.real.dtype).reshape(2**bitI, 2, -1)
+    sums = np.einsum('ijk,ijk->j', parts, parts)
     return sums[state] / np.sum(sums)
 
+def marginalProbs(probs, bits):
+    ''' Sum of probs (of all 2**n big endian outputs) for each output of the
+        given bits, the first most significant '''
+    n = len(probs).bit_length() - 1
+    bits = [int(b) for b in bits]
+    kept = sorted(bits)
+    # Merge each run of summed qubits into one axis.  einsum is much faster
+    # than np.sum when the kept axes are the last ones.
+    shape, keptAxes = [], []
+    prev = -1
+    for b in kept + [n]:
+        if b - prev > 1:
+            shape.append(2**(b-prev-1))
+        if b < n:
+            keptAxes.append(len(shape))
+            shape.append(2)
+        prev = b
+    sums = np.einsum(probs.reshape(shape), list(range(len(shape))), keptAxes)
+    return np.transpose(sums.reshape((2,)*len(kept)), [kept.index(b) for b in bits]).reshape(-1)
+
+def bitProbs(probs):
+    ''' Probability of each bit being 1 given probs of all 2**n outputs.  The
+        bits are summed out from the last one so probs is read about twice. '''
+    n = len(probs).bit_length() - 1
+    out = np.empty(n)
+    for b in reversed(range(n)):
+        pairs = probs.reshape(-1, 2)
+        out[b] = np.sum(pairs[:, 1])
+        probs = pairs[:, 0] + pairs[:, 1]
+    return out / probs[0]
+
 def probabilityOfMeasureAll(psi, bitsValue):
     n = len(psi).bit_length() - 1
     a = psi[bitsValue]
@@ -95,14 +208,23 @@ def probabilityOfMeasureAll(psi, bitsValue):
     squaredPsi = (psi.conj() * psi).real
     return p / np.sum(squaredPsi)
 
-def measure(psi, bitI, inPlace=False):
+def collapseBit(psi, bitI, bitVal):
+    ''' Zero the amplitudes where bitI is not bitVal in place.  The state is
+        not normalized. '''
     n = len(psi).bit_length() - 1
+    psi.reshape((2,)*n)[axesIndex(n, (bitI,), (1-bitVal,))] = 0
+    return psi
+
+def measure(psi, bitI, inPlace=False, rng=None):
+    ''' Measure one bit.  The returned prob is the probability of measuring 0.
+
+        rng: numpy.random.Generator to draw from instead of the random module
+    '''
     prob = probabilityOfMeasure(psi, bitI, state=0)
-    measuredBit = int(random.random() >= prob)
-    s = slice(None)
+    measuredBit = int((random.random() if rng is None else rng.random()) >= prob)
     if not inPlace:
         psi = psi.copy()
-    psi.reshape((2,)*n)[tuple(1-measuredBit if i==bitI else s for i in range(n))] = 0
+    collapseBit(psi, bitI, measuredBit)
     # Don't normalize
     if inPlace:
         return measuredBit, prob
@@ -110,18 +232,75 @@ def measure(psi, bitI, inPlace=False):
         return psi, measuredBit, prob
 
 
-def exactMeasureResults(psi):
-    ''' Calculate the exact probabilities that any output is measured. '''
+def permuteIndexBits(indices, n, order):
+    ''' Reorder the bits of big endian basis state indices so bit i of the
+        result is bit order[i] of the input '''
+    indices = np.asarray(indices, dtype=np.int64)
+    out = np.zeros_like(indices)
+    for i, b in enumerate(order):
+        out |= ((indices >> (n-1-int(b))) & 1) << (n-1-i)
+    return out
+
+def bitsToIndices(bits, order=None):
+    ''' Big endian integers of the rows of a bool array (shots, n) of bits in
+        qubit order, reordered to the given qubit order.  For more than 62
+        bits they are Python ints in an object array. '''
+    n = bits.shape[1]
+    if order:
+        bits = bits[:, [int(b) for b in order]]
+    if n <= 62:
+        weights = 1 << np.arange(n-1, -1, -1, dtype=np.int64)
+        return bits.astype(np.int64) @ weights
+    pad = -n % 8
+    return np.array([int.from_bytes(row.tobytes(), 'big') >> pad
+                     for row in np.packbits(bits, axis=1)], dtype=object)
+
+def topKProbs(indices, probs, topK):
+    ''' Keep the topK most likely outputs sorted by decreasing probability '''
+    if topK is None:
+        return indices, probs
+    top = np.arange(len(probs))
+    if topK < len(probs):
+        top = np.argpartition(probs, -topK)[-topK:]
+    top = top[np.argsort(-probs[top], kind='stable')]
+    return indices[top], probs[top]
+
+def measureProbArrays(psi, threshold=1e-10, topK=None, order=None):
+    ''' Calculate the exact probability of every likely output as compact
+        (indices, probs) arrays sorted by index (or by decreasing probability if
+        topK is given).  Outputs with probability at most threshold are dropped.
+
+        order: Qubit order of the output index (big endian), default 0..n-1
+    '''
     n = len(psi).bit_length() - 1
-    counter = {}
-    for bitsVal in range(2**n):
-        shapedPsi = psi.reshape((2,)*n)
-        squaredPsi = (shapedPsi.conj() * shapedPsi).real
-        normConst = np.sum(squaredPsi)
-        a = psi[bitsVal]
-        p = (a.conj() * a).real
-        prob = round(p / normConst, 5)
-        if p / normConst > 1e-10:
-            counter[bitsVal] = prob
-    return {util.toTupleBE(k, n):v for k, v in counter.items()}
+    probs = (psi.conj() * psi).real
+    if order is not None:
+        probs = probs.reshape((2,)*n).transpose(tuple(int(b) for b in order)).reshape(-1)
+    probs /= np.sum(probs)
+    indices = np.flatnonzero(probs > threshold)
+    return topKProbs(indices, probs[indices], topK)
 
+def sampleMeasurements(psi, shots, rng=None, order=None):
+    ''' Draw shots outputs at once from the cumulative distribution of
+        |psi|^2.  Returns (outputs, counts) integer arrays of the distinct
+        outputs drawn (big endian in the given qubit order) and their counts.
+
+        rng: numpy.random.Generator or seed
+    '''
+    n = len(psi).bit_length() - 1
+    rng = np.random.default_rng(rng)
+    probs = (psi.conj() * psi).real
+    if order is not None:
+        probs = probs.reshape((2,)*n).transpose(tuple(int(b) for b in order)).reshape(-1)
+    cdf = np.cumsum(probs)
+    draws = np.searchsorted(cdf, rng.random(shots) * cdf[-1], side='right')
+    np.minimum(draws, len(cdf)-1, out=draws)
+    return np.unique(draws, return_counts=True)
+
+def exactMeasureResults(psi, topK=None, order=None, threshold=1e-10):
+    ''' Calculate the exact probabilities that any output is measured. '''
+    n = len(psi).bit_length() - 1
+    return probArraysToDict(*measureProbArrays(psi, threshold=threshold, topK=topK,
+                                               order=order), n)
+def probArraysToDict(indices, probs, n):
+    return {util.toTupleBE(int(k), n): v for k, v in zip(indices, np.round(probs, 5))}
@@ -1,7 +1,8 @@
 ''' Gate declarations '''
 
 import collections.abc
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import numpy as np
 
 import util
 
@@ -27,14 +28,130 @@ GateInstance.__repr__ = lambda self: (
     '{}_{}({})'.format(self.name, ','.join(map(str,self.args)), ', '.join(map(str,self.bits))))
 GateInstance.instanceOf = lambda self, g: self.name == g.name
 
+class Param:
+    ''' Symbolic gate argument whose value is supplied at simulation time '''
+    __slots__ = ('name',)
+    def __init__(self, name):
+        self.name = str(name)
+    def __eq__(self, other):
+        return isinstance(other, Param) and self.name == other.name
+    def __hash__(self):
+        return hash((Param, self.name))
+    def __repr__(self):
+        return self.name
+
+class TemplateCache:
+    ''' LRU cache of composite gate expansions.  The gates a composite applies
+        are recorded the first time it is applied for each gate, arguments and
+        number of bits.  Later applications splice the recorded template into
+        the circuit history in bulk with the bits relocated.
+
+        Composites that apply gates to other bits (e.g. borrowed ancillas) or
+        add qubits are not cached.  A composite must not depend on the indices
+        of its bits, otherwise create it with cacheTemplate=False.
+
+        maxTemplates: Number of templates kept, 0 disables caching
+        maxGates: Total number of gates in the kept templates
+    '''
+    def __init__(self, maxTemplates=1024, maxGates=2**20):
+        self.maxTemplates = maxTemplates
+        self.maxGates = maxGates
+        self._templates = OrderedDict()
+        self.gates = 0
+        self.hits = 0
+        self.misses = 0
+    def __len__(self):
+        return len(self._templates)
+    def __repr__(self):
+        return 'TemplateCache(templates={}, gates={}, hits={}, misses={})'.format(
+            len(self), self.gates, self.hits, self.misses)
+    def clear(self):
+        self._templates.clear()
+        self.gates = 0
+
+    @staticmethod
+    def key(gate, numBits):
+        ''' Cache key of a composite gate or None if it can't be cached '''
+        code = getattr(gate.composite, '__code__', None)
+        try:
+            cells = tuple(c.cell_contents for c in gate.composite.__closure__ or ())
+            key = (code, cells, gate.name, gate.args, numBits)
+            hash(key)
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return key if code is not None else None
+    def get(self, key):
+        ''' The template, () if the composite can't be cached or None '''
+        template = self._templates.get(key)
+        if template is None:
+            self.misses += 1
+        else:
+            self._templates.move_to_end(key)
+            self.hits += 1
+        return template
+    def store(self, key, template):
+        size = len(template[1]) if template else 0
+        if size > self.maxGates:
+            return
+        self._templates[key] = template
+        self.gates += size
+        while len(self._templates) > self.maxTemplates or self.gates > self.maxGates:
+            _, old = self._templates.popitem(last=False)
+            self.gates -= len(old[1]) if old else 0
+
+templateCache = TemplateCache()
+
+def _recordTemplate(history, start, bits):
+    ''' Make a template of history[start:] relative to bits or return () if
+        it uses other bits '''
+    gateIds, bitStart, absBits, argStart, args, objArgs = history.columnRange(start, len(history))
+    bitIndices = [b.__index__() for b in bits]
+    if len(set(bitIndices)) != len(bitIndices):
+        return ()
+    relative = {b: i for i, b in enumerate(bitIndices)}
+    try:
+        relBits = np.array([relative[b] for b in absBits.tolist()], dtype=np.int32)
+    except KeyError:
+        return ()
+    usedIds, localIds = np.unique(gateIds, return_inverse=True)
+    gateKeys = [history.gateTable[i] for i in usedIds.tolist()]
+    return gateKeys, localIds.astype(np.int32), bitStart, relBits, argStart, args, objArgs
+
+def _applyComposite(gate, bits):
+    state = getattr(bits[0], 'state', None) if bits else None
+    history = getattr(state, 'history', None)
+    key = None
+    if (gate.cacheTemplate and templateCache.maxTemplates > 0
+            and hasattr(history, 'extendArrays')
+            and all(getattr(b, 'state', None) is state for b in bits)):
+        key = templateCache.key(gate, len(bits))
+    if key is None:
+        gate.composite(*bits)
+        return
+    template = templateCache.get(key)
+    if template:
+        gateKeys, localIds, bitStart, relBits, argStart, args, objArgs = template
+        idMap = np.array([history.gateId(*k) for k in gateKeys], dtype=np.int32)
+        bitMap = np.array([b.__index__() for b in bits], dtype=np.int32)
+        history.extendArrays(idMap[localIds], bitStart, bitMap[relBits], argStart, args,
+                             objArgs)
+        return
+    start, n = len(history), state.n
+    gate.composite(*bits)
+    if template is None:
+        templateCache.store(key, _recordTemplate(history, start, bits) if state.n == n else ())
+
+
 class GenericGate:
-    def __init__(self, name, size, numArgs, composite=None, divergent=False, measurement=False):
+    def __init__(self, name, size, numArgs, composite=None, divergent=False, measurement=False,
+                 cacheTemplate=True):
         self.name = str(name)
         self.size = int(size)
         self.numArgs = int(numArgs)
         self.composite = composite
         self.divergent = bool(divergent)
         self.measurement = bool(measurement)
+        self.cacheTemplate = bool(cacheTemplate)
     def __call__(self, *args, **kwargs):
         if self.numArgs >= 0:
             assert len(args) == self.numArgs, 'Incorrect number of arguments for generic gate'
@@ -45,24 +162,28 @@ class GenericGate:
         else:
             concreteComposite = None
         return Gate(self.name, self.size, args=args, divergent=self.divergent,
-                    measurement=self.measurement, composite=concreteComposite)
+                    measurement=self.measurement, composite=concreteComposite,
+                    cacheTemplate=self.cacheTemplate)
 
 class Gate:
-    __slots__ = ('name', 'size', 'args', 'composite', 'divergent', 'measurement')
-    def __init__(self, name, size, args=None, composite=None, divergent=False, measurement=False):
+    __slots__ = ('name', 'size', 'args', 'composite', 'divergent', 'measurement',
+                 'cacheTemplate')
+    def __init__(self, name, size, args=None, composite=None, divergent=False, measurement=False,
+                 cacheTemplate=True):
         self.name = str(name)
         self.size = int(size)
         self.args = () if args is None else tuple(args)
         self.composite = composite
         self.divergent = bool(divergent)
         self.measurement = bool(measurement)
+        self.cacheTemplate = bool(cacheTemplate)
     def makeInstance(self, bits):
         return GateInstance(self.name, self.args, tuple(bits), self.divergent, self.measurement)
     def applySingle(self, bits):
         if self.size > 0:
             assert len(bits) == self.size
         if self.composite:
-            self.composite(*bits)
+            _applyComposite(self, bits)
         elif self.size != 0:
             bits[0].state.applyGate(self, bits)
         else:
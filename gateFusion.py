@@ -0,0 +1,100 @@
+''' Gate fusion pass that merges runs of small gates into single unitaries '''
+
+import numpy as np
+
+from gate import GateInstance
+from fullStateUtil import applyGateTensor
+
+
+class FusionStats:
+    def __init__(self):
+        self.gatesIn = 0
+        self.gatesOut = 0
+        self.fusedBlocks = 0
+    @property
+    def passesSaved(self):
+        ''' Number of passes over the state avoided by fusion '''
+        return self.gatesIn - self.gatesOut
+    def __repr__(self):
+        return 'FusionStats(gatesIn={}, gatesOut={}, fusedBlocks={}, passesSaved={})'.format(
+            self.gatesIn, self.gatesOut, self.fusedBlocks, self.passesSaved)
+
+
+class _Block:
+    def __init__(self, gateInst, gateOp):
+        self.bits = list(gateInst.bits)
+        self.op = gateOp
+        self.insts = [gateInst]
+    def merge(self, other):
+        self.op = np.kron(self.op, other.op)
+        self.bits += other.bits
+        self.insts += other.insts
+    def apply(self, gateInst, gateOp):
+        newBits = [b for b in gateInst.bits if b not in self.bits]
+        if newBits:
+            self.op = np.kron(self.op, np.identity(2**len(newBits), dtype=self.op.dtype))
+            self.bits += newBits
+        m = len(self.bits)
+        op = self.op.astype(np.result_type(self.op, gateOp, np.complex64))
+        applyGateTensor(op.reshape((2,)*m + (2**m,)), gateOp,
+                        tuple(self.bits.index(b) for b in gateInst.bits))
+        self.op = op
+        self.insts.append(gateInst)
+    def emit(self):
+        if len(self.insts) == 1:
+            return self.insts[0], None
+        bits = tuple(self.bits)
+        divergent = any(g.divergent for g in self.insts)
+        return GateInstance('Fused', (), bits, divergent, False), self.op
+
+
+def fuseGates(gateInsts, findGateOp, maxBits=3, stats=None):
+    ''' Greedily merge consecutive gates into blocks acting on at most maxBits
+        qubits.  Blocks on disjoint qubits stay open side by side because they
+        commute, so a gate only closes the blocks that share its qubits.
+
+        Yields (gateInst, gateOp) pairs.  gateOp is None when the instance is
+        passed through unchanged and the fused unitary for 'Fused' instances.
+    '''
+    if stats is None:
+        stats = FusionStats()
+    openBlocks = []
+    def close(blocks):
+        for block in blocks:
+            openBlocks.remove(block)
+            if len(block.insts) > 1:
+                stats.fusedBlocks += 1
+            stats.gatesOut += 1
+            yield block.emit()
+    for gateInst in gateInsts:
+        if gateInst.measurement:
+            yield from close([b for b in openBlocks if set(gateInst.bits).intersection(b.bits)])
+            yield gateInst, None
+            continue
+        stats.gatesIn += 1
+        if len(gateInst.bits) <= 0:
+            # Global phase commutes with everything
+            stats.gatesOut += 1
+            yield gateInst, None
+            continue
+        bits = set(gateInst.bits)
+        overlap = [b for b in openBlocks if bits.intersection(b.bits)]
+        support = bits.union(*(b.bits for b in overlap))
+        if len(support) <= maxBits:
+            gateOp = findGateOp(gateInst.name, gateInst.args)
+            if overlap:
+                block = overlap[0]
+                for other in overlap[1:]:
+                    block.merge(other)
+                    openBlocks.remove(other)
+                block.apply(gateInst, gateOp)
+            else:
+                openBlocks.append(_Block(gateInst, gateOp))
+            continue
+        yield from close(overlap)
+        if len(bits) <= maxBits:
+            openBlocks.append(_Block(gateInst, findGateOp(gateInst.name, gateInst.args)))
+        else:
+            stats.gatesOut += 1
+            yield gateInst, None
+    yield from close(list(openBlocks))
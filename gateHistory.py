@@ -0,0 +1,221 @@
+''' Compact columnar storage of a circuit's gate history '''
+
+import collections
+import collections.abc
+import numpy as np
+
+from gate import GateInstance
+
+
+tailGates = 4096  # Appended gates held before moving them into the arrays
+
+class _Column:
+    ''' Growable numpy array '''
+    def __init__(self, dtype, capacity=16):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+    def _reserve(self, size):
+        if size > len(self.data) or not self.data.flags.writeable:
+            # Also copies read-only (memory mapped) data before writing
+            newData = np.empty(max(size, 2*len(self.data)), dtype=self.data.dtype)
+            newData[:self.size] = self.data[:self.size]
+            self.data = newData
+    def append(self, v):
+        self._reserve(self.size + 1)
+        self.data[self.size] = v
+        self.size += 1
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        self._reserve(self.size + len(values))
+        self.data[self.size:self.size+len(values)] = values
+        self.size += len(values)
+    @property
+    def array(self):
+        return self.data[:self.size]
+
+
+class GateHistory(collections.abc.Sequence):
+    ''' Sequence of GateInstances stored as arrays: an interned gate id per
+        instance and flat int32 bit and float64 argument arrays with offsets.
+        Gates with arguments that are not all floats (e.g. ints, complex
+        numbers or gate.Param) keep them separately, so every GateInstance
+        comes back equal to the one appended.  Appended gates are held in a
+        list and moved into the arrays in bulk.  GateInstances are created on
+        demand when indexed or iterated.
+
+        qubits: Indexable mapping bit indices to the bit objects put in the
+                created GateInstances (e.g. the QuantumCircuit), default ints
+    '''
+    def __init__(self, gateInsts=(), qubits=None):
+        self.qubits = qubits
+        self.gateTable = []  # (name, divergent, measurement) of each gate id
+        self._gateIds = {}
+        self._counts = collections.Counter()
+        self._ids = _Column(np.int32)
+        self._bitStart = _Column(np.int64)
+        self._bitStart.append(0)
+        self._bits = _Column(np.int32)
+        self._argStart = _Column(np.int64)
+        self._argStart.append(0)
+        self._args = _Column(np.float64)
+        self._objArgs = {}
+        self._tail = []  # GateInstances appended but not yet in the arrays
+        self.extend(gateInsts)
+
+    @classmethod
+    def fromColumns(cls, gateIds, bitStart, bits, argStart, args, gateTable, objArgs=None,
+                    qubits=None):
+        ''' Wrap existing column arrays (see columns()) without copying them.
+            Memory mapped arrays stay on disk until the history is appended to. '''
+        history = cls(qubits=qubits)
+        for name, divergent, measurement in gateTable:
+            history.gateId(name, divergent, measurement)
+        for column, data in zip((history._ids, history._bitStart, history._bits,
+                                 history._argStart, history._args),
+                                (gateIds, bitStart, bits, argStart, args)):
+            column.data = data
+            column.size = len(data)
+        history._objArgs = dict(objArgs or {})
+        idCounts = np.bincount(gateIds, minlength=len(history.gateTable))
+        for (name, _, _), count in zip(history.gateTable, idCounts):
+            history._counts[name] += int(count)
+        return history
+
+    def gateId(self, name, divergent=False, measurement=False):
+        ''' Interned id of a gate, adding it to gateTable if new '''
+        key = (name, bool(divergent), bool(measurement))
+        gateId = self._gateIds.get(key)
+        if gateId is None:
+            gateId = self._gateIds[key] = len(self.gateTable)
+            self.gateTable.append(key)
+        return gateId
+
+    def append(self, gateInst):
+        self._tail.append(gateInst)
+        if len(self._tail) >= tailGates:
+            self._compact()
+    def _compact(self):
+        ''' Move the appended gates into the arrays '''
+        if not self._tail:
+            return
+        tail, self._tail = self._tail, []
+        offset = self._ids.size
+        gateIds, bits, bitEnds, args, argEnds = [], [], [], [], []
+        for i, gateInst in enumerate(tail):
+            gateIds.append(self.gateId(gateInst.name, gateInst.divergent, gateInst.measurement))
+            bits.extend(gateInst.bits)
+            bitEnds.append(len(bits))
+            gateArgs = gateInst.args
+            if all(isinstance(a, float) for a in gateArgs):
+                args.extend(gateArgs)
+            else:
+                self._objArgs[offset + i] = tuple(gateArgs)
+            argEnds.append(len(args))
+        self._counts.update(gateInst.name for gateInst in tail)
+        self._ids.extend(gateIds)
+        self._bitStart.extend(np.asarray(bitEnds) + self._bits.size)
+        self._bits.extend(bits)
+        self._argStart.extend(np.asarray(argEnds) + self._args.size)
+        self._args.extend(args)
+    def extend(self, gateInsts):
+        for gateInst in gateInsts:
+            self.append(gateInst)
+        return self
+    def __iadd__(self, gateInsts):
+        return self.extend(gateInsts)
+    def extendArrays(self, gateIds, bitStart, bits, argStart=None, args=None, objArgs=None):
+        ''' Append gates given as columns without creating GateInstances.
+            gateIds index gateTable and the start arrays have one more entry
+            than gateIds, beginning at 0. '''
+        self._compact()
+        offset = len(self)
+        gateIds = np.asarray(gateIds, dtype=np.int32)
+        self._ids.extend(gateIds)
+        self._bitStart.extend(np.asarray(bitStart[1:]) + self._bits.size)
+        self._bits.extend(bits)
+        if argStart is None:
+            self._argStart.extend(np.full(len(gateIds), self._args.size))
+        else:
+            self._argStart.extend(np.asarray(argStart[1:]) + self._args.size)
+            self._args.extend(args)
+        for i, a in (objArgs or {}).items():
+            self._objArgs[offset + i] = a
+        idCounts = np.bincount(gateIds, minlength=len(self.gateTable))
+        for gateId, count in enumerate(idCounts):
+            if count:
+                self._counts[self.gateTable[gateId][0]] += int(count)
+
+    @property
+    def counts(self):
+        ''' Counter of the instances of each gate name '''
+        self._compact()
+        return self._counts
+    def countName(self, name):
+        ''' Number of instances of the gate name in O(1) '''
+        return self.counts[name]
+    def columns(self):
+        ''' Views of the (gateIds, bitStart, bits, argStart, args) arrays '''
+        self._compact()
+        return (self._ids.array, self._bitStart.array, self._bits.array,
+                self._argStart.array, self._args.array)
+
+    def columnRange(self, start, stop):
+        ''' Copies of the columns of history[start:stop] in the form taken by
+            extendArrays() '''
+        self._compact()
+        bitStart = self._bitStart.data[start:stop+1]
+        argStart = self._argStart.data[start:stop+1]
+        objArgs = {i-start: a for i, a in self._objArgs.items() if start <= i < stop}
+        return (self._ids.data[start:stop].copy(), bitStart - bitStart[0],
+                self._bits.data[bitStart[0]:bitStart[-1]].copy(), argStart - argStart[0],
+                self._args.data[argStart[0]:argStart[-1]].copy(), objArgs)
+
+    def __len__(self):
+        return self._ids.size + len(self._tail)
+    def _bitObjs(self, bits):
+        if self.qubits is None:
+            return tuple(bits)
+        return tuple(self.qubits[b] for b in bits)
+    def _instance(self, i, gateId, bits, args):
+        name, divergent, measurement = self.gateTable[gateId]
+        args = self._objArgs.get(i, args)
+        return GateInstance(name, args, self._bitObjs(bits), divergent, measurement)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.iterRange(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('history index out of range')
+        self._compact()
+        bitStart, argStart = self._bitStart.data, self._argStart.data
+        return self._instance(index, int(self._ids.data[index]),
+            self._bits.data[bitStart[index]:bitStart[index+1]].tolist(),
+            tuple(self._args.data[argStart[index]:argStart[index+1]].tolist()))
+    def measurementIndices(self):
+        ''' Array of the positions of all measurement gates '''
+        self._compact()
+        isMeasurement = np.array([m for _, _, m in self.gateTable] + [False])
+        return np.flatnonzero(isMeasurement[self._ids.array])
+    def __iter__(self):
+        return self.iterRange(0, len(self))
+    def iterRange(self, start, stop, step=1, blockSize=4096):
+        ''' Yield GateInstances converting the columns in blocks '''
+        self._compact()
+        if step != 1:
+            yield from (self[i] for i in range(start, stop, step))
+            return
+        for blockStart in range(start, stop, blockSize):
+            blockStop = min(stop, blockStart+blockSize)
+            ids = self._ids.data[blockStart:blockStop].tolist()
+            bitStart = self._bitStart.data[blockStart:blockStop+1]
+            argStart = self._argStart.data[blockStart:blockStop+1]
+            bits = self._bits.data[bitStart[0]:bitStart[-1]].tolist()
+            args = self._args.data[argStart[0]:argStart[-1]].tolist()
+            bitStart = (bitStart - bitStart[0]).tolist()
+            argStart = (argStart - argStart[0]).tolist()
+            for j, gateId in enumerate(ids):
+                yield self._instance(blockStart+j, gateId, bits[bitStart[j]:bitStart[j+1]],
+                                     tuple(args[argStart[j]:argStart[j+1]]))
+    def __repr__(self):
+        return 'GateHistory(len={}, gates={})'.format(len(self), dict(self.counts))
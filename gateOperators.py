@@ -4,45 +4,71 @@ import numpy as np
 from scipy import sparse
 
 
-complexDtype = np.complex
-intDtype = np.int
+complexDtype = np.complex128  # Default, see simulate(dtype=...) for other precisions
+intDtype = np.int_
 
+# Gate classification used by the simulator to pick a specialized kernel
+diagonalGates = {'P', 'I1', 'Z', 'S', 'Sd', 'T', 'Td', 'Rz', 'I2', 'CRz', 'I3', 'CCRz'}
+permutationGates = {'X', 'Y', 'CX', 'SWAP', 'CCX'}  # With a phase on each entry
 
-PGen = lambda theta: np.exp(1j*theta) * np.identity(1, dtype=complexDtype)
 
-I1 = np.identity(2, dtype=intDtype)
+_castCache = {}
+def castOp(name, op, dtype):
+    ''' Return the constant gate matrix op as dtype, cached per gate and dtype '''
+    dtype = np.dtype(dtype)
+    if op.dtype == dtype:
+        return op
+    key = (name, dtype)
+    if key not in _castCache:
+        _castCache[key] = op.astype(dtype)
+    return _castCache[key]
+
+def _genMatrix(rows):
+    ''' Build a gate matrix from rows of entries.  Entries may be arrays of
+        equal shape, giving a stack of matrices with the matrix axes last. '''
+    entries = np.broadcast_arrays(*(e for row in rows for e in row))
+    stack = np.stack(entries, axis=-1).astype(complexDtype)
+    return stack.reshape(entries[0].shape + (len(rows), len(rows[0])))
+def _genDiagonal(*diag):
+    return _genMatrix(tuple(tuple(d if i == j else 0 for j in range(len(diag)))
+                            for i, d in enumerate(diag)))
+
+
+PGen = lambda theta: _genMatrix(((np.exp(1j*theta),),))
+
+I1 = np.identity(2, dtype=complexDtype)
 X = np.array([[0,1j],[1j,0]], dtype=complexDtype)
 Y = np.array([[0,1],[-1,0]], dtype=complexDtype)
 Z = np.array([[-1j,0],[0,1j]], dtype=complexDtype)
-H = np.array([[1,1],[1,-1]], dtype=intDtype)
+H = np.array([[1,1],[1,-1]], dtype=complexDtype)
 S = np.array([[1,0],[0,1j]], dtype=complexDtype)
 Sd = np.array([[1,0],[0,-1j]], dtype=complexDtype)
 T = np.array([[1,0],[0,(1+1j)/np.sqrt(2)]], dtype=complexDtype)
 Td = np.array([[1,0],[0,(1-1j)/np.sqrt(2)]], dtype=complexDtype)
 
-RxGen = lambda theta: np.array([[np.cos(theta/2),1j*np.sin(theta/2)],
-                                [1j*np.sin(theta/2),np.cos(theta/2)]], dtype=complexDtype)
-RyGen = lambda theta: np.array([[np.cos(theta/2),np.sin(theta/2)],
-                                [-np.sin(theta/2),np.cos(theta/2)]], dtype=complexDtype)
-RzGen = lambda theta: np.array([[np.exp(-0.5j*theta),0],
-                                [0,np.exp(0.5j*theta)]], dtype=complexDtype)
-
-CRzGen = lambda theta: np.array([[1,0,0,0],
-                                 [0,1,0,0],
-                                 [0,0,1,0],
-                                 [0,0,0,np.exp(1j*theta)]], dtype=complexDtype)
-CCRzGen = lambda theta: np.array([[1,0,0,0,0,0,0,0],
-                                  [0,1,0,0,0,0,0,0],
-                                  [0,0,1,0,0,0,0,0],
-                                  [0,0,0,1,0,0,0,0],
-                                  [0,0,0,0,1,0,0,0],
-                                  [0,0,0,0,0,1,0,0],
-                                  [0,0,0,0,0,0,1,0],
-                                  [0,0,0,0,0,0,0,np.exp(1j*theta)]], dtype=complexDtype)
-
-I2 = np.identity(4, dtype=intDtype)
-CX = np.array([[1,0,0,0],[0,1,0,0],[0,0,0,1],[0,0,1,0]], dtype=intDtype)
-SWAP = np.array([[1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]], dtype=intDtype)
+# Generators accept scalar or array angles (arrays give a stack of matrices)
+RxGen = lambda theta: _genMatrix(((np.cos(theta/2),1j*np.sin(theta/2)),
+                                  (1j*np.sin(theta/2),np.cos(theta/2))))
+RyGen = lambda theta: _genMatrix(((np.cos(theta/2),np.sin(theta/2)),
+                                  (-np.sin(theta/2),np.cos(theta/2))))
+RzGen = lambda theta: _genDiagonal(np.exp(-0.5j*theta), np.exp(0.5j*theta))
+
+CRzGen = lambda theta: _genDiagonal(1, 1, 1, np.exp(1j*theta))
+CCRzGen = lambda theta: _genDiagonal(1, 1, 1, 1, 1, 1, 1, np.exp(1j*theta))
+
+# Derivatives of the generators with respect to theta (see gradient.py)
+PDGen = lambda theta: _genMatrix(((1j*np.exp(1j*theta),),))
+RxDGen = lambda theta: _genMatrix(((-0.5*np.sin(theta/2),0.5j*np.cos(theta/2)),
+                                   (0.5j*np.cos(theta/2),-0.5*np.sin(theta/2))))
+RyDGen = lambda theta: _genMatrix(((-0.5*np.sin(theta/2),0.5*np.cos(theta/2)),
+                                   (-0.5*np.cos(theta/2),-0.5*np.sin(theta/2))))
+RzDGen = lambda theta: _genDiagonal(-0.5j*np.exp(-0.5j*theta), 0.5j*np.exp(0.5j*theta))
+CRzDGen = lambda theta: _genDiagonal(0, 0, 0, 1j*np.exp(1j*theta))
+CCRzDGen = lambda theta: _genDiagonal(0, 0, 0, 0, 0, 0, 0, 1j*np.exp(1j*theta))
+
+I2 = np.identity(4, dtype=complexDtype)
+CX = np.array([[1,0,0,0],[0,1,0,0],[0,0,0,1],[0,0,1,0]], dtype=complexDtype)
+SWAP = np.array([[1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]], dtype=complexDtype)
 
 CCX = np.array([[1,0,0,0,0,0,0,0],
                 [0,1,0,0,0,0,0,0],
@@ -51,5 +77,5 @@ CCX = np.array([[1,0,0,0,0,0,0,0],
                 [0,0,0,0,1,0,0,0],
                 [0,0,0,0,0,1,0,0],
                 [0,0,0,0,0,0,0,1],
-                [0,0,0,0,0,0,1,0]], dtype=intDtype)
+                [0,0,0,0,0,0,1,0]], dtype=complexDtype)
 
@@ -0,0 +1,123 @@
+'''
+Adjoint differentiation of expectation values with respect to circuit Params
+
+One forward simulation gives psi and lambda = O psi for the observable O.  A
+backward sweep through the history then un-applies each gate from psi with its
+inverse and from lambda with its adjoint.  At a gate with Param arguments the
+derivative is the overlap of lambda with the derivative gate (see the DGen
+generators in gateOperators) applied to psi.  The gradient of any number of
+Params costs about three simulations and holds two state vectors.
+
+Example:
+```
+    from gate import *
+    from gradient import adjointGradient
+
+    theta = [Param('t{}'.format(i)) for i in range(n)]
+    ...
+    Ry(theta[i])(reg[i])
+    ...
+    terms = [(1.0, 'Z'*n)]
+    value, grad = adjointGradient(circuit, values, terms)
+```
+'''
+
+import numpy as np
+
+import gate
+from gate import Param
+import gateOperators
+from fullStateUtil import *
+from observable import applyPauliSum
+from simFullState import (SimulationError, classifyGateOp, createResult, findGateOp,
+                          findInstKernel, applyKernel)
+from sweep import circuitParams
+import util
+
+
+def _bindValues(circuit, values):
+    ''' Return the circuit Params and a dict of their values '''
+    params = circuitParams(circuit)
+    if isinstance(values, dict):
+        values = {Param(k) if not isinstance(k, Param) else k: float(v)
+                  for k, v in values.items()}
+    else:
+        values = np.asarray(values, dtype=float)
+        if values.shape != (len(params),):
+            raise SimulationError('Expected {} parameter values'.format(len(params)))
+        values = dict(zip(params, values))
+    return params, values
+
+def _bindArgs(gateInst, values):
+    try:
+        return tuple(values[arg] if isinstance(arg, Param) else arg for arg in gateInst.args)
+    except KeyError as e:
+        raise SimulationError('No value given for parameter {}'.format(e.args[0])) from None
+
+def _inverseOp(gateOp):
+    ''' Inverse of a gate that is unitary up to scale, such as H '''
+    adjoint = gateOp.conj().T
+    return adjoint / np.vdot(gateOp[:, 0], gateOp[:, 0]).real
+
+def _derivativeOverlap(lamConj, shapedPsi, dOp, axes):
+    ''' Sum over b of lamConj[b] * (dOp psi)[b] without building dOp psi.
+        Each nonzero entry of dOp pairs one slice of lamConj with one of
+        psi. '''
+    n, k = shapedPsi.ndim, len(axes)
+    free = list(range(n - k))
+    total = 0
+    for j, l in zip(*np.nonzero(dOp)):
+        a = lamConj[axesIndex(n, axes, util.toTupleBE(int(j), k))]
+        b = shapedPsi[axesIndex(n, axes, util.toTupleBE(int(l), k))]
+        total += dOp[j, l] * np.einsum(a, free, b, free, [])
+    return total
+
+def adjointGradient(circuit, values, terms, dtype=None):
+    ''' Return (value, gradient) of the expectation of the observable terms
+        (a weighted sum of Pauli strings, see observable.pauliExpectations())
+        in the final state of the circuit.
+
+        values: dict mapping each Param (or its name) to its value or a
+                sequence in the order of sweep.circuitParams(circuit)
+        gradient: Derivative with respect to each Param in the order of
+                  sweep.circuitParams(circuit).  A Param used by several gates
+                  sums their contributions.
+
+        Measurement gates are ignored.  Gates with Param arguments must be
+        unitary, which the rotation gates are.
+    '''
+    params, values = _bindValues(circuit, values)
+    paramIndex = {p: i for i, p in enumerate(params)}
+    n = circuit.n
+    gateInsts = [g for g in circuit.history if not g.instanceOf(gate.M)]
+    result = createResult(n, engine='tensor', dtype=dtype)
+    for gateInst in gateInsts:
+        gateInst = gateInst._replace(args=_bindArgs(gateInst, values))
+        _, kernel = findInstKernel(gateInst, dtype=result.dtype)
+        result._applyKernel(kernel, gateInst.bits)
+    psi = result.psi
+    shapedPsi = psi.reshape((2,)*n)
+    lamConj = applyPauliSum(psi, terms)
+    np.conjugate(lamConj, out=lamConj)
+    shapedLam = lamConj.reshape((2,)*n)
+    norm = np.vdot(psi, psi).real
+    value = np.dot(lamConj, psi).real / norm
+
+    gradient = np.zeros(len(params))
+    for gateInst in reversed(gateInsts):
+        args = _bindArgs(gateInst, values)
+        gateOp = findGateOp(gateInst.name, args, result.dtype)
+        axes = tuple(b.__index__() for b in gateInst.bits)
+        applyKernel(shapedPsi, classifyGateOp(_inverseOp(gateOp)), axes)
+        for arg in gateInst.args:
+            if isinstance(arg, Param):
+                try:
+                    dOp = getattr(gateOperators, gateInst.name+'DGen')(*args)
+                except AttributeError:
+                    raise SimulationError('No derivative of gate \'{}\''.format(
+                                          gateInst.name)) from None
+                overlap = _derivativeOverlap(shapedLam, shapedPsi, dOp, axes)
+                gradient[paramIndex[arg]] += 2 * overlap.real / norm
+        # lambda moves back by the adjoint, so its conjugate by the transpose
+        applyKernel(shapedLam, classifyGateOp(np.ascontiguousarray(gateOp.T)), axes)
+    return value, gradient
@@ -0,0 +1,167 @@
+'''
+Qubit liveness analysis and remapping of circuits onto fewer qubits
+
+An ancilla returned with QuantumCircuit.returnAncilla() is back in state 0
+after its last gate so its qubit can host any qubit whose first gate comes
+later.  remapCircuit() assigns the qubits to as few physical qubits as the
+overlap of their live ranges allows.
+
+Example:
+```
+    from liveness import RemapStats, remapCircuit
+    from simFullState import simulate
+
+    stats = RemapStats()
+    remapped = remapCircuit(circuit, stats=stats)
+    print(stats)  # Width and memory saved
+    result = simulate(remapped)
+```
+'''
+
+import heapq
+import numpy as np
+
+from circuit import QuantumCircuit
+import gate
+from gateHistory import GateHistory
+from simFullState import findMeasureOrder
+from fullStateUtil import stateDtype
+
+
+class RemapStats:
+    def __init__(self):
+        self.n = 0
+        self.width = 0
+        self.qubitMap = None  # Physical qubit of each qubit, -1 if unused
+    @property
+    def widthSaved(self):
+        return self.n - self.width
+    def stateBytes(self, dtype=stateDtype):
+        ''' Full state vector size (before, after) remapping '''
+        itemsize = np.dtype(dtype).itemsize
+        return itemsize * 2**self.n, itemsize * 2**self.width
+    def __repr__(self):
+        before, after = self.stateBytes()
+        return 'RemapStats(n={}, width={}, stateBytes={} -> {})'.format(
+            self.n, self.width, before, after)
+
+
+def liveRanges(history, n, stop=None, returns=()):
+    ''' Find the live range of each qubit in history[:stop].  The uses of an
+        ancilla are split into separate ranges where it was returned.
+
+        returns: (history position, bit) of each returned ancilla, see
+                 QuantumCircuit.ancillaReturns
+        Returns (rangeOf, first, last, released): the index of the range of
+        each bit in the history bits column and, for each range, the first and
+        last gate and whether the qubit is returned after it.  The ranges of
+        qubit q are numbered from offset q*(r+1) where r is the most returns
+        of any qubit.
+    '''
+    if not isinstance(history, GateHistory):
+        history = GateHistory(history)
+    stop = len(history) if stop is None else stop
+    gateIds, bitStart, bits, _, _ = history.columns()
+    bits = bits[:bitStart[stop]].astype(np.int64)
+    gateOfBit = np.repeat(np.arange(stop), np.diff(bitStart[:stop+1]))
+    returnsOf = [[] for _ in range(n)]
+    for position, b in returns:
+        returnsOf[b].append(position)
+    segments = max(map(len, returnsOf), default=0) + 1
+    rangeOf = bits * segments
+    for b, positions in enumerate(returnsOf):
+        if positions:
+            isB = bits == b
+            rangeOf[isB] += np.searchsorted(sorted(positions), gateOfBit[isB], side='right')
+    first = np.full(n*segments, stop, dtype=np.int64)
+    last = np.full(n*segments, -1, dtype=np.int64)
+    np.minimum.at(first, rangeOf, gateOfBit)
+    np.maximum.at(last, rangeOf, gateOfBit)
+    first[last < 0] = -1
+    released = np.zeros(n*segments, dtype=bool)
+    for b, positions in enumerate(returnsOf):
+        released[b*segments:b*segments+len(positions)] = True
+    return rangeOf, first, last, released
+
+def allocateQubits(first, last, released):
+    ''' Assign live ranges [first, last] to physical qubits.  A physical qubit
+        is free again after a released range.  The lowest free physical qubit
+        is always taken, which needs the fewest qubits.  Returns the physical
+        qubit of each range (-1 if unused) and the number of physical qubits. '''
+    physicalOf = np.full(len(first), -1, dtype=np.int64)
+    events = sorted((int(f), i) for i, f in enumerate(first) if f >= 0)
+    live = []  # (last gate, physical qubit) of released ranges
+    free = []
+    width = 0
+    for start, i in events:
+        while live and live[0][0] < start:
+            heapq.heappush(free, heapq.heappop(live)[1])
+        if free:
+            physical = heapq.heappop(free)
+        else:
+            physical = width
+            width += 1
+        physicalOf[i] = physical
+        if released[i]:
+            heapq.heappush(live, (int(last[i]), physical))
+    return physicalOf, width
+
+def keepIndices(physicalOf, segments, width):
+    ''' Relabel the physical qubits of allocateQubits() so each qubit's first
+        live range stays on its own index where that is free.  A circuit that
+        needs every qubit is not permuted. '''
+    label = np.full(width, -1, dtype=np.int64)
+    taken = np.zeros(width, dtype=bool)
+    for q, p in enumerate(physicalOf[::segments].tolist()):
+        if p >= 0 and q < width and label[p] < 0 and not taken[q]:
+            label[p] = q
+            taken[q] = True
+    label[label < 0] = np.flatnonzero(~taken)
+    return np.where(physicalOf >= 0, label[physicalOf], -1)
+
+def remapCircuit(circuit, stats=None):
+    ''' Return an equivalent circuit on the fewest qubits found by
+        allocateQubits().  Qubits are reused after an ancilla is returned
+        (see QuantumCircuit.ancillaReturns), other qubits stay live to the
+        end.  Unused qubits are removed.  Qubits keep their index where
+        possible, see keepIndices().
+
+        If the circuit ends by measuring every qubit, the new circuit ends by
+        measuring every physical qubit: first those of the qubits that are
+        not returned ancillas in the original order, then the rest, which
+        read 0.
+    '''
+    if stats is None:
+        stats = RemapStats()
+    n = circuit.n
+    history = circuit.history
+    if not isinstance(history, GateHistory):
+        history = GateHistory(history)
+    measureOrder = findMeasureOrder(history, n, circuit.countM())
+    stop = len(history) - (n if measureOrder is not None else 0)
+    returns = [(p, b) for p, b in getattr(circuit, 'ancillaReturns', ()) if p <= stop]
+    rangeOf, first, last, released = liveRanges(history, n, stop, returns)
+    segments = len(first) // n if n else 1
+    # Qubits only measured at the end are still part of the output
+    if measureOrder is not None:
+        for b in measureOrder:
+            i = int(b) * segments
+            if first[i] < 0 and not released[i]:
+                first[i] = last[i] = stop
+    physicalOf, width = allocateQubits(first, last, released)
+    physicalOf = keepIndices(physicalOf, segments, width)
+    lastRange = np.arange(n)*segments + released.reshape(n, segments).sum(axis=1)
+    qubitMap = physicalOf[lastRange]  # Physical qubit at the end of the circuit
+
+    remapped = QuantumCircuit(width)
+    gateIds, bitStart, _, argStart, args, objArgs = history.columnRange(0, stop)
+    idMap = np.array([remapped.history.gateId(*key) for key in history.gateTable],
+                     dtype=np.int32)
+    remapped.history.extendArrays(idMap[gateIds], bitStart, physicalOf[rangeOf], argStart,
+                                  args, objArgs)
+    if measureOrder is not None:
+        measured = [int(qubitMap[b]) for b in measureOrder if qubitMap[b] >= 0]
+        measured += sorted(set(range(width)).difference(measured))
+        gate.M(tuple(remapped[p] for p in measured))
+    stats.n, stats.width, stats.qubitMap = n, width, qubitMap
+    return remapped
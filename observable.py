@@ -0,0 +1,170 @@
+'''
+Expectation values of weighted Pauli strings on a full state vector
+
+A Pauli string maps basis state b to i**nY (-1)**(b.z) |b^x> where x marks its
+X and Y qubits and z its Z and Y qubits.  The expectation is therefore a sum
+over psi[b^x].conj() * psi[b] with signs from the parity of b on the z qubits.
+Terms with the same x share one pass over the state: the products are reduced
+to their marginal over the z qubits of all the terms, and a Walsh-Hadamard
+transform of that small array gives the signed sums of every term at once.
+psi[b^x] is read through a flipped view, so no state is copied and no matrix
+is built.
+
+Example:
+```
+    from observable import pauliExpectations
+
+    terms = [(0.5, 'ZZI'), (0.5, 'IZZ'), (-1.0, 'XXX'), (0.2, {1: 'Y'})]
+    values = pauliExpectations(result.psi, terms)  # Coefficient times <P>
+    energy = values.sum()
+```
+'''
+
+import numpy as np
+
+from fullStateUtil import axesIndex, marginalProbs
+from simFullState import SimulationError
+
+
+maxMarginalBits = 20  # Largest marginal array shared by the terms of one pass
+defaultChunkBits = 20  # Amplitudes multiplied at once, 2**chunkBits
+
+
+def pauliAxes(pauli, n):
+    ''' Return (xAxes, zAxes, nY) of a Pauli string.
+
+        pauli: String of 'I', 'X', 'Y', 'Z' for qubits 0..n-1 or a dict
+               {qubit: letter} of its non-identity qubits
+    '''
+    if isinstance(pauli, str):
+        if len(pauli) != n:
+            raise SimulationError('Pauli string \'{}\' is not {} qubits long'.format(pauli, n))
+        pauli = dict(enumerate(pauli))
+    xAxes, zAxes, nY = [], [], 0
+    for q, letter in sorted((int(q), letter) for q, letter in pauli.items()):
+        if letter not in 'IXYZ' or not 0 <= q < n:
+            raise SimulationError('Invalid Pauli {} on qubit {}'.format(letter, q))
+        if letter in 'XY':
+            xAxes.append(q)
+        if letter in 'YZ':
+            zAxes.append(q)
+        nY += letter == 'Y'
+    return tuple(xAxes), tuple(zAxes), nY
+
+def parseTerms(terms, n):
+    ''' Return a list of (coefficient, xAxes, zAxes, nY) of the terms, see
+        pauliExpectations() '''
+    out = []
+    for term in terms:
+        coef, pauli = (1.0, term) if isinstance(term, (str, dict)) else term
+        out.append((coef, *pauliAxes(pauli, n)))
+    return out
+
+def _passes(termIs, zAxesOf):
+    ''' Split the terms of one x group into lists sharing a marginal of at
+        most maxMarginalBits qubits.  A term on more qubits gets its own. '''
+    passes = []
+    union = set()
+    for i in sorted(termIs, key=lambda i: zAxesOf[i]):
+        z = set(zAxesOf[i])
+        if passes and len(union | z) <= maxMarginalBits:
+            passes[-1].append(i)
+            union |= z
+        else:
+            passes.append([i])
+            union = z
+    return passes
+
+def _paritySum(w, axes):
+    ''' Sum of w, shaped (2,)*k, with sign (-1)**(parity of the given axes) '''
+    for a in sorted(axes, reverse=True):
+        w = w.take(0, axis=a) - w.take(1, axis=a)
+    return np.sum(w)
+
+def _walshHadamard(a):
+    ''' Return h[m] = sum over b of a[b] (-1)**popcount(b & m) for an array of
+        2**k entries '''
+    k = len(a).bit_length() - 1
+    for j in range(k):
+        pairs = a.reshape(2**j, 2, -1)
+        a = np.stack((pairs[:, 0] + pairs[:, 1], pairs[:, 0] - pairs[:, 1]), axis=1)
+    return a.reshape(-1)
+
+def pauliExpectations(psi, terms, chunkBits=defaultChunkBits):
+    ''' Return coefficient times <psi|P|psi>/<psi|psi> of each term as a float
+        array.
+
+        terms: Pauli strings (see pauliAxes()) or (coefficient, Pauli string)
+               pairs
+        chunkBits: The products of 2**chunkBits amplitudes are held at once
+    '''
+    n = len(psi).bit_length() - 1
+    terms = parseTerms(terms, n)
+    chunkBits = min(n, chunkBits)
+    t = n - chunkBits
+    blocks = psi.reshape(2**t, 2**chunkBits)
+    shape = (2,)*chunkBits
+    norm = np.vdot(psi, psi).real
+    w = np.empty(shape, dtype=psi.dtype)
+    groups = {}
+    for i, (_, xAxes, _, _) in enumerate(terms):
+        groups.setdefault(xAxes, []).append(i)
+    zAxesOf = [zAxes for _, _, zAxes, _ in terms]
+    values = np.zeros(len(terms), dtype=complex)
+    for xAxes, termIs in groups.items():
+        xTop = sum(1 << (t-1-q) for q in xAxes if q < t)
+        xLow = tuple(q - t for q in xAxes if q >= t)
+        for passTerms in _passes(termIs, zAxesOf):
+            union = sorted(set().union(*(zAxesOf[i] for i in passTerms)))
+            topPos = [j for j, q in enumerate(union) if q < t]
+            low = [q - t for q in union if q >= t]
+            marginal = len(union) <= maxMarginalBits
+            acc = np.zeros((2,)*len(union) if marginal else (), dtype=complex)
+            for c in range(2**t):
+                partner = np.flip(blocks[c ^ xTop].reshape(shape), axis=xLow)
+                np.conjugate(partner, out=w)
+                w *= blocks[c].reshape(shape)
+                topVals = [(c >> (t-1-union[j])) & 1 for j in topPos]
+                if marginal:
+                    acc[axesIndex(len(union), topPos, topVals)] += marginalProbs(
+                        w.reshape(-1), low).reshape((2,)*len(low))
+                else:
+                    acc += (-1)**sum(topVals) * _paritySum(w, low)
+            if marginal:
+                # Every signed sum of the marginal at once
+                acc = _walshHadamard(acc.reshape(-1))
+            for i in passTerms:
+                if marginal:
+                    total = acc[sum(1 << (len(union)-1-union.index(q)) for q in zAxesOf[i])]
+                else:
+                    total = acc
+                values[i] = 1j**terms[i][3] * total
+    coefs = np.array([coef for coef, _, _, _ in terms], dtype=float)
+    return coefs * values.real / norm
+
+def applyPauliSum(psi, terms, chunkBits=defaultChunkBits):
+    ''' Return the sum of coefficient times P|psi> over the terms as a new
+        state.  (P psi)[b] is (-i)**nY (-1)**(b.z) psi[b^x].  Besides the
+        result only 2**chunkBits amplitudes are held at once. '''
+    n = len(psi).bit_length() - 1
+    chunkBits = min(n, chunkBits)
+    t = n - chunkBits
+    blocks = psi.reshape(2**t, 2**chunkBits)
+    shape = (2,)*chunkBits
+    out = np.zeros_like(psi)
+    outBlocks = out.reshape(2**t, 2**chunkBits)
+    term = np.empty(shape, dtype=psi.dtype)
+    for coef, xAxes, zAxes, nY in parseTerms(terms, n):
+        xTop = sum(1 << (t-1-q) for q in xAxes if q < t)
+        xLow = tuple(q - t for q in xAxes if q >= t)
+        zTop = sum(1 << (t-1-q) for q in zAxes if q < t)
+        zLow = [q - t for q in zAxes if q >= t]
+        scale = coef * (-1j)**nY
+        for c in range(2**t):
+            sign = -1 if bin(c & zTop).count('1') % 2 else 1
+            np.multiply(np.flip(blocks[c ^ xTop].reshape(shape), axis=xLow), sign * scale,
+                        out=term)
+            for q in zLow:
+                term[axesIndex(chunkBits, (q,), (1,))] *= -1
+            outBlocks[c] += term.reshape(-1)
+    return out
@@ -0,0 +1,184 @@
+'''
+Peephole optimization of circuit histories
+
+Cancels adjacent inverse gates (e.g. H H, CX CX, S Sd), merges adjacent
+rotations on the same qubits and drops rotations by a multiple of 2 pi.  Gates
+are adjacent if no gate between them acts on their qubits.  Measurements and
+ancilla returns are barriers: gates never combine across them.  The optimized
+circuit is equivalent up to a global phase and scale, like the gate matrices
+in gateOperators themselves.
+
+Example:
+```
+    from optimize import OptimizeStats, optimizeCircuit, checkEquivalence
+
+    stats = OptimizeStats()
+    optimized = optimizeCircuit(circuit, stats=stats)
+    print(stats)
+    assert checkEquivalence(circuit, optimized)
+```
+'''
+
+import bisect
+import collections
+import copy
+import numbers
+import numpy as np
+
+from gateHistory import GateHistory
+from simFullState import simulate
+import util
+
+
+identityGates = {'I1', 'I2', 'I3'}
+selfInverseGates = {'H', 'X', 'Y', 'Z', 'CX', 'CY', 'CZ', 'SWAP', 'CCX', 'CSWAP'}
+inverseGates = {'S': 'Sd', 'Sd': 'S', 'T': 'Td', 'Td': 'T',
+                'CS': 'CSd', 'CSd': 'CS', 'CT': 'CTd', 'CTd': 'CT'}
+rotationGates = {'P', 'Rx', 'Ry', 'Rz', 'CRz', 'CCRz'}  # Angles add when merged
+symmetricGates = {'SWAP', 'CZ', 'CS', 'CSd', 'CT', 'CTd', 'CRz', 'CCRz'}  # Any bit order
+
+
+class OptimizeStats:
+    def __init__(self):
+        self.before = collections.Counter()
+        self.after = collections.Counter()
+        self.cancelled = 0
+        self.merged = 0
+        self.dropped = 0
+    @property
+    def gatesIn(self):
+        return sum(self.before.values())
+    @property
+    def gatesOut(self):
+        return sum(self.after.values())
+    def report(self):
+        ''' Table of the count of each gate before and after optimizing '''
+        lines = ['{:<8} {:>10} {:>10}'.format('gate', 'before', 'after')]
+        for name in sorted(self.before):
+            lines.append('{:<8} {:>10} {:>10}'.format(name, self.before[name], self.after[name]))
+        lines.append('{:<8} {:>10} {:>10}'.format('total', self.gatesIn, self.gatesOut))
+        return '\n'.join(lines)
+    def __repr__(self):
+        return ('OptimizeStats(gatesIn={}, gatesOut={}, cancelled={}, merged={}, '
+                'dropped={})').format(self.gatesIn, self.gatesOut, self.cancelled,
+                                      self.merged, self.dropped)
+
+
+def _sameBits(name, bitsA, bitsB):
+    if name in symmetricGates:
+        return sorted(bitsA) == sorted(bitsB)
+    if name == 'CCX':
+        return sorted(bitsA[:2]) == sorted(bitsB[:2]) and bitsA[2] == bitsB[2]
+    return tuple(bitsA) == tuple(bitsB)
+
+def _isAngle(gateInst):
+    return (gateInst.name in rotationGates and len(gateInst.args) == 1
+            and isinstance(gateInst.args[0], numbers.Real))
+
+def _cancels(a, b):
+    if a.args or b.args:
+        return False
+    if not (a.name == b.name and a.name in selfInverseGates
+            or inverseGates.get(a.name) == b.name):
+        return False
+    return _sameBits(a.name, a.bits, b.bits)
+
+def _merge(a, b):
+    ''' The single rotation equal to a followed by b or None '''
+    if a.name != b.name or not (_isAngle(a) and _isAngle(b)):
+        return None
+    if not _sameBits(a.name, a.bits, b.bits):
+        return None
+    return a._replace(args=(util.normRad(float(a.args[0]) + float(b.args[0])),))
+
+def optimizeGates(gateInsts, stats=None, barriers=None, origins=None):
+    ''' Return the optimized list of GateInstances
+
+        barriers: Dict {position: bits} of places in gateInsts no gate on
+                  those bits may combine across (e.g. ancilla returns)
+        origins: If a list, it is filled with the position in gateInsts of
+                 each returned gate
+    '''
+    if stats is None:
+        stats = OptimizeStats()
+    barriers = barriers or {}
+    out = []  # Removed gates become None
+    outOrigins = []
+    lastOn = collections.defaultdict(list)  # Stack of the indices in out acting on each qubit
+    lastPhase = None
+    for i, gateInst in enumerate(gateInsts):
+        for b in barriers.get(i, ()):
+            lastOn[b] = []
+        stats.before[gateInst.name] += 1
+        if gateInst.name in identityGates or (_isAngle(gateInst)
+                                              and util.nearZeroRad(gateInst.args[0])):
+            stats.dropped += 1
+            continue
+        bits = tuple(b.__index__() for b in gateInst.bits)
+        if bits:
+            prev = {lastOn[b][-1] if lastOn[b] else None for b in bits}
+            prev = prev.pop() if len(prev) == 1 else None
+            if prev is not None and len(out[prev].bits) != len(bits):
+                prev = None
+        else:
+            # Zero bit gates commute with everything
+            prev = lastPhase
+        if prev is not None:
+            other = out[prev]
+            merged = _merge(other, gateInst)
+            if merged is not None:
+                stats.merged += 1
+                if not util.nearZeroRad(merged.args[0]):
+                    out[prev] = merged
+                    continue
+                stats.dropped += 1
+            elif _cancels(other, gateInst):
+                stats.cancelled += 2
+            else:
+                prev = None
+        if prev is not None:
+            # Remove the earlier gate, exposing the gates before it
+            out[prev] = None
+            for b in bits:
+                lastOn[b].pop()
+            if not bits:
+                lastPhase = None
+            continue
+        for b in bits:
+            lastOn[b].append(len(out))
+        if not bits:
+            lastPhase = len(out)
+        out.append(gateInst)
+        outOrigins.append(i)
+    if origins is not None:
+        origins[:] = [i for g, i in zip(out, outOrigins) if g is not None]
+    out = [g for g in out if g is not None]
+    stats.after.update(g.name for g in out)
+    return out
+
+def optimizeCircuit(circuit, stats=None):
+    ''' Return a copy of the circuit with an optimized history.  The registers
+        are the same so bits of the original circuit can be used with it. '''
+    other = copy.copy(circuit)
+    other.regNames = dict(circuit.regNames)
+    other.nameGenList = list(circuit.nameGenList)
+    barriers = collections.defaultdict(list)
+    for position, bit in circuit.ancillaReturns:
+        barriers[position].append(bit)
+    origins = []
+    other.history = GateHistory(optimizeGates(circuit.history, stats=stats, barriers=barriers,
+                                              origins=origins), qubits=other)
+    other.ancillaReturns = [(bisect.bisect_left(origins, position), bit)
+                            for position, bit in circuit.ancillaReturns]
+    return other
+
+def checkEquivalence(circuitA, circuitB, atol=1e-8, **simulateArgs):
+    ''' Return whether the circuits produce the same state up to a global phase
+        and scale.  Measurement gates are ignored. '''
+    if circuitA.n != circuitB.n:
+        return False
+    psiA = simulate(circuitA, ignoreMGates=True, **simulateArgs).psi
+    psiB = simulate(circuitB, ignoreMGates=True, **simulateArgs).psi
+    psiA = psiA / np.linalg.norm(psiA)
+    psiB = psiB / np.linalg.norm(psiB)
+    return bool(abs(abs(np.vdot(psiA, psiB)) - 1) <= atol)
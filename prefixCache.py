@@ -0,0 +1,93 @@
+'''
+Memoization of simulated states for circuits that share a history prefix
+
+Example:
+```
+    from prefixCache import PrefixCache
+    from simFullState import simulate
+
+    cache = PrefixCache(maxBytes=2**30)
+    for oracle in oracles:
+        circuit = buildCircuit(statePrep, oracle)
+        result = simulate(circuit, cache=cache)  # Resumes after statePrep
+    print(cache)
+```
+'''
+
+from collections import OrderedDict
+import hashlib
+import itertools
+import numpy as np
+
+
+class PrefixCache:
+    ''' LRU cache of state vectors keyed by an incremental BLAKE2b digest of
+        the gate instances that produced them, so distinct prefixes do not
+        collide in practice.
+
+        maxBytes: Total size of the stored states.  The least recently used
+                  states are evicted to stay under it.
+        snapshotEvery: Also store the state every this many gates, not only
+                       at the end of the part of the history that is cached.
+    '''
+    def __init__(self, maxBytes=2**30, snapshotEvery=None):
+        self.maxBytes = maxBytes
+        self.snapshotEvery = snapshotEvery
+        self._states = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+    def __len__(self):
+        return len(self._states)
+    def __repr__(self):
+        return 'PrefixCache(states={}, nbytes={}, hits={}, misses={})'.format(
+            len(self), self.nbytes, self.hits, self.misses)
+    def clear(self):
+        self._states.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def _digest(previous, item):
+        return hashlib.blake2b(previous + repr(item).encode(), digest_size=32).digest()
+    @classmethod
+    def prefixHashes(cls, n, dtype, history, stop):
+        ''' Return the digest of every prefix history[:i] for i in 0..stop '''
+        h = cls._digest(b'', (n, np.dtype(dtype).str))
+        hashes = [h]
+        for g in itertools.islice(history, stop):
+            h = cls._digest(h, (g.name, g.args, tuple(int(b) for b in g.bits)))
+            hashes.append(h)
+        return hashes
+    def longestPrefix(self, hashes):
+        ''' Return (length, psi) for the longest cached prefix or (0, None).
+            The returned psi must not be modified. '''
+        for length in range(len(hashes)-1, 0, -1):
+            key = (length, hashes[length])
+            if key in self._states:
+                self._states.move_to_end(key)
+                self.hits += 1
+                return length, self._states[key]
+        self.misses += 1
+        return 0, None
+    def store(self, hashes, length, psi):
+        ''' Store a copy of the state after the first length gates '''
+        key = (length, hashes[length])
+        if key in self._states:
+            self._states.move_to_end(key)
+            return
+        if psi.nbytes > self.maxBytes:
+            return
+        while self.nbytes + psi.nbytes > self.maxBytes:
+            _, old = self._states.popitem(last=False)
+            self.nbytes -= old.nbytes
+        self._states[key] = np.array(psi)
+        self.nbytes += psi.nbytes
+    def snapshotPoints(self, start, stop):
+        ''' Prefix lengths after start to store, always including stop '''
+        points = []
+        if self.snapshotEvery:
+            points = list(range((start // self.snapshotEvery + 1) * self.snapshotEvery,
+                                stop, self.snapshotEvery))
+        if stop > start:
+            points.append(stop)
+        return points
@@ -0,0 +1,213 @@
+'''
+Cache-blocked full state simulation
+
+Gates are queued and scheduled in windows.  Gates on the low order qubits (the
+last blockBits axes of psi), moved ahead of earlier gates they share no qubits
+with, are applied as a batch to one cache-sized block of psi after another, so
+the batch streams the state through memory once instead of once per gate.  When
+a gate needs high order qubits the axes of psi are relabeled with one transpose
+so that the qubits used soonest become low order, if enough gates then batch.
+Otherwise the gate is applied to the whole state directly.  psi is back in
+qubit order after every flush.
+
+Example:
+```
+    from simFullState import simulate
+
+    result = simulate(circuit, engine='blocked', blockBits=14, batchGates=64)
+    print(result.blockStats)  # Passes over the state saved
+```
+'''
+
+import numpy as np
+
+from simFullState import Result, applyKernel
+
+
+class BlockStats:
+    def __init__(self):
+        self.gatesIn = 0
+        self.batches = 0  # Passes applying a batch of low order gates block by block
+        self.blockedGates = 0
+        self.directGates = 0
+        self.relabels = 0
+    @property
+    def statePasses(self):
+        ''' Number of passes over the whole state '''
+        return self.batches + self.directGates + self.relabels
+    @property
+    def passesSaved(self):
+        return self.gatesIn - self.statePasses
+    def trafficBytes(self, stateBytes):
+        ''' Bytes read and written (unblocked, blocked) '''
+        return 2 * stateBytes * self.gatesIn, 2 * stateBytes * self.statePasses
+    def __repr__(self):
+        return ('BlockStats(gatesIn={}, batches={}, blockedGates={}, directGates={}, '
+                'relabels={}, passesSaved={})').format(
+                    self.gatesIn, self.batches, self.blockedGates, self.directGates,
+                    self.relabels, self.passesSaved)
+
+
+class BlockedResult(Result):
+    ''' Result applying batches of low order gates block by block.
+
+        blockBits: Blocks are 2**blockBits amplitudes, which should fit in
+                   the CPU cache (default 2**14 complex128 is 256 KiB)
+        batchGates: Most gates applied per pass over the blocks
+        windowGates: Gates queued before scheduling.  The window is also the
+                     lookahead for choosing qubits to relabel.
+        minRelabelGain: Relabel when the first batch after it would have at
+                        least this many gates
+    '''
+    def __init__(self, n, blockBits=14, batchGates=64, windowGates=256, minRelabelGain=2,
+                 seed=None, workers=None, dtype=None):
+        self.maxBlockBits = blockBits
+        self.batchGates = batchGates
+        self.windowGates = windowGates
+        self.minRelabelGain = minRelabelGain
+        self.blockStats = BlockStats()
+        super().__init__(n, engine='blocked', seed=seed, workers=workers, dtype=dtype)
+    def _createState(self, n):
+        self._pending = []  # (kernel, qubits) not yet applied
+        self._setLayout(n)
+        self._spare = None  # Buffer reused by relabeling
+        return super()._createState(n)
+    def _setLayout(self, n):
+        self.blockBits = min(self.maxBlockBits, n)
+        self.axisOf = list(range(n))  # Axis of psi holding each qubit
+    def copy(self):
+        self._flush()
+        other = super().copy()
+        other._pending = []
+        other._spare = None
+        other.axisOf = list(self.axisOf)
+        return other
+    def __repr__(self):
+        return 'BlockedState(n={}, blockBits={})'.format(self.n, self.blockBits)
+    def _resize(self, n):
+        self._flush()
+        super()._resize(n)
+        self._setLayout(n)
+
+    def _applyKernel(self, kernel, bitIList):
+        self._probs = None
+        self._pending.append((kernel, tuple(int(b) for b in bitIList)))
+        self.blockStats.gatesIn += 1
+        if len(self._pending) >= self.windowGates:
+            self._schedule()
+    def _flush(self):
+        ''' Apply the queued gates and put psi back in qubit order '''
+        self._schedule()
+        if self.axisOf != list(range(self.n)):
+            self._transpose(self.axisOf)
+            self.axisOf = list(range(self.n))
+
+    def _isLow(self, qubits, axisOf=None):
+        lowStart = self.n - self.blockBits
+        axisOf = self.axisOf if axisOf is None else axisOf
+        return all(axisOf[q] >= lowStart for q in qubits)
+    def _takeBatch(self, gates, axisOf=None):
+        ''' Split gates into (batch, rest).  The batch has the gates on low
+            order qubits that commute past every earlier gate left in rest
+            because they share no qubits with it. '''
+        batch, rest = [], []
+        blocked = set()
+        for g in gates:
+            qubits = g[1]
+            if (len(batch) < self.batchGates and self._isLow(qubits, axisOf)
+                    and blocked.isdisjoint(qubits)):
+                batch.append(g)
+            else:
+                rest.append(g)
+                blocked.update(qubits)
+        return batch, rest
+    def _schedule(self):
+        ''' Apply the queued gates in batches, relabeling or applying gates on
+            high order qubits directly '''
+        gates, self._pending = self._pending, []
+        while gates:
+            batch, rest = self._takeBatch(gates)
+            if batch:
+                self._applyBatch(batch)
+                gates = rest
+                continue
+            axisOf = self._chooseLayout(gates)
+            if axisOf is not None:
+                self._relabel(axisOf)
+                continue
+            kernel, qubits = gates.pop(0)
+            self._applyKernelTo(self.psi.reshape((2,)*self.n), kernel,
+                                tuple(self.axisOf[q] for q in qubits))
+            self.blockStats.directGates += 1
+
+    def _chooseLayout(self, gates):
+        ''' Return a new axisOf making the qubits of gates[0] and then those
+            used soonest low order, or None if it would not batch at least
+            minRelabelGain gates '''
+        qubits = gates[0][1]
+        if len(qubits) > self.blockBits:
+            return None
+        firstUse = {}
+        for i, (_, gateQubits) in enumerate(gates):
+            for q in gateQubits:
+                firstUse.setdefault(q, i)
+        lowStart = self.n - self.blockBits
+        rank = sorted(range(self.n), key=lambda q: (firstUse.get(q, len(gates)),
+                                                    self.axisOf[q] < lowStart))
+        newLow = set(rank[:self.blockBits])
+        incoming = [q for q in newLow if self.axisOf[q] < lowStart]
+        outgoing = [q for q in range(self.n) if self.axisOf[q] >= lowStart and q not in newLow]
+        axisOf = list(self.axisOf)
+        for a, b in zip(incoming, outgoing):
+            axisOf[a], axisOf[b] = axisOf[b], axisOf[a]
+        batch, _ = self._takeBatch(gates, axisOf)
+        return axisOf if len(batch) >= self.minRelabelGain else None
+    def _relabel(self, axisOf):
+        ''' Move the amplitudes so qubit q is on axis axisOf[q] '''
+        source = [0] * self.n  # Old axis of each new axis
+        for q, axis in enumerate(axisOf):
+            source[axis] = self.axisOf[q]
+        self._transpose(source)
+        self.axisOf = axisOf
+    def _transpose(self, source):
+        ''' Replace psi with psi transposed so new axis j is old axis
+            source[j] '''
+        if self._spare is None or len(self._spare) != len(self.psi):
+            self._spare = np.empty_like(self.psi)
+        shape = (2,)*self.n
+        self._spare.reshape(shape)[...] = self.psi.reshape(shape).transpose(source)
+        self.psi, self._spare = self._spare, self.psi
+        self.blockStats.relabels += 1
+
+    def _applyBatch(self, batch):
+        ''' Apply each gate of the batch (on low order qubits) to each block
+            of psi in turn '''
+        lowStart = self.n - self.blockBits
+        batch = [(kernel, tuple(self.axisOf[q] - lowStart for q in qubits))
+                 for kernel, qubits in batch]
+        shape = (2,)*self.blockBits
+        for block in self.psi.reshape(-1, 2**self.blockBits):
+            shapedBlock = block.reshape(shape)
+            for kernel, axes in batch:
+                applyKernel(shapedBlock, kernel, axes)
+        self.blockStats.batches += 1
+        self.blockStats.blockedGates += len(batch)
+
+    def _applyGateOpToBits(self, g, bitIList):
+        self._flush()
+        super()._applyGateOpToBits(g, bitIList)
+    def _applyOperator(self, op):
+        self._flush()
+        super()._applyOperator(op)
+    def _collapseBit(self, bitI, bitVal, prob):
+        self._flush()
+        super()._collapseBit(bitI, bitVal, prob)
+    def probOfMeasureBit(self, bitI, state=0):
+        self._flush()
+        return super().probOfMeasureBit(bitI, state)
+    def registerProbs(self, asArrays=False, topK=None, threshold=1e-10):
+        self._flush()
+        return super().registerProbs(asArrays, topK, threshold)
+    def sample(self, shots, seed=None):
+        self._flush()
+        return super().sample(shots, seed)
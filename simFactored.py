@@ -0,0 +1,226 @@
+'''
+Simulation of states factored into independent groups of qubits
+
+Qubits start as separate one qubit states.  Only a gate acting on qubits of
+different groups joins their states, so circuits whose qubits form small
+entangled groups never store a 2**n vector.
+
+Example:
+```
+    from simFullState import simulate
+
+    result = simulate(circuit, engine='factored')
+    print(result)  # Number and size of the groups
+    for qubits, probs in result.componentProbs():
+        print(qubits, probs)
+    print(result.marginalProbs([0, 5]))
+```
+'''
+
+import numpy as np
+
+from fullStateUtil import *
+from simFullState import Result, SimulationError
+
+
+class FactoredResult(Result):
+    ''' Result storing the state as a tensor product of component states.
+
+        The components are the connected components of the qubits linked by
+        multi-qubit gates, tracked with a union-find.  Each is a state vector
+        over its qubits in the order they joined.  A measured qubit is split
+        off again into its own component.  There is no psi, see jointState()
+        for the full state vector.
+
+        maxComponentQubits: Raise SimulationError instead of joining components
+                            into a larger one
+        maxJointQubits: Largest state jointState() and registerProbs() build
+    '''
+    def __init__(self, n, maxComponentQubits=30, maxJointQubits=30, seed=None, workers=None,
+                 dtype=None):
+        self.maxComponentQubits = maxComponentQubits
+        self.maxJointQubits = maxJointQubits
+        super().__init__(n, engine='factored', seed=seed, workers=workers, dtype=dtype)
+    def _createState(self, n):
+        self.parent = list(range(n))
+        self.components = {}  # Root qubit: (qubits, psi)
+        for q in range(n):
+            self.components[q] = ([q], createZeroState(1, dtype=self.dtype))
+        return None
+    def copy(self):
+        other = Result.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.parent = list(self.parent)
+        other.components = {root: (list(qubits), psi.copy())
+                            for root, (qubits, psi) in self.components.items()}
+        other.measureOutput = list(self.measureOutput)
+        return other
+    @property
+    def largestComponent(self):
+        return max((len(qubits) for qubits, _ in self.components.values()), default=0)
+    @property
+    def nbytes(self):
+        return sum(psi.nbytes for _, psi in self.components.values())
+    def __repr__(self):
+        return 'FactoredState(n={}, components={}, largest={}, nbytes={})'.format(
+            self.n, len(self.components), self.largestComponent, self.nbytes)
+    def _resize(self, n):
+        for q in range(self.n, n):
+            self.parent.append(q)
+            self.components[q] = ([q], createZeroState(1, dtype=self.dtype))
+        self.n = n
+
+    def find(self, q):
+        ''' Root qubit of the component of qubit q '''
+        parent = self.parent
+        while parent[q] != q:
+            parent[q] = parent[parent[q]]
+            q = parent[q]
+        return q
+    def _join(self, roots):
+        ''' Join the components with the given roots into one and return its
+            root '''
+        roots = sorted(roots, key=lambda r: -len(self.components[r][0]))
+        size = sum(len(self.components[r][0]) for r in roots)
+        if size > self.maxComponentQubits:
+            raise SimulationError('Joining components exceeds {} qubits'.format(
+                                  self.maxComponentQubits))
+        root = roots[0]
+        qubits, psi = self.components[root]
+        for r in roots[1:]:
+            otherQubits, otherPsi = self.components.pop(r)
+            psi = tensorProduct(psi, otherPsi)
+            qubits = qubits + otherQubits
+            self.parent[r] = root
+        self.components[root] = (qubits, psi)
+        return root
+    def _component(self, bits):
+        ''' Root, qubits, psi of the component containing all the bits '''
+        roots = {self.find(b) for b in bits}
+        root = roots.pop() if len(roots) == 1 else self._join(roots)
+        return (root, *self.components[root])
+
+    def _applyKernel(self, kernel, bitIList):
+        bits = [int(b) for b in bitIList]
+        root, qubits, psi = self._component(bits or [0])
+        axes = [qubits.index(b) for b in bits]
+        self._applyKernelTo(psi.reshape((2,)*len(qubits)), kernel, axes)
+
+    def _split(self, bitI, bitVal):
+        ''' Separate a measured qubit from its component '''
+        root, qubits, psi = self._component([bitI])
+        if len(qubits) <= 1:
+            return
+        a = qubits.index(bitI)
+        rest = qubits[:a] + qubits[a+1:]
+        restPsi = np.take(psi.reshape((2,)*len(qubits)), bitVal, axis=a).reshape(-1)
+        del self.components[root]
+        for q in rest:
+            self.parent[q] = rest[0]
+        self.components[rest[0]] = (rest, restPsi.copy())
+        self.parent[bitI] = bitI
+        bitPsi = np.zeros(2, dtype=self.dtype)
+        bitPsi[bitVal] = 1
+        self.components[bitI] = ([bitI], bitPsi)
+    def _collapseBit(self, bitI, bitVal, prob):
+        bitI = bitI.__index__()
+        _, qubits, psi = self._component([bitI])
+        collapseBit(psi, qubits.index(bitI), bitVal)
+        self._split(bitI, bitVal)
+        self.measureOutput.append(bitVal)
+        self.finalProbability *= prob
+    def probOfMeasureBit(self, bitI, state=0):
+        bitI = bitI.__index__()
+        _, qubits, psi = self._component([bitI])
+        return probabilityOfMeasure(psi, qubits.index(bitI), state=state)
+
+    def componentProbs(self):
+        ''' List of (qubits, probs) for each component, the probabilities of
+            the outputs of its qubits as big endian integers '''
+        out = []
+        for qubits, psi in self.components.values():
+            probs = (psi.conj() * psi).real
+            out.append((tuple(qubits), probs / np.sum(probs)))
+        return out
+    def marginalProbs(self, bits):
+        ''' Probabilities of the outputs of the given qubits (big endian, the
+            first most significant) with the other qubits not measured '''
+        bits = [int(b) for b in bits]
+        probs = np.ones(1)
+        order = []
+        for root in dict.fromkeys(self.find(b) for b in bits):
+            qubits, psi = self.components[root]
+            keep = [a for a, q in enumerate(qubits) if q in bits]
+            sums = marginalProbs((psi.conj() * psi).real, keep)
+            probs = tensorProduct(probs, sums / np.sum(sums))
+            order += [qubits[a] for a in keep]
+        axes = [order.index(b) for b in bits]
+        return probs.reshape((2,)*len(bits)).transpose(axes).reshape(-1)
+    def probs(self):
+        ''' Probabilities of all 2**n outputs in qubit order, the product of
+            the component probabilities '''
+        if self.n > self.maxJointQubits:
+            raise SimulationError('Probabilities of {} qubits exceed {} qubits'.format(
+                                  self.n, self.maxJointQubits))
+        return self.marginalProbs(range(self.n))
+    def bitProbs(self):
+        ''' Probability of measuring 1 on each qubit '''
+        out = np.empty(self.n)
+        for qubits, probs in self.componentProbs():
+            out[list(qubits)] = bitProbs(probs)
+        return out
+    def expectations(self, terms):
+        ''' Coefficient times expectation of each weighted Pauli string, see
+            observable.pauliExpectations().  Each is the product of the
+            expectations of its parts on the components it acts on. '''
+        from observable import parseTerms, pauliExpectations
+        terms = parseTerms(terms, self.n)
+        values = np.array([coef for coef, _, _, _ in terms], dtype=float)
+        parts = {}  # Root: {term index: {qubit: letter}}
+        for i, (_, xAxes, zAxes, _) in enumerate(terms):
+            letters = dict.fromkeys(xAxes, 'X')
+            for q in zAxes:
+                letters[q] = 'Y' if q in letters else 'Z'
+            for q, letter in letters.items():
+                parts.setdefault(self.find(q), {}).setdefault(i, {})[q] = letter
+        for root, termParts in parts.items():
+            qubits, psi = self.components[root]
+            local = {q: a for a, q in enumerate(qubits)}
+            termIs = list(termParts)
+            values[termIs] *= pauliExpectations(
+                psi, [{local[q]: letter for q, letter in termParts[i].items()} for i in termIs])
+        return values
+    def jointState(self):
+        ''' Full state vector of all qubits '''
+        if self.n > self.maxJointQubits:
+            raise SimulationError('Joint state of {} qubits exceeds {} qubits'.format(
+                                  self.n, self.maxJointQubits))
+        order = []
+        psi = np.ones(1, dtype=self.dtype)
+        for qubits, compPsi in self.components.values():
+            psi = tensorProduct(psi, compPsi)
+            order += qubits
+        return psi.reshape((2,)*self.n).transpose(np.argsort(order)).reshape(-1)
+    def registerProbs(self, asArrays=False, topK=None, threshold=1e-10):
+        psi = self.jointState()
+        if asArrays:
+            return measureProbArrays(psi, threshold=threshold, topK=topK,
+                                     order=self.measureOrder)
+        return exactMeasureResults(psi, topK=topK, order=self.measureOrder,
+                                   threshold=threshold)
+    def sampleBits(self, shots, seed=None):
+        ''' Sample shots measurements of every qubit, each component
+            independently.  Returns a bool array of shape (shots, n) in qubit
+            order. '''
+        rng = np.random.default_rng(seed)
+        bits = np.zeros((shots, self.n), dtype=bool)
+        for qubits, psi in self.components.values():
+            cdf = np.cumsum((psi.conj() * psi).real)
+            draws = np.searchsorted(cdf, rng.random(shots) * cdf[-1], side='right')
+            np.minimum(draws, len(cdf)-1, out=draws)
+            k = len(qubits)
+            bits[:, qubits] = (draws[:, None] >> np.arange(k-1, -1, -1)) & 1
+        return bits
+    def sample(self, shots, seed=None):
+        outputs = bitsToIndices(self.sampleBits(shots, seed), self.measureOrder)
+        return np.unique(outputs, return_counts=True)
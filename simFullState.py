@@ -21,12 +21,17 @@ Example:
 ```
 '''
 
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import matplotlib.pyplot as plt
 
 from circuit import Gate, Qubit, QuantumCircuit
 import gate
 import gateOperators
 from fullStateUtil import *
+from gateFusion import FusionStats, fuseGates
+from gateHistory import GateHistory
 import util
 
 
@@ -60,6 +65,18 @@ supportedGates = {
 }
 
 
+engines = {
+    'tensor',  # Contract each gate into the target axes of psi
+    'swap',  # Reference: permute target bits to the end with a sparse swap gate
+    'memmap',  # Tensor kernels applied in chunks to a state on disk
+    'sparse',  # Only nonzero amplitudes, see simSparse.SparseResult
+    'stabilizer',  # Clifford circuits only, see simStabilizer.StabilizerResult
+    'factored',  # Product of states of unentangled qubit groups, see simFactored
+    'blocked',  # Batches of low order gates applied per cache-sized block, see simBlocked
+}
+autoStabilizerQubits = 20  # engine='auto' simulates Clifford circuits this large as stabilizers
+
+
 class SimulationError(Exception): pass
 
 
@@ -91,18 +108,219 @@ def plotResults(results, log=False, percent=False):
     ax.set_xticklabels(xLabels, rotation='vertical')
     return fig
 
-def findGateOp(name, args):
+def findGateOp(name, args, dtype=None):
     try:
         if args:
-            return getattr(gateOperators, name+'Gen')(*args)
+            gateOp = getattr(gateOperators, name+'Gen')(*args)
+            return gateOp if dtype is None else gateOp.astype(dtype, copy=False)
         else:
-            return getattr(gateOperators, name)
+            gateOp = getattr(gateOperators, name)
+            return gateOp if dtype is None else gateOperators.castOp(name, gateOp, dtype)
     except AttributeError:
         raise SimulationError('Unsupported gate \'{}\''.format(name)) from None
     except TypeError:
         raise SimulationError('Invalid gate arguments {} for \'{}\''.format(repr(args), name)) from None
 
-def simulate(circuit, hisorySlice=None, continueResult=None, ignoreMGates=False):
+_kernelCache = {}
+def findGateKernel(name, args, gateOp):
+    ''' Classify a gate for the tensor engine.  Returns ('diagonal', diag),
+        ('permutation', (perm, phases)) or ('dense', gateOp). '''
+    key = (name, gateOp.dtype)
+    if not args and key in _kernelCache:
+        return _kernelCache[key]
+    if name in gateOperators.diagonalGates:
+        kernel = ('diagonal', np.diagonal(gateOp))
+    elif name in gateOperators.permutationGates:
+        perm = np.argmax(gateOp != 0, axis=1)
+        kernel = ('permutation', (perm, gateOp[np.arange(len(perm)), perm]))
+    else:
+        kernel = ('dense', gateOp)
+    if not args:
+        _kernelCache[key] = kernel
+    return kernel
+
+def classifyGateOp(gateOp):
+    ''' Classify an arbitrary gate matrix by its structure.  Same return value
+        as findGateKernel. '''
+    nonzero = gateOp != 0
+    if np.count_nonzero(nonzero) == len(gateOp):
+        perm = np.argmax(nonzero, axis=1)
+        if np.all(perm == np.arange(len(perm))):
+            return 'diagonal', np.diagonal(gateOp)
+        if len(set(perm)) == len(perm):
+            return 'permutation', (perm, gateOp[np.arange(len(perm)), perm])
+    return 'dense', gateOp
+
+def findMeasureOrder(history, n, measureCount):
+    ''' Return the order the qubits are measured in if the final n gates of
+        the history measure each qubit once, otherwise None.  Any other
+        measurement gates are measured mid-circuit. '''
+    if measureCount <= 0 or n <= 0 or len(history) < n:
+        return None
+    measureOrder = []
+    for g in history[-n:]:
+        if not g.instanceOf(gate.M):
+            return None
+        bitI = g.bits[0]
+        if bitI in measureOrder or bitI < 0 or bitI >= n:
+            return None
+        measureOrder.append(bitI)
+    return measureOrder
+
+def iterHistory(history, historyRange):
+    ''' Iterate over the gate instances of history in historyRange '''
+    if isinstance(history, GateHistory):
+        return history.iterRange(historyRange.start, historyRange.stop, historyRange.step)
+    return (history[h] for h in historyRange)
+
+def _firstMeasurement(history, historyRange):
+    if isinstance(history, GateHistory) and historyRange.step == 1:
+        indices = history.measurementIndices()
+        indices = indices[(indices >= historyRange.start) & (indices < historyRange.stop)]
+        return int(indices[0]) if len(indices) else historyRange.stop
+    return next((h for h in historyRange if history[h].measurement), historyRange.stop)
+
+def _midCircuitRange(circuit, historyRange, ignoreMGates):
+    ''' Find the measurement order and the part of historyRange before the
+        final measurements '''
+    history = circuit.history
+    if ignoreMGates:
+        return None, historyRange
+    measureOrder = findMeasureOrder(history, circuit.n, circuit.countM())
+    if measureOrder is not None:
+        finalStart = len(history) - circuit.n
+        historyRange = range(historyRange.start, min(historyRange.stop, finalStart),
+                             historyRange.step)
+    return measureOrder, historyRange
+
+def findInstKernel(gateInst, gateOp=None, dtype=None):
+    ''' Return the gate matrix and kernel for a gate instance.  If gateOp is
+        given it is used as the gate matrix instead of looking up the gate by
+        name. '''
+    if gateOp is None:
+        gateOp = findGateOp(gateInst.name, gateInst.args, dtype)
+        return gateOp, findGateKernel(gateInst.name, gateInst.args, gateOp)
+    if dtype is not None:
+        gateOp = gateOp.astype(dtype, copy=False)
+    return gateOp, classifyGateOp(gateOp)
+
+def applyKernel(shapedPsi, kernel, axes):
+    kind, data = kernel
+    if kind == 'diagonal':
+        applyDiagonal(shapedPsi, data, axes)
+    elif kind == 'permutation':
+        applyPermutation(shapedPsi, *data, axes)
+    else:
+        applyGateTensor(shapedPsi, data, axes)
+
+parallelMinQubits = 14  # Smaller states are not worth splitting between threads
+_threadPools = {}
+def _threadPool(workers):
+    if workers not in _threadPools:
+        _threadPools[workers] = ThreadPoolExecutor(workers, thread_name_prefix='simFullState')
+    return _threadPools[workers]
+@atexit.register
+def shutdownThreadPools():
+    ''' Stop the worker threads kept for workers=N.  Later simulations start
+        new ones. '''
+    while _threadPools:
+        _, pool = _threadPools.popitem()
+        pool.shutdown()
+
+def applyKernelParallel(shapedPsi, kernel, axes, workers):
+    ''' Apply a kernel using a pool of worker threads.  The state is split
+        into independent slices along the leading qubits the gate does not
+        touch and each slice is processed by one thread.  The NumPy calls in
+        the kernels release the GIL. '''
+    axes = tuple(int(a) for a in axes)
+    free = [a for a in range(shapedPsi.ndim) if a not in axes]
+    split = free[:util.floorLog2(workers-1)+1]
+    if workers <= 1 or not split:
+        applyKernel(shapedPsi, kernel, axes)
+        return
+    sliceAxes = tuple(a - sum(s < a for s in split) for a in axes)
+    futures = [_threadPool(workers).submit(applyKernel,
+                    shapedPsi[axesIndex(shapedPsi.ndim, split, vals)], kernel, sliceAxes)
+               for vals in itertools.product((0, 1), repeat=len(split))]
+    for f in futures:
+        f.result()
+
+def createResult(n, engine='tensor', seed=None, workers=None, dtype=None, **engineOptions):
+    if engine == 'memmap':
+        from simMemmap import MemmapResult
+        return MemmapResult(n, seed=seed, workers=workers, dtype=dtype, **engineOptions)
+    if engine == 'sparse':
+        from simSparse import SparseResult
+        return SparseResult(n, seed=seed, workers=workers, dtype=dtype, **engineOptions)
+    if engine == 'stabilizer':
+        from simStabilizer import StabilizerResult
+        return StabilizerResult(n, seed=seed, workers=workers, dtype=dtype, **engineOptions)
+    if engine == 'factored':
+        from simFactored import FactoredResult
+        return FactoredResult(n, seed=seed, workers=workers, dtype=dtype, **engineOptions)
+    if engine == 'blocked':
+        from simBlocked import BlockedResult
+        return BlockedResult(n, seed=seed, workers=workers, dtype=dtype, **engineOptions)
+    if engineOptions:
+        raise SimulationError('Unknown options {} for engine \'{}\''.format(
+                                ', '.join(engineOptions), engine))
+    return Result(n, engine=engine, seed=seed, workers=workers, dtype=dtype)
+
+def chooseEngine(circuit, engine='auto'):
+    ''' Resolve engine='auto' to 'stabilizer' for large Clifford circuits and
+        'tensor' otherwise.  'auto' is opt-in because a stabilizer result has
+        no psi, only the methods it implements. '''
+    if engine != 'auto':
+        return engine
+    if circuit.n >= autoStabilizerQubits:
+        from simStabilizer import isClifford
+        if isClifford(circuit):
+            return 'stabilizer'
+    return 'tensor'
+
+def simulate(circuit, hisorySlice=None, continueResult=None, ignoreMGates=False,
+             engine='tensor', fuse=None, seed=None, workers=None, dtype=None,
+             cache=None, optimize=False, remap=False, **engineOptions):
+    ''' Simulate the circuit history on a full state vector.
+
+        Measurements of every qubit at the end of the history are not
+        simulated but set the order of registerProbs() and sample().  Other
+        measurement gates are sampled in place as they are reached.  See
+        simulateBranches() to enumerate their outcomes instead.
+
+        engine: 'tensor', 'swap' (reference implementation), 'memmap' (see
+                simMemmap.MemmapResult for its engineOptions), 'sparse' (see
+                simSparse.SparseResult), 'stabilizer' (see
+                simStabilizer.StabilizerResult), 'factored' (see
+                simFactored.FactoredResult), 'blocked' (see
+                simBlocked.BlockedResult) or 'auto' (see chooseEngine())
+        fuse: Merge runs of gates into unitaries on up to this many qubits
+              before simulating.  Statistics are saved as result.fusionStats.
+        seed: Seed or numpy.random.Generator for mid-circuit measurements
+        workers: Number of threads to apply each gate with (default 1)
+        dtype: State precision, e.g. numpy.complex64 (default complex128)
+        cache: prefixCache.PrefixCache to resume from the longest previously
+               simulated prefix of the history and to store new prefixes in
+        remap: Simulate liveness.remapCircuit(circuit) on fewer qubits
+               instead.  Outputs are of the physical qubits, see
+               result.remapStats.qubitMap.
+        optimize: Simulate optimize.optimizeCircuit(circuit) instead (after
+                  remapping).  Its statistics are saved as result.optimizeStats.
+    '''
+    if remap:
+        if hisorySlice is not None or continueResult is not None:
+            raise SimulationError('Remapping needs the full history of a new simulation')
+        from liveness import RemapStats, remapCircuit
+        remapStats = RemapStats()
+        circuit = remapCircuit(circuit, stats=remapStats)
+    if optimize:
+        if hisorySlice is not None:
+            raise SimulationError('Optimizing needs the full history')
+        from optimize import OptimizeStats, optimizeCircuit
+        optimizeStats = OptimizeStats()
+        circuit = optimizeCircuit(circuit, stats=optimizeStats)
+    if engine == 'auto':
+        engine = 'tensor' if fuse or cache is not None else chooseEngine(circuit)
     n = circuit.n
     history = circuit.history
     if hisorySlice is not None:
@@ -114,57 +332,227 @@ def simulate(circuit, hisorySlice=None, continueResult=None, ignoreMGates=False)
         if n <= result.n:
             n = result.n
         else:
-            result.psi = np.append(result.psi,
-                            np.zeros(2**n - len(result.psi), dtype=result.psi.dtype))
-            result.n = n
+            result._resize(n)
+    else:
+        result = createResult(n, engine=engine, seed=seed, workers=workers, dtype=dtype,
+                              **engineOptions)
+
+    result.measureOrder, historyRange = _midCircuitRange(circuit, historyRange, ignoreMGates)
+    if fuse:
+        result.fusionStats = FusionStats()
+    if optimize:
+        result.optimizeStats = optimizeStats
+    if remap:
+        result.remapStats = remapStats
+
+    if cache is None:
+        _simulateGates(result, iterHistory(history, historyRange), fuse, ignoreMGates)
     else:
-        result = Result(n)
+        if (continueResult is not None or hisorySlice is not None
+                or engine in ('memmap', 'sparse', 'stabilizer', 'factored', 'blocked')):
+            raise SimulationError('A prefix cache needs a full history simulated in memory')
+        # States after a sampled measurement are random so only cache before one
+        stop = historyRange.stop
+        if not ignoreMGates:
+            stop = _firstMeasurement(history, historyRange)
+        hashes = cache.prefixHashes(n, result.dtype, history, stop)
+        start, psi = cache.longestPrefix(hashes)
+        if psi is not None:
+            result.psi[:] = psi
+        for point in cache.snapshotPoints(start, stop):
+            _simulateGates(result, iterHistory(history, range(start, point)), fuse, ignoreMGates)
+            cache.store(hashes, point, result.psi)
+            start = point
+        _simulateGates(result, iterHistory(history, range(start, historyRange.stop)),
+                       fuse, ignoreMGates)
+    result._flush()
+
+    return result
 
-    measureCount = circuit.countM()
-    measureOrder = None
-    if measureCount <= 0 or ignoreMGates:
-        measureCount = 0
+def _simulateGates(result, gateInsts, fuse, ignoreMGates):
+    if fuse:
+        if ignoreMGates:
+            gateInsts = (g for g in gateInsts if not g.instanceOf(gate.M))
+        gateOps = fuseGates(gateInsts, findGateOp, maxBits=fuse, stats=result.fusionStats)
     else:
-        bad = False
-        if len(history) < n:
-            bad = True
-        else:
-            lastNGates = history[-n:]
-            measureOrder = []
-            for g in lastNGates:
-                if g.instanceOf(gate.M):
-                    bitI = g.bits[0]
-                    if bitI in measureOrder or bitI < 0 or bitI >= n:
-                        bad = True
-                        break
-                    measureOrder.append(bitI)
-                else:
-                    bad = True
-                    break
-        if bad:
-            raise NotImplementedError('Unsupported arrangement of measurement gates (mixed with other gates or not one per qubit)')
-    result.measureOrder = measureOrder
-
-    for h in historyRange:
-        gateInst = history[h]
+        gateOps = ((g, None) for g in gateInsts)
+    for gateInst, gateOp in gateOps:
         if gateInst.instanceOf(gate.M):
             if not ignoreMGates:
-                pass  # TODO: Measurements before end
+                result._measureBit(gateInst.bits[0])
         else:
-            gateOp = findGateOp(gateInst.name, gateInst.args)
-            result._applyGateOpToBits(gateOp, gateInst.bits)
+            result._applyGateInst(gateInst, gateOp)
+
+def simulateStream(gateInsts, n, callbacks=(), ignoreMGates=False, engine='tensor',
+                   fuse=None, seed=None, workers=None, dtype=None, **engineOptions):
+    ''' Simulate gate instances as they are produced by any iterable (e.g. a
+        generator or circuitFile.iterGates()) without storing a history.
 
+        Measurements are deferred until a later gate acts on a measured
+        qubit, which then samples all deferred measurements in stream order
+        as simulate() would.  If the measurements still pending at the end of the
+        stream cover every qubit they set the order of registerProbs() and
+        sample(), otherwise they are sampled too.
+
+        callbacks: (every, function) pairs.  function(result, count) is called
+                   each time another `every` gates have been simulated, with
+                   the number of gates so far.  Deferred measurements are not
+                   yet applied to the state it observes.
+        Other arguments are as in simulate().
+    '''
+    callbacks = [(int(every), function) for every, function in callbacks]
+    if any(every <= 0 for every, _ in callbacks):
+        raise SimulationError('Callback periods must be positive')
+    result = createResult(n, engine=engine, seed=seed, workers=workers, dtype=dtype,
+                          **engineOptions)
+    if fuse:
+        result.fusionStats = FusionStats()
+    gateInsts = iter(gateInsts)
+    pending = {}  # Deferred measurements in the order they were reached
+    count = 0
+    while True:
+        # Fuse and simulate up to the next callback so its state is current
+        step = min((every - count % every for every, _ in callbacks), default=None)
+        consumed = [0]
+        segment = gateInsts if step is None else itertools.islice(gateInsts, step)
+        _streamGates(result, _counted(segment, consumed), pending, fuse, ignoreMGates)
+        count += consumed[0]
+        if step is None or consumed[0] < step:
+            break
+        result._flush()
+        for every, function in callbacks:
+            if count % every == 0:
+                function(result, count)
+    if len(pending) == n:
+        result.measureOrder = list(pending)
+    else:
+        for bitI in pending:
+            result._measureBit(bitI)
+    result._flush()
     return result
 
+def _counted(gateInsts, consumed):
+    for gateInst in gateInsts:
+        consumed[0] += 1
+        yield gateInst
+
+def _streamGates(result, gateInsts, pending, fuse, ignoreMGates):
+    if ignoreMGates:
+        gateInsts = (g for g in gateInsts if not g.instanceOf(gate.M))
+    if fuse:
+        gateOps = fuseGates(gateInsts, findGateOp, maxBits=fuse, stats=result.fusionStats)
+    else:
+        gateOps = ((g, None) for g in gateInsts)
+    for gateInst, gateOp in gateOps:
+        if pending and any(b.__index__() in pending for b in gateInst.bits):
+            # Measurements commute with gates on other qubits, so sampling
+            # them all in stream order matches simulate()
+            for bitI in pending:
+                result._measureBit(bitI)
+            pending.clear()
+        if gateInst.instanceOf(gate.M):
+            pending[gateInst.bits[0].__index__()] = None
+        else:
+            result._applyGateInst(gateInst, gateOp)
+
+def simulateBranches(circuit, threshold=1e-10, engine='tensor', workers=None, dtype=None,
+                     **engineOptions):
+    ''' Enumerate the outcomes of the mid-circuit measurements.
+
+        Returns a list with one Result per outcome branch.  Each has the outcomes
+        in previousMeasurements() and their probability in
+        probOfPreviousMeasurements().  Branches with probability at most
+        threshold are pruned.  Gates before a measurement are simulated once and
+        shared by the branches after it.  The state is only copied when both
+        outcomes survive.
+    '''
+    history = circuit.history
+    measureOrder, historyRange = _midCircuitRange(circuit, range(len(history)), False)
+    root = createResult(circuit.n, engine=chooseEngine(circuit, engine), workers=workers,
+                        dtype=dtype, **engineOptions)
+    root.measureOrder = measureOrder
+    branches = [(historyRange.start, root)]
+    results = []
+    while branches:
+        h, result = branches.pop()
+        gateInsts = iterHistory(history, range(h, historyRange.stop))
+        for h, gateInst in enumerate(gateInsts, h):
+            if not gateInst.instanceOf(gate.M):
+                result._applyGateInst(gateInst)
+                continue
+            bitI = gateInst.bits[0]
+            prob0 = result.probOfMeasureBit(bitI, state=0)
+            outcomes = [(v, p) for v, p in ((0, prob0), (1, 1-prob0))
+                        if result.finalProbability * p > threshold]
+            if len(outcomes) > 1:
+                other = result.copy()
+                other._collapseBit(bitI, *outcomes[1])
+                branches.append((h+1, other))
+            if outcomes:
+                result._collapseBit(bitI, *outcomes[0])
+            else:
+                result = None
+                break
+        if result is not None:
+            result._flush()
+            results.append(result)
+    return results
+
 
 class Result:
-    def __init__(self, n):
+    def __init__(self, n, engine='tensor', seed=None, workers=None, dtype=None):
+        if engine not in engines:
+            raise SimulationError('Unknown simulation engine \'{}\''.format(engine))
         self.n = n
-        self.psi = createZeroState(n)
+        self.engine = engine
+        self.workers = workers or 1
+        self.dtype = np.dtype(stateDtype if dtype is None else dtype)
+        self.psi = self._createState(n)
+        self._probs = None  # Cached probs(), cleared when the state changes
         self.measureOrder = None
         self.measureOutput = []
         self.finalProbability = 1.0
+        self.rng = np.random.default_rng(seed)
+    def _createState(self, n):
+        return createZeroState(n, dtype=self.dtype)
+    def copy(self):
+        other = Result.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.psi = self.psi.copy()
+        other.measureOutput = list(self.measureOutput)
+        return other
+    def _applyGateInst(self, gateInst, gateOp=None):
+        gateOp, kernel = findInstKernel(gateInst, gateOp, self.dtype)
+        if self.engine == 'swap':
+            self._applyGateOpSwap(gateOp, gateInst.bits)
+        else:
+            self._applyKernel(kernel, gateInst.bits)
+    def _applyKernel(self, kernel, bitIList):
+        self._probs = None
+        self._applyKernelTo(self.psi.reshape((2,)*self.n), kernel, bitIList)
+    def _applyKernelTo(self, shapedPsi, kernel, axes):
+        if self.workers > 1 and shapedPsi.ndim >= parallelMinQubits:
+            applyKernelParallel(shapedPsi, kernel, axes, self.workers)
+        else:
+            applyKernel(shapedPsi, kernel, axes)
+    def _flush(self):
+        ''' Finish any gates an engine has deferred '''
+        pass
+    def _resize(self, n):
+        ''' Add qubits in state 0 after the existing ones '''
+        psi = np.zeros(2**n, dtype=self.psi.dtype)
+        psi[::2**(n-self.n)] = self.psi
+        self.psi = psi
+        self.n = n
+        self._probs = None
     def _applyGateOpToBits(self, g, bitIList):
+        self._probs = None
+        if self.engine == 'swap':
+            self._applyGateOpSwap(g, bitIList)
+        else:
+            applyGateTensor(self.psi.reshape((2,)*self.n), g, bitIList)
+    def _applyGateOpSwap(self, g, bitIList):
+        self._probs = None
         sGate = swapGate(*tuple(i for i in range(self.n) if i not in bitIList), *bitIList)
         eGate = expandGate(g, min(self.n, 5))
         self.psi = sGate.dot(self.psi)
@@ -175,28 +563,68 @@ class Result:
         for i in range(0, len(self.psi), stride):
             self.psi[i:i+stride] = np.dot(eGate, self.psi[i:i+stride], temp)
 
-        self.psi = sGate.T.dot(self.psi)
+        self.psi = sGate.T.dot(self.psi).astype(self.dtype, copy=False)
     def _applyOperator(self, op):
+        self._probs = None
         self.psi = op.dot(self.psi)
     def _measureBit(self, bitI):
-        self.psi, bitVal, prob = measure(self.psi, bitI.__index__())
-        measureOutput.append(bitVal)
+        prob0 = self.probOfMeasureBit(bitI, state=0)
+        bitVal = int(self.rng.random() >= prob0)
+        self._collapseBit(bitI, bitVal, prob0 if bitVal == 0 else 1 - prob0)
+    def _collapseBit(self, bitI, bitVal, prob):
+        self._probs = None
+        collapseBit(self.psi, bitI.__index__(), bitVal)
+        self.measureOutput.append(bitVal)
         self.finalProbability *= prob
     def __repr__(self):
         return 'FullState('+repr(self.psi)+')'
 
     def continueSim(self, circuit, **kwargs):
-        simulate(circuit, continueResult=self, **kwargs)
+        return simulate(circuit, continueResult=self, **kwargs)
 
     def probOfMeasureBit(self, bitI, state=0):
+        if self._probs is not None:
+            return self.marginalProbs([bitI])[state]
         return probabilityOfMeasure(self.psi, bitI.__index__(), state=state)
-    def registerProbs(self):
-        if self.measureOrder:
-            sGate = swapGate(*self.measureOrder)
-            p = sGate.dot(self.psi)
-        else:
-            p = self.psi
-        return exactMeasureResults(p)
+    def probs(self):
+        ''' Normalized |psi|^2 in qubit order.  It is computed once and kept
+            until the state changes. '''
+        if self._probs is None:
+            self._flush()
+            probs = (self.psi.conj() * self.psi).real
+            probs /= np.sum(probs)
+            self._probs = probs
+        return self._probs
+    def marginalProbs(self, bits):
+        ''' Probability of each output of the given qubits (big endian, the
+            first most significant) with the other qubits not measured '''
+        return marginalProbs(self.probs(), bits)
+    def marginals(self, subsets):
+        ''' List of marginalProbs() of each list of qubits '''
+        return [self.marginalProbs(bits) for bits in subsets]
+    def bitProbs(self):
+        ''' Probability of measuring 1 on each qubit '''
+        return bitProbs(self.probs())
+    def expectations(self, terms):
+        ''' Coefficient times expectation of each weighted Pauli string, see
+            observable.pauliExpectations() '''
+        from observable import pauliExpectations
+        self._flush()
+        return pauliExpectations(self.psi, terms)
+    def registerProbs(self, asArrays=False, topK=None, threshold=1e-10):
+        ''' Probability of each output in measurement order.  Returns a dict
+            of bit tuples or, if asArrays, (indices, probs) arrays with outputs
+            as big endian integers.  topK keeps only the most likely outputs. '''
+        if asArrays:
+            return measureProbArrays(self.psi, threshold=threshold, topK=topK,
+                                     order=self.measureOrder)
+        return exactMeasureResults(self.psi, topK=topK, order=self.measureOrder,
+                                   threshold=threshold)
+    def sample(self, shots, seed=None):
+        ''' Sample shots measurements of the final state in measurement order.
+            Returns (outputs, counts) integer arrays with outputs as big endian
+            integers.  seed may be an int or a numpy.random.Generator. '''
+        return sampleMeasurements(self.psi, shots, rng=seed, order=self.measureOrder)
     def previousMeasurements(self):
         return tuple(self.measureOutput)
     def probOfPreviousMeasurements(self):
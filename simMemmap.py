@@ -0,0 +1,230 @@
+'''
+Out-of-core full state simulation with the state vector in a memory mapped file
+
+Example:
+```
+    from simFullState import simulate
+
+    result = simulate(circuit, engine='memmap', memoryBudget=2**30,
+                      tempDir='/mnt/nvme/tmp')
+    print(result.registerProbs(asArrays=True, topK=10))
+```
+'''
+
+import tempfile
+import numpy as np
+
+from fullStateUtil import *
+from simFullState import Result
+import util
+
+
+class MemmapResult(Result):
+    ''' Result with psi stored in a numpy.memmap backed by a file in tempDir.
+
+        The state is processed in chunks that, grouped by 2**pairBits, fit in
+        memoryBudget bytes.  Gates on the low order qubits (the last qubits,
+        whose amplitudes lie in one chunk) are queued and then streamed through
+        each chunk together in a single pass.  A gate on high order qubits is
+        applied by loading the chunks that differ only in those qubits as one
+        group.
+    '''
+    pairBits = 3  # Budget room for gates on this many high order qubits
+    def __init__(self, n, memoryBudget=2**28, tempDir=None, seed=None, workers=None,
+                 dtype=None):
+        self.tempDir = tempDir
+        self.memoryBudget = memoryBudget
+        self.chunkBits = self._fitChunkBits(n, stateDtype if dtype is None else dtype)
+        self._pending = []
+        super().__init__(n, engine='memmap', seed=seed, workers=workers, dtype=dtype)
+    def _fitChunkBits(self, n, dtype):
+        itemBits = util.floorLog2(np.dtype(dtype).itemsize)
+        return max(0, min(n, util.floorLog2(self.memoryBudget) - itemBits - self.pairBits))
+    def _createState(self, n):
+        self._file = tempfile.TemporaryFile(dir=self.tempDir)
+        psi = np.memmap(self._file, dtype=self.dtype, mode='w+', shape=(2**n,))
+        psi[0] = 1
+        return psi
+    def copy(self):
+        self._flush()
+        other = Result.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.measureOutput = list(self.measureOutput)
+        other._pending = []
+        other.psi = other._createState(self.n)
+        for s in self._chunkSlices():
+            other.psi[s] = self.psi[s]
+        return other
+    def __repr__(self):
+        return 'MemmapState(n={}, chunkBits={})'.format(self.n, self.chunkBits)
+    def _resize(self, n):
+        ''' Add qubits in state 0 after the existing ones, copying the state
+            one chunk at a time into a new mapped file '''
+        self._flush()
+        self._probs = None
+        shift = n - self.n
+        size = 2**self.chunkBits
+        oldPsi, oldFile = self.psi, self._file
+        self.psi = self._createState(n)
+        for start in range(0, len(oldPsi), size):
+            self.psi[start << shift:(start+size) << shift:2**shift] = oldPsi[start:start+size]
+        del oldPsi
+        oldFile.close()
+        self.n = n
+        self.chunkBits = self._fitChunkBits(n, self.dtype)
+
+    def _chunkSlices(self):
+        size = 2**self.chunkBits
+        return (slice(start, start+size) for start in range(0, len(self.psi), size))
+    def _chunkProbs(self):
+        for s in self._chunkSlices():
+            chunk = self.psi[s]
+            yield s.start, (chunk.conj() * chunk).real
+
+    def _applyKernel(self, kernel, bitIList):
+        self._probs = None
+        lowStart = self.n - self.chunkBits
+        if all(b >= lowStart for b in bitIList):
+            self._pending.append((kernel, tuple(b - lowStart for b in bitIList)))
+        else:
+            self._flush()
+            self._applyHighKernel(kernel, bitIList)
+    def _flush(self):
+        ''' Stream each chunk through all queued low order gates once '''
+        if not self._pending:
+            return
+        shape = (2,)*self.chunkBits
+        for s in self._chunkSlices():
+            chunk = np.array(self.psi[s])
+            for kernel, axes in self._pending:
+                self._applyKernelTo(chunk.reshape(shape), kernel, axes)
+            self.psi[s] = chunk
+        self._pending = []
+    def _applyHighKernel(self, kernel, bitIList):
+        lowStart = self.n - self.chunkBits
+        high = sorted({int(b) for b in bitIList if b < lowStart})
+        h = len(high)
+        axes = tuple(high.index(b) if b < lowStart else h + b - lowStart for b in bitIList)
+        size = 2**self.chunkBits
+        masks = [1 << (lowStart-1-b) for b in high]  # Bit of each qubit in the chunk number
+        offsets = [sum(m for m, v in zip(masks, util.toTupleBE(j, h)) if v)
+                   for j in range(2**h)]
+        group = np.empty((2**h, size), dtype=self.psi.dtype)
+        shapedGroup = group.reshape((2,)*(h+self.chunkBits))
+        for c in range(2**lowStart):
+            if any(c & m for m in masks):
+                continue
+            for j, o in enumerate(offsets):
+                group[j] = self.psi[(c+o)*size:(c+o+1)*size]
+            self._applyKernelTo(shapedGroup, kernel, axes)
+            for j, o in enumerate(offsets):
+                self.psi[(c+o)*size:(c+o+1)*size] = group[j]
+
+    def _bitMass(self, bitI):
+        ''' Total |psi|^2 where bitI is 0 and where it is 1 '''
+        lowStart = self.n - self.chunkBits
+        mass = np.zeros(2)
+        for start, probs in self._chunkProbs():
+            if bitI < lowStart:
+                mass[((start >> self.chunkBits) >> (lowStart-1-bitI)) & 1] += np.sum(probs)
+            else:
+                mass += np.sum(probs.reshape(2**(bitI-lowStart), 2, -1), axis=(0, 2))
+        return mass
+    def _collapseBit(self, bitI, bitVal, prob):
+        self._flush()
+        self._probs = None
+        bitI = bitI.__index__()
+        lowStart = self.n - self.chunkBits
+        for s in self._chunkSlices():
+            if bitI < lowStart:
+                if ((s.start >> self.chunkBits) >> (lowStart-1-bitI)) & 1 != bitVal:
+                    self.psi[s] = 0
+            else:
+                self.psi[s].reshape(2**(bitI-lowStart), 2, -1)[:, 1-bitVal] = 0
+        self.measureOutput.append(bitVal)
+        self.finalProbability *= prob
+
+    def probOfMeasureBit(self, bitI, state=0):
+        self._flush()
+        mass = self._bitMass(bitI.__index__())
+        return mass[state] / np.sum(mass)
+    def probs(self):
+        ''' Like Result.probs() but computed one chunk at a time into a memory
+            mapped array in tempDir '''
+        if self._probs is None:
+            self._flush()
+            probs = np.memmap(tempfile.TemporaryFile(dir=self.tempDir), dtype=np.float64,
+                              mode='w+', shape=(len(self.psi),))
+            total = 0
+            for start, p in self._chunkProbs():
+                probs[start:start+len(p)] = p
+                total += np.sum(p)
+            for s in self._chunkSlices():
+                probs[s] /= total
+            self._probs = probs
+        return self._probs
+    def marginalProbs(self, bits):
+        ''' Like Result.marginalProbs() but accumulated one chunk at a time '''
+        self._flush()
+        bits = [int(b) for b in bits]
+        k = len(bits)
+        lowStart = self.n - self.chunkBits
+        low = [b - lowStart for b in bits if b >= lowStart]
+        highAxes = [i for i, b in enumerate(bits) if b < lowStart]
+        out = np.zeros((2,)*k)
+        for start, probs in self._chunkProbs():
+            c = start >> self.chunkBits
+            vals = [(c >> (lowStart-1-bits[i])) & 1 for i in highAxes]
+            out[axesIndex(k, highAxes, vals)] += marginalProbs(probs, low).reshape((2,)*len(low))
+        out = out.reshape(-1)
+        return out / np.sum(out)
+    def bitProbs(self):
+        self._flush()
+        lowStart = self.n - self.chunkBits
+        ones = np.zeros(self.n)
+        total = 0
+        for start, probs in self._chunkProbs():
+            c = start >> self.chunkBits
+            chunkTotal = np.sum(probs)
+            if chunkTotal == 0:
+                continue
+            ones[:lowStart] += chunkTotal * ((c >> np.arange(lowStart-1, -1, -1)) & 1)
+            ones[lowStart:] += chunkTotal * bitProbs(probs)
+            total += chunkTotal
+        return ones / total
+    def registerProbs(self, asArrays=False, topK=None, threshold=1e-10):
+        self._flush()
+        total = sum(np.sum(probs) for _, probs in self._chunkProbs())
+        indices, probs = [], []
+        for start, p in self._chunkProbs():
+            p /= total
+            i = np.flatnonzero(p > threshold)
+            i, p = topKProbs(i, p[i], topK)
+            indices.append(i + start)
+            probs.append(p)
+        indices, probs = np.concatenate(indices), np.concatenate(probs)
+        if self.measureOrder:
+            indices = permuteIndexBits(indices, self.n, self.measureOrder)
+        sortI = np.argsort(indices)
+        indices, probs = topKProbs(indices[sortI], probs[sortI], topK)
+        if asArrays:
+            return indices, probs
+        return probArraysToDict(indices, probs, self.n)
+    def sample(self, shots, seed=None):
+        self._flush()
+        rng = np.random.default_rng(seed)
+        sums = np.array([np.sum(probs) for _, probs in self._chunkProbs()])
+        cum = np.cumsum(sums)
+        draws = np.sort(rng.random(shots) * cum[-1])
+        chunkOf = np.minimum(np.searchsorted(cum, draws, side='right'), len(cum)-1)
+        outputs = np.empty(shots, dtype=np.int64)
+        for c, (start, probs) in enumerate(self._chunkProbs()):
+            lo, hi = np.searchsorted(chunkOf, (c, c+1))
+            if lo >= hi:
+                continue
+            cdf = np.cumsum(probs)
+            local = np.searchsorted(cdf, draws[lo:hi] - (cum[c] - sums[c]), side='right')
+            outputs[lo:hi] = np.minimum(local, len(cdf)-1) + start
+        if self.measureOrder:
+            outputs = permuteIndexBits(outputs, self.n, self.measureOrder)
+        return np.unique(outputs, return_counts=True)
@@ -0,0 +1,226 @@
+'''
+Simulation of states with few nonzero amplitudes, such as reversible arithmetic
+circuits, on up to 63 qubits
+
+Example:
+```
+    from simFullState import simulate
+
+    result = simulate(adderCircuit, engine='sparse')
+    print(result.registerProbs(asArrays=True))
+```
+'''
+
+import numpy as np
+
+from fullStateUtil import *
+from simFullState import Result, SimulationError
+
+
+maxSparseQubits = 63  # Basis state indices are int64
+
+
+def localIndex(indices, n, bits):
+    ''' Value of the given bits of each big endian basis state index, the
+        first bit most significant '''
+    local = np.zeros(len(indices), dtype=np.int64)
+    for b in bits:
+        local = (local << 1) | ((indices >> (n-1-int(b))) & 1)
+    return local
+
+def setLocalIndex(indices, n, bits, local):
+    ''' Replace the given bits of each basis state index with local '''
+    k = len(bits)
+    mask = sum(1 << (n-1-int(b)) for b in bits)
+    out = indices & ~np.int64(mask)
+    for j, b in enumerate(bits):
+        out |= ((local >> (k-1-j)) & 1) << (n-1-int(b))
+    return out
+
+
+class SparseResult(Result):
+    ''' Result storing only the nonzero amplitudes as sorted index and
+        amplitude arrays.
+
+        Diagonal gates scale amplitudes and permutation gates (X, CX, CCX,
+        SWAP, ...) remap indices without changing the number of terms.  Other
+        (divergent) gates branch each term into up to 2**k terms.  Once the
+        number of terms exceeds denseFraction of 2**n the state is converted
+        to a dense vector and simulated as by the 'tensor' engine, or sooner
+        if it exceeds maxTerms.  States of more than maxDenseQubits qubits
+        raise SimulationError beyond maxTerms terms instead.
+    '''
+    pruneTol = 1e-24  # Drop terms with less than this fraction of the total probability
+    def __init__(self, n, denseFraction=1/16, maxTerms=2**24, maxDenseQubits=30,
+                 seed=None, workers=None, dtype=None):
+        if n > maxSparseQubits:
+            raise SimulationError('The sparse engine supports at most {} qubits'.format(
+                                  maxSparseQubits))
+        self.denseFraction = denseFraction
+        self.maxTerms = maxTerms
+        self.maxDenseQubits = maxDenseQubits
+        super().__init__(n, engine='sparse', seed=seed, workers=workers, dtype=dtype)
+    def _createState(self, n):
+        self.indices = np.zeros(1, dtype=np.int64)
+        self.amps = np.ones(1, dtype=self.dtype)
+        return None
+    @property
+    def isDense(self):
+        return self.psi is not None
+    def copy(self):
+        if self.isDense:
+            return super().copy()
+        other = Result.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.indices = self.indices.copy()
+        other.amps = self.amps.copy()
+        other.measureOutput = list(self.measureOutput)
+        return other
+    def __repr__(self):
+        if self.isDense:
+            return 'SparseState(n={}, dense)'.format(self.n)
+        return 'SparseState(n={}, terms={})'.format(self.n, len(self.indices))
+    def _resize(self, n):
+        if n > maxSparseQubits:
+            raise SimulationError('The sparse engine supports at most {} qubits'.format(
+                                  maxSparseQubits))
+        if self.isDense:
+            return super()._resize(n)
+        self.indices <<= n - self.n
+        self.n = n
+    def toDense(self):
+        ''' Return the state as a full state vector '''
+        if self.isDense:
+            return self.psi
+        if self.n > self.maxDenseQubits:
+            raise SimulationError('State of {} qubits is too large to be dense'.format(self.n))
+        psi = np.zeros(2**self.n, dtype=self.dtype)
+        psi[self.indices] = self.amps
+        return psi
+
+    def _applyKernel(self, kernel, bitIList):
+        if self.isDense:
+            return super()._applyKernel(kernel, bitIList)
+        kind, data = kernel
+        n = self.n
+        bits = tuple(int(b) for b in bitIList)
+        local = localIndex(self.indices, n, bits)
+        if kind == 'diagonal':
+            self.amps *= data[local]
+        elif kind == 'permutation':
+            perm, phases = data
+            invPerm = np.argsort(perm)  # Column j moves to row invPerm[j]
+            newLocal = invPerm[local]
+            self.amps *= phases[newLocal]
+            self.indices = setLocalIndex(self.indices, n, bits, newLocal)
+            order = np.argsort(self.indices)
+            self.indices, self.amps = self.indices[order], self.amps[order]
+        else:
+            self._branch(data, bits, local)
+
+    def _branch(self, gateOp, bits, local):
+        ''' Apply a dense gate by expanding each term into every output of the
+            gate and summing terms with equal indices '''
+        d = len(gateOp)
+        rows = np.arange(d)
+        newAmps = gateOp[:, local].T * self.amps[:, None]  # (terms, d)
+        keep = newAmps != 0
+        newIndices = setLocalIndex(np.repeat(self.indices, d), self.n, bits,
+                                   np.tile(rows, len(self.indices)))
+        newIndices, newAmps = newIndices[keep.reshape(-1)], newAmps[keep]
+        indices, inverse = np.unique(newIndices, return_inverse=True)
+        amps = (np.bincount(inverse, weights=newAmps.real, minlength=len(indices))
+                + 1j*np.bincount(inverse, weights=newAmps.imag, minlength=len(indices)))
+        probs = (amps.conj() * amps).real
+        keep = probs > self.pruneTol * np.sum(probs)
+        self.indices, self.amps = indices[keep], amps[keep].astype(self.dtype)
+        self._checkSize()
+
+    def _checkSize(self):
+        terms = len(self.indices)
+        if self.n <= self.maxDenseQubits:
+            # A state that may go dense does so before reaching maxTerms
+            if terms > min(self.denseFraction * 2**self.n, self.maxTerms):
+                self.psi = self.toDense()
+                self.indices = self.amps = None
+        elif terms > self.maxTerms:
+            raise SimulationError('Sparse state of {} qubits exceeded {} terms'.format(
+                                  self.n, self.maxTerms))
+
+    def _bitMask(self, bitI):
+        return ((self.indices >> (self.n-1-bitI.__index__())) & 1).astype(bool)
+    def _collapseBit(self, bitI, bitVal, prob):
+        if self.isDense:
+            return super()._collapseBit(bitI, bitVal, prob)
+        keep = self._bitMask(bitI) == bool(bitVal)
+        self.indices, self.amps = self.indices[keep], self.amps[keep]
+        self.measureOutput.append(bitVal)
+        self.finalProbability *= prob
+
+    def probOfMeasureBit(self, bitI, state=0):
+        if self.isDense:
+            return super().probOfMeasureBit(bitI, state)
+        probs = (self.amps.conj() * self.amps).real
+        return np.sum(probs[self._bitMask(bitI) == bool(state)]) / np.sum(probs)
+    def probs(self):
+        if self.isDense:
+            return super().probs()
+        psi = self.toDense()
+        probs = (psi.conj() * psi).real
+        return probs / np.sum(probs)
+    def marginalProbs(self, bits):
+        if self.isDense:
+            return super().marginalProbs(bits)
+        probs = (self.amps.conj() * self.amps).real
+        local = localIndex(self.indices, self.n, bits)
+        return np.bincount(local, weights=probs / np.sum(probs), minlength=2**len(bits))
+    def expectations(self, terms):
+        ''' Like Result.expectations() but pairing the terms of the sparse
+            state directly '''
+        if self.isDense:
+            return super().expectations(terms)
+        from observable import parseTerms
+        n = self.n
+        norm = np.sum((self.amps.conj() * self.amps).real)
+        values = np.zeros(len(terms))
+        for i, (coef, xAxes, zAxes, nY) in enumerate(parseTerms(terms, n)):
+            partners = self.indices ^ np.int64(sum(1 << (n-1-q) for q in xAxes))
+            pos = np.minimum(np.searchsorted(self.indices, partners), len(self.indices)-1)
+            found = self.indices[pos] == partners
+            parity = np.zeros(len(self.indices), dtype=np.int64)
+            for q in zAxes:
+                parity ^= (self.indices >> (n-1-q)) & 1
+            total = np.sum(self.amps[pos[found]].conj() * self.amps[found]
+                           * (1 - 2*parity[found]))
+            values[i] = coef * (1j**nY * total).real / norm
+        return values
+    def bitProbs(self):
+        if self.isDense:
+            return super().bitProbs()
+        probs = (self.amps.conj() * self.amps).real
+        probs /= np.sum(probs)
+        return np.array([np.sum(probs[self._bitMask(b)]) for b in range(self.n)])
+    def registerProbs(self, asArrays=False, topK=None, threshold=1e-10):
+        if self.isDense:
+            return super().registerProbs(asArrays, topK, threshold)
+        probs = (self.amps.conj() * self.amps).real
+        probs /= np.sum(probs)
+        keep = probs > threshold
+        indices, probs = self.indices[keep], probs[keep]
+        if self.measureOrder:
+            indices = permuteIndexBits(indices, self.n, self.measureOrder)
+        sortI = np.argsort(indices)
+        indices, probs = topKProbs(indices[sortI], probs[sortI], topK)
+        if asArrays:
+            return indices, probs
+        return probArraysToDict(indices, probs, self.n)
+    def sample(self, shots, seed=None):
+        if self.isDense:
+            return super().sample(shots, seed)
+        rng = np.random.default_rng(seed)
+        cdf = np.cumsum((self.amps.conj() * self.amps).real)
+        draws = np.searchsorted(cdf, rng.random(shots) * cdf[-1], side='right')
+        outputs = self.indices[np.minimum(draws, len(cdf)-1)]
+        if self.measureOrder:
+            outputs = permuteIndexBits(outputs, self.n, self.measureOrder)
+        return np.unique(outputs, return_counts=True)
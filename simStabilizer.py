@@ -0,0 +1,334 @@
+'''
+Simulation of Clifford circuits with a stabilizer tableau (CHP) in polynomial
+time
+
+Example:
+```
+    from circuit import QuantumCircuit
+    from gate import *
+    from simFullState import simulate
+
+    circuit = QuantumCircuit(1000)
+    reg = circuit[:]
+    H(reg[0])
+    for i in range(999):
+        CX(reg[i], reg[i+1])
+    M(reg)
+
+    result = simulate(circuit, engine='auto')  # Selects engine='stabilizer'
+    outputs, counts = result.sample(1000)
+```
+'''
+
+import numpy as np
+
+from fullStateUtil import bitsToIndices
+from simFullState import Result, SimulationError
+import util
+
+
+cliffordGates = {'H', 'S', 'Sd', 'X', 'Y', 'Z', 'CX', 'SWAP', 'M', 'I1', 'I2', 'P'}
+maxEnumerateBits = 20  # registerProbs() lists at most 2**maxEnumerateBits outputs
+
+_popcount = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+def isClifford(circuit):
+    ''' Return whether every gate of the circuit is supported by the
+        stabilizer engine '''
+    counts = getattr(circuit.history, 'counts', None)
+    if counts is None:
+        return all(g.name in cliffordGates for g in circuit.history)
+    return all(name in cliffordGates for name, count in counts.items() if count)
+
+def _phase(x1, z1, x2, z2):
+    ''' Sum over qubits of the power of i from multiplying Pauli rows 1 and 2
+        (the g function of CHP) for packed rows '''
+    nx1, nz1, nx2, nz2 = np.invert(x1), np.invert(z1), np.invert(x2), np.invert(z2)
+    plus = (x1 & z1 & z2 & nx2) | (x1 & nz1 & z2 & x2) | (nx1 & z1 & x2 & nz2)
+    minus = (x1 & z1 & x2 & nz2) | (x1 & nz1 & z2 & nx2) | (nx1 & z1 & x2 & z2)
+    return _popcount[plus].sum(axis=-1) - _popcount[minus].sum(axis=-1)
+
+def _rowsum(x, z, r, targets, source):
+    ''' Multiply the rows targets of a tableau by the row source '''
+    phase = _phase(x[source], z[source], x[targets], z[targets])
+    r[targets] = (2*r[targets] + 2*r[source] + phase) % 4 // 2
+    x[targets] ^= x[source]
+    z[targets] ^= z[source]
+
+def _rowBasis(rows):
+    ''' Linearly independent rows over GF(2) spanning the rows of a bool
+        array '''
+    rows = rows.copy()
+    r = 0
+    for col in range(rows.shape[1]):
+        if r >= len(rows):
+            break
+        candidates = np.flatnonzero(rows[r:, col]) + r
+        if not len(candidates):
+            continue
+        p = candidates[0]
+        rows[[r, p]] = rows[[p, r]]
+        targets = np.flatnonzero(rows[:, col])
+        rows[targets[targets != r]] ^= rows[r]
+        r += 1
+    return rows[:r]
+
+
+class StabilizerResult(Result):
+    ''' Result storing the state as a stabilizer tableau.  Rows 0..n-1 are the
+        destabilizers and rows n..2n-1 the stabilizer generators.  The X and Z
+        parts are bit packed, 8 qubits per byte.
+
+        There is no psi.  The measurement outputs of a stabilizer state are
+        uniformly distributed over an affine subspace which registerProbs()
+        and sample() use directly.  For more than 62 qubits output integers
+        are Python ints in object arrays.  See sampleBits() for bit arrays.
+    '''
+    def __init__(self, n, seed=None, workers=None, dtype=None):
+        super().__init__(n, engine='stabilizer', seed=seed, workers=workers, dtype=dtype)
+    def _createState(self, n):
+        self.x, self.z, self.r = self._identityTableau(n)
+        self._support = None
+        return None
+    @staticmethod
+    def _identityTableau(n):
+        ''' Tableau of |0...0> '''
+        nBytes = (n + 7) // 8
+        eye = np.packbits(np.identity(n, dtype=np.uint8), axis=1).reshape(n, nBytes)
+        x = np.zeros((2*n, nBytes), dtype=np.uint8)
+        z = np.zeros((2*n, nBytes), dtype=np.uint8)
+        x[:n] = eye
+        z[n:] = eye
+        return x, z, np.zeros(2*n, dtype=np.uint8)
+    def copy(self):
+        other = Result.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.x, other.z, other.r = self.x.copy(), self.z.copy(), self.r.copy()
+        other.measureOutput = list(self.measureOutput)
+        return other
+    def __repr__(self):
+        return 'StabilizerState(n={})'.format(self.n)
+    def _resize(self, n):
+        x, z, r = self._identityTableau(n)
+        old = self.n
+        nBytes = self.x.shape[1]
+        x[:old, :nBytes], z[:old, :nBytes], r[:old] = self.x[:old], self.z[:old], self.r[:old]
+        x[n:n+old, :nBytes], z[n:n+old, :nBytes] = self.x[old:], self.z[old:]
+        r[n:n+old] = self.r[old:]
+        self.x, self.z, self.r = x, z, r
+        self.n = n
+        self._support = None
+
+    def _col(self, array, a):
+        return (array[:, a >> 3] >> (7 - (a & 7))) & 1
+    def _setCol(self, array, a, values):
+        shift = 7 - (a & 7)
+        array[:, a >> 3] = (array[:, a >> 3] & ~np.uint8(1 << shift)) | (values << shift)
+
+    def _applyGateInst(self, gateInst, gateOp=None):
+        name = gateInst.name
+        if name not in cliffordGates or gateOp is not None:
+            raise SimulationError('Gate \'{}\' is not supported by the stabilizer engine'.format(
+                                  name))
+        bits = [b.__index__() for b in gateInst.bits]
+        self._support = None
+        if name in ('H', 'S', 'Sd', 'X', 'Y', 'Z'):
+            a, = bits
+            xa, za = self._col(self.x, a), self._col(self.z, a)
+            if name == 'H':
+                self.r ^= xa & za
+                self._setCol(self.x, a, za)
+                self._setCol(self.z, a, xa)
+            elif name == 'S':
+                self.r ^= xa & za
+                self._setCol(self.z, a, za ^ xa)
+            elif name == 'Sd':
+                self.r ^= xa & (za ^ 1)
+                self._setCol(self.z, a, za ^ xa)
+            elif name == 'X':
+                self.r ^= za
+            elif name == 'Y':
+                self.r ^= xa ^ za
+            else:
+                self.r ^= xa
+        elif name == 'CX':
+            a, b = bits
+            xa, za = self._col(self.x, a), self._col(self.z, a)
+            xb, zb = self._col(self.x, b), self._col(self.z, b)
+            self.r ^= xa & zb & (xb ^ za ^ 1)
+            self._setCol(self.x, b, xb ^ xa)
+            self._setCol(self.z, a, za ^ zb)
+        elif name == 'SWAP':
+            a, b = bits
+            for array in (self.x, self.z):
+                colA, colB = self._col(array, a), self._col(array, b)
+                self._setCol(array, a, colB)
+                self._setCol(array, b, colA)
+
+    def _productSign(self, rows):
+        ''' Sign bit of the product of the given tableau rows.  The partial
+            products are accumulated with a prefix XOR. '''
+        xs, zs = self.x[rows], self.z[rows]
+        prevX = np.zeros_like(xs)
+        prevZ = np.zeros_like(zs)
+        prevX[1:] = np.bitwise_xor.accumulate(xs, axis=0)[:-1]
+        prevZ[1:] = np.bitwise_xor.accumulate(zs, axis=0)[:-1]
+        phase = 2*np.sum(self.r[rows], dtype=np.int64) + np.sum(_phase(xs, zs, prevX, prevZ))
+        return int(phase % 4 // 2)
+    def _deterministicOutcome(self, a):
+        ''' Outcome of measuring qubit a if it is not random, the sign of the
+            product of the stabilizers with the destabilizers that anticommute
+            with Z_a '''
+        n = self.n
+        return self._productSign(np.flatnonzero(self._col(self.x, a)[:n]) + n)
+    def _randomRow(self, a):
+        ''' A stabilizer anticommuting with Z_a or None if a is deterministic '''
+        rows = np.flatnonzero(self._col(self.x, a)[self.n:])
+        return rows[0] + self.n if len(rows) else None
+
+    def probOfMeasureBit(self, bitI, state=0):
+        a = bitI.__index__()
+        if self._randomRow(a) is not None:
+            return 0.5
+        return float(self._deterministicOutcome(a) == state)
+    def _collapseBit(self, bitI, bitVal, prob):
+        a = bitI.__index__()
+        p = self._randomRow(a)
+        if p is not None:
+            self._support = None
+            n = self.n
+            others = np.flatnonzero(self._col(self.x, a))
+            others = others[others != p]
+            if len(others):
+                _rowsum(self.x, self.z, self.r, others, p)
+            self.x[p-n], self.z[p-n], self.r[p-n] = self.x[p], self.z[p], self.r[p]
+            self.x[p] = 0
+            self.z[p] = 0
+            self.z[p, a >> 3] = 1 << (7 - (a & 7))
+            self.r[p] = bitVal
+        self.measureOutput.append(bitVal)
+        self.finalProbability *= prob
+
+    def support(self):
+        ''' Return (offset, basis) bool arrays such that the possible outputs
+            are offset XOR any combination of the k rows of basis (k, n).
+            Each has probability 2**-k.  Outputs are in qubit order. '''
+        if self._support is None:
+            self._support = self._findSupport()
+        return self._support
+    def _findSupport(self):
+        n = self.n
+        x, z, r = self.x[n:].copy(), self.z[n:].copy(), self.r[n:].copy()
+        # Gaussian elimination of the X parts, the pivot rows generate the span
+        k = self._eliminate(x, z, r, x, 0)
+        # The remaining rows are +-Z products fixing the parity of outputs
+        rank = self._eliminate(x, z, r, z, k)
+        offset = np.zeros(n, dtype=bool)
+        zRows = np.unpackbits(z[k:rank], axis=1, count=n).astype(bool)
+        pivots = np.argmax(zRows, axis=1)
+        offset[pivots] = r[k:rank].astype(bool)
+        basis = np.unpackbits(x[:k], axis=1, count=n).astype(bool)
+        return offset, basis
+    def _eliminate(self, x, z, r, bitsOf, start):
+        ''' Reduce rows start.. of the tableau (x, z, r) to reduced row echelon
+            form in the bit array bitsOf (x or z).  Returns the index after
+            the last pivot row. '''
+        row = start
+        for a in range(self.n):
+            col = self._col(bitsOf, a)
+            candidates = np.flatnonzero(col[row:]) + row
+            if not len(candidates):
+                continue
+            p = candidates[0]
+            if p != row:
+                for array in (x, z, r):
+                    array[[row, p]] = array[[p, row]]
+                col[[row, p]] = col[[p, row]]
+            targets = np.flatnonzero(col[start:]) + start
+            targets = targets[targets != row]
+            if len(targets):
+                _rowsum(x, z, r, targets, row)
+            row += 1
+            if row >= len(x):
+                break
+        return row
+
+    def _pauliRow(self, xAxes, zAxes):
+        ''' Packed X and Z parts of a Pauli string '''
+        nBytes = self.x.shape[1]
+        px, pz = np.zeros(nBytes, dtype=np.uint8), np.zeros(nBytes, dtype=np.uint8)
+        for row, axes in ((px, xAxes), (pz, zAxes)):
+            for a in axes:
+                row[a >> 3] |= np.uint8(1 << (7 - (a & 7)))
+        return px, pz
+    def expectations(self, terms):
+        ''' Coefficient times expectation of each weighted Pauli string, see
+            observable.pauliExpectations().  A Pauli string anticommuting with
+            a stabilizer has expectation 0.  Otherwise it is, up to sign, the
+            product of the stabilizers whose destabilizers anticommute with
+            it, and the sign of that product is the expectation. '''
+        from observable import parseTerms
+        n = self.n
+        values = np.zeros(len(terms))
+        for i, (coef, xAxes, zAxes, _) in enumerate(parseTerms(terms, n)):
+            px, pz = self._pauliRow(xAxes, zAxes)
+            anti = (_popcount[(self.x & pz) ^ (self.z & px)].sum(axis=1) & 1).astype(bool)
+            if anti[n:].any():
+                continue
+            sign = self._productSign(np.flatnonzero(anti[:n]) + n)
+            values[i] = coef * (1 - 2*sign)
+        return values
+    def probs(self):
+        ''' Probabilities of all 2**n outputs in qubit order '''
+        if self.n > maxEnumerateBits:
+            raise SimulationError('Too many outputs ({}) to list'.format(2**self.n))
+        return self.marginalProbs(range(self.n))
+    def bitProbs(self):
+        ''' Probability of measuring 1 on each qubit '''
+        return np.array([self.probOfMeasureBit(a, state=1) for a in range(self.n)])
+    def marginalProbs(self, bits):
+        ''' Probability of each output of the given qubits (big endian, the
+            first most significant).  They are uniform over the outputs of
+            the support restricted to the qubits. '''
+        bits = [int(b) for b in bits]
+        offset, basis = self.support()
+        basis = _rowBasis(basis[:, bits])
+        k = len(basis)
+        if k > maxEnumerateBits:
+            raise SimulationError('Too many outputs ({}) to list'.format(2**k))
+        combos = (np.arange(2**k)[:, None] >> np.arange(k-1, -1, -1)) & 1
+        outputs = ((combos @ basis) % 2).astype(bool) ^ offset[bits]
+        probs = np.zeros(2**len(bits))
+        probs[bitsToIndices(outputs)] = 0.5**k
+        return probs
+    def registerProbs(self, asArrays=False, topK=None, threshold=1e-10):
+        offset, basis = self.support()
+        k = len(basis)
+        prob = 0.5**k
+        if prob <= threshold:
+            count = 0
+        else:
+            count = 2**k if topK is None else min(topK, 2**k)
+        if count > 2**maxEnumerateBits:
+            raise SimulationError('Too many outputs ({}) to list'.format(2**k))
+        combos = np.zeros((count, k), dtype=np.float64)
+        low = min(k, 62)
+        combos[:, k-low:] = (np.arange(count)[:, None] >> np.arange(low-1, -1, -1)) & 1
+        bits = ((combos @ basis) % 2).astype(bool) ^ offset
+        indices = bitsToIndices(bits, self.measureOrder)
+        sortI = np.argsort(indices, kind='stable')
+        indices, probs = indices[sortI], np.full(count, prob)
+        if asArrays:
+            return indices, probs
+        return {util.toTupleBE(int(i), self.n): v for i, v in zip(indices, np.round(probs, 5))}
+    def sampleBits(self, shots, seed=None):
+        ''' Sample shots measurements of every qubit.  Returns a bool array of
+            shape (shots, n) in qubit order. '''
+        rng = np.random.default_rng(seed)
+        offset, basis = self.support()
+        combos = rng.integers(0, 2, size=(shots, len(basis))).astype(np.float64)
+        return ((combos @ basis) % 2).astype(bool) ^ offset
+    def sample(self, shots, seed=None):
+        outputs = bitsToIndices(self.sampleBits(shots, seed), self.measureOrder)
+        return np.unique(outputs, return_counts=True)
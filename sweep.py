@@ -0,0 +1,127 @@
+'''
+Batched simulation of one circuit shape over many parameter values
+
+Example:
+```
+    import numpy as np
+    from circuit import QuantumCircuit
+    from gate import *
+    from sweep import sweep
+
+    theta = Param('theta')
+    circuit = QuantumCircuit(2)
+    reg = circuit[:]
+
+    H(reg[0])
+    CRz(theta)(reg[0], reg[1])
+    Rx(theta)(reg[1])
+    M(reg)
+
+    result = sweep(circuit, {'theta': np.linspace(0, 2*np.pi, 1000)})
+    print(result.registerProbs().shape)  # (1000, 4)
+```
+'''
+
+import numpy as np
+
+import gate
+from gate import Param
+import gateOperators
+from fullStateUtil import *
+from simFullState import SimulationError, findGateOp, findGateKernel, findMeasureOrder
+
+
+def circuitParams(circuit):
+    ''' Return the Params used by the circuit in order of first appearance '''
+    params = {}
+    for gateInst in circuit.history:
+        for arg in gateInst.args:
+            if isinstance(arg, Param):
+                params.setdefault(arg, None)
+    return list(params)
+
+def _paramValues(circuit, values):
+    if isinstance(values, dict):
+        values = {Param(k) if not isinstance(k, Param) else k: np.asarray(v, dtype=float)
+                  for k, v in values.items()}
+    else:
+        values = np.asarray(values, dtype=float)
+        params = circuitParams(circuit)
+        if values.ndim != 2 or values.shape[1] != len(params):
+            raise SimulationError('Expected values of shape (batch, {})'.format(len(params)))
+        values = dict(zip(params, values.T))
+    lengths = {len(v) for v in values.values()}
+    if len(lengths) != 1:
+        raise SimulationError('Every parameter needs the same number of values')
+    return values, lengths.pop()
+
+def sweep(circuit, values, ignoreMGates=False, dtype=None):
+    ''' Simulate the circuit once for each set of parameter values.
+
+        values: Either a dict mapping each Param (or its name) to an array of
+                values or an array of shape (batch, numParams) with columns in
+                the order of circuitParams(circuit).
+
+        All points evolve together as one (batch, 2**n) state block.  Gates
+        without Param arguments are shared by the whole batch.
+
+        dtype: State precision, e.g. numpy.complex64 (default complex128)
+    '''
+    values, batch = _paramValues(circuit, values)
+    n = circuit.n
+    history = circuit.history
+    result = SweepResult(n, batch, dtype=dtype)
+    if not ignoreMGates:
+        measureCount = circuit.countM()
+        result.measureOrder = findMeasureOrder(history, n, measureCount)
+        if measureCount > (n if result.measureOrder else 0):
+            raise SimulationError('Mid-circuit measurements are not supported in sweeps')
+
+    shapedPsi = result.psi.reshape((batch,) + (2,)*n)
+    for gateInst in history:
+        if gateInst.instanceOf(gate.M):
+            continue
+        bits = tuple(gateInst.bits)
+        if any(isinstance(arg, Param) for arg in gateInst.args):
+            try:
+                args = tuple(values[arg] if isinstance(arg, Param) else arg
+                             for arg in gateInst.args)
+            except KeyError as e:
+                raise SimulationError('No values given for parameter {}'.format(e.args[0])) from None
+            gates = findGateOp(gateInst.name, args, result.psi.dtype)
+            if gateInst.name in gateOperators.diagonalGates:
+                applyDiagonalStack(shapedPsi, np.diagonal(gates, axis1=1, axis2=2), bits)
+            else:
+                applyGateStack(shapedPsi, gates, bits)
+            continue
+        gateOp = findGateOp(gateInst.name, gateInst.args, result.psi.dtype)
+        kind, data = findGateKernel(gateInst.name, gateInst.args, gateOp)
+        axes = tuple(b+1 for b in bits)
+        if kind == 'diagonal':
+            applyDiagonal(shapedPsi, data, axes)
+        elif kind == 'permutation':
+            applyPermutation(shapedPsi, *data, axes)
+        else:
+            applyGateTensor(shapedPsi, gateOp, axes)
+    return result
+
+
+class SweepResult:
+    def __init__(self, n, batch, dtype=None):
+        self.n = n
+        self.batch = batch
+        self.psi = np.zeros((batch, 2**n), dtype=stateDtype if dtype is None else dtype)
+        self.psi[:,0] = 1
+        self.measureOrder = None
+    def __repr__(self):
+        return 'SweepResult(n={}, batch={})'.format(self.n, self.batch)
+
+    def registerProbs(self):
+        ''' Array of shape (batch, 2**n) with the normalized probability of each
+            output.  Outputs are indexed big endian in measurement order. '''
+        probs = (self.psi.conj() * self.psi).real
+        if self.measureOrder:
+            shape = (self.batch,) + (2,)*self.n
+            order = (0,) + tuple(int(b)+1 for b in self.measureOrder)
+            probs = probs.reshape(shape).transpose(order).reshape(self.batch, -1)
+        return probs / np.sum(probs, axis=1, keepdims=True)
@@ -0,0 +1,69 @@
+''' Seeded random circuits and state comparisons shared by the tests '''
+
+import numpy as np
+
+from circuit import QuantumCircuit
+from gate import *
+
+
+cliffordSingle = (H, X, Y, Z, S, Sd)
+cliffordDouble = (CX, SWAP)
+otherSingle = (T, Td)
+rotations = (Rx, Ry, Rz)
+
+
+def randomCircuit(n, numGates, seed=0, clifford=False, midMeasure=0, measure=True):
+    ''' Random circuit of numGates gates on n qubits, with midMeasure
+        measurements at random places and, if measure, every qubit measured
+        at the end '''
+    rng = np.random.default_rng(seed)
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    measureAt = set(rng.choice(numGates, midMeasure, replace=False)) if midMeasure else set()
+    for i in range(numGates):
+        if i in measureAt:
+            M(reg[int(rng.integers(n))])
+        kind = int(rng.integers(4)) if n >= 3 else int(rng.integers(3))
+        bits = [reg[int(b)] for b in rng.choice(n, min(n, 3), replace=False)]
+        if kind == 0 or n < 2:
+            gates = cliffordSingle if clifford else cliffordSingle + otherSingle
+            gates[int(rng.integers(len(gates)))](bits[0])
+        elif kind == 1:
+            cliffordDouble[int(rng.integers(len(cliffordDouble)))](bits[0], bits[1])
+        elif clifford:
+            cliffordSingle[int(rng.integers(len(cliffordSingle)))](bits[0])
+        elif kind == 2:
+            rotations[int(rng.integers(len(rotations)))](float(rng.uniform(0, 2*np.pi)))(bits[0])
+        else:
+            CCX(*bits)
+    if measure:
+        M(reg)
+    return circuit
+
+def layeredCircuit(n, layers):
+    ''' Alternating layers of dense single qubit gates and CX chains '''
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    for l in range(layers):
+        H(reg)
+        for bit in reg:
+            Ry(np.pi/(l+3))(bit)
+        for i in range(l % 2, n-1, 2):
+            CX(reg[i], reg[i+1])
+    return circuit
+
+def randomTerms(n, count, seed=0):
+    ''' Weighted random Pauli strings with a few fixed ones '''
+    rng = np.random.default_rng(seed)
+    terms = [(float(rng.normal()), ''.join(rng.choice(list('IXYZ'), n))) for _ in range(count)]
+    return terms + ['Z'*n, 'X'*n, 'Y' + 'I'*(n-1), {n-1: 'Z'}]
+
+def normalized(psi):
+    ''' psi scaled to norm 1 with the phase of its largest amplitude removed '''
+    psi = np.asarray(psi)
+    i = np.argmax(np.abs(psi))
+    return psi * (abs(psi[i]) / psi[i]) / np.linalg.norm(psi)
+
+def assertSameState(psi, reference, tol=1e-10):
+    ''' Assert the states are equal up to global phase and scale '''
+    np.testing.assert_allclose(normalized(psi), normalized(reference), atol=tol)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import simFullState
+from randomCircuits import randomCircuit, layeredCircuit, randomTerms, assertSameState
+
+
+def simulateBoth(circuit, seed=None, **blockedArgs):
+    tensor = simFullState.simulate(circuit, engine='tensor', seed=seed)
+    blocked = simFullState.simulate(circuit, engine='blocked', seed=seed, blockBits=4,
+                                    **blockedArgs)
+    return tensor, blocked
+
+def assertSameResult(tensor, blocked):
+    assertSameState(blocked.psi, tensor.psi)
+    np.testing.assert_allclose(blocked.probs(), tensor.probs(), atol=1e-12)
+    for bits in ([0], [9, 2], [3, 7, 5]):
+        np.testing.assert_allclose(blocked.marginalProbs(bits), tensor.marginalProbs(bits),
+                                   atol=1e-12)
+    terms = randomTerms(tensor.n, 20)
+    np.testing.assert_allclose(blocked.expectations(terms), tensor.expectations(terms),
+                               atol=1e-12)
+
+def testRelabelMatchesTensor():
+    tensor, blocked = simulateBoth(layeredCircuit(10, 6))
+    assert blocked.blockStats.relabels > 0
+    assertSameResult(tensor, blocked)
+
+def testDirectGatesMatchTensor():
+    tensor, blocked = simulateBoth(layeredCircuit(10, 6), minRelabelGain=10**6)
+    assert blocked.blockStats.relabels == 0
+    assert blocked.blockStats.directGates > 0
+    assertSameResult(tensor, blocked)
+
+@pytest.mark.parametrize('seed', range(3))
+def testRandomCircuitMatchesTensor(seed):
+    tensor, blocked = simulateBoth(randomCircuit(10, 80, seed=seed))
+    assertSameResult(tensor, blocked)
+    assert blocked.registerProbs() == tensor.registerProbs()
+
+def testMidCircuitMeasurement():
+    circuit = randomCircuit(10, 80, seed=3, midMeasure=3)
+    tensor, blocked = simulateBoth(circuit, seed=4)
+    assert blocked.previousMeasurements() == tensor.previousMeasurements()
+    assertSameResult(tensor, blocked)
+
+def testRepr():
+    _, blocked = simulateBoth(layeredCircuit(6, 1))
+    assert repr(blocked) == 'BlockedState(n=6, blockBits=4)'
@@ -0,0 +1,44 @@
+from circuit import QuantumCircuit
+import circuitFile
+from gate import *
+
+
+def mixedCircuit():
+    circuit = QuantumCircuit(3)
+    reg = circuit[:]
+    H(reg)
+    Rz(1)(reg[0])
+    Ry(0.5)(reg[1])
+    Rz(1+0.5j)(reg[2])
+    Ry(Param('theta'))(reg[0])
+    anc = circuit.borrowAncilla(2)
+    CCX(reg[0], reg[1], anc[0])
+    CX(anc[0], anc[1])
+    CX(anc[0], anc[1])
+    CCX(reg[0], reg[1], anc[0])
+    circuit.returnAncilla(anc)
+    M(reg)
+    return circuit
+
+def testRoundTrip(tmp_path):
+    circuit = mixedCircuit()
+    fileName = str(tmp_path / 'mixed.qcirc')
+    circuitFile.writeCircuit(circuit, fileName)
+    for mmap in (False, True):
+        loaded = circuitFile.readCircuit(fileName, mmap=mmap)
+        assert loaded.n == circuit.n
+        assert list(loaded.history) == list(circuit.history)
+        assert [repr(g) for g in loaded.history] == [repr(g) for g in circuit.history]
+        assert loaded.regNames == circuit.regNames
+        assert loaded.ancillaBits == circuit.ancillaBits
+        assert loaded.availableAncillaBits == circuit.availableAncillaBits
+        assert loaded.ancillaReturns == circuit.ancillaReturns
+
+def testIterGates(tmp_path):
+    circuit = mixedCircuit()
+    fileName = str(tmp_path / 'mixed.qcirc')
+    circuitFile.writeCircuit(circuit, fileName)
+    n, gateInsts = circuitFile.iterGates(fileName, blockSize=3)
+    assert n == circuit.n
+    assert [(g.name, g.args, tuple(g.bits)) for g in gateInsts] == \
+        [(g.name, g.args, tuple(int(b) for b in g.bits)) for g in circuit.history]
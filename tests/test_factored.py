@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+import simFullState
+from simFullState import SimulationError
+from randomCircuits import randomCircuit, randomTerms, assertSameState
+
+
+def groupedCircuit(groups, size, seed=0):
+    ''' Random circuits on separate groups of qubits, interleaved '''
+    rng = np.random.default_rng(seed)
+    circuit = QuantumCircuit(groups * size)
+    reg = circuit[:]
+    for _ in range(20 * groups):
+        g = int(rng.integers(groups))
+        a, b = (reg[g*size + int(q)] for q in rng.choice(size, 2, replace=False))
+        Ry(float(rng.uniform(0, np.pi)))(a)
+        CX(a, b)
+    M(reg)
+    return circuit
+
+@pytest.mark.parametrize('seed', range(4))
+def testRandomCircuitMatchesTensor(seed):
+    circuit = randomCircuit(7, 50, seed=seed)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    factored = simFullState.simulate(circuit, engine='factored')
+    assertSameState(factored.jointState(), tensor.psi)
+    assert factored.registerProbs() == tensor.registerProbs()
+    np.testing.assert_allclose(factored.probs(), tensor.probs(), atol=1e-12)
+    np.testing.assert_allclose(factored.bitProbs(), tensor.bitProbs(), atol=1e-12)
+    for bits in ([2], [6, 0], [1, 5, 3]):
+        np.testing.assert_allclose(factored.marginalProbs(bits), tensor.marginalProbs(bits),
+                                   atol=1e-12)
+
+def testGroupsStaySeparate():
+    circuit = groupedCircuit(4, 3)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    factored = simFullState.simulate(circuit, engine='factored')
+    assert len(factored.components) == 4
+    assert factored.largestComponent == 3
+    assertSameState(factored.jointState(), tensor.psi)
+    np.testing.assert_allclose(factored.probs(), tensor.probs(), atol=1e-12)
+    tIndices, tProbs = tensor.registerProbs(asArrays=True)
+    fIndices, fProbs = factored.registerProbs(asArrays=True)
+    np.testing.assert_array_equal(fIndices, tIndices)
+    np.testing.assert_allclose(fProbs, tProbs, atol=1e-12)
+    outputs, counts = factored.sample(500, seed=1)
+    assert counts.sum() == 500
+    assert set(outputs.tolist()) <= set(tIndices.tolist())
+
+def testExpectationsMatchTensor():
+    for circuit in (randomCircuit(6, 40, seed=7), groupedCircuit(3, 2, seed=8)):
+        terms = randomTerms(6, 40, seed=9)
+        tensor = simFullState.simulate(circuit, engine='tensor')
+        factored = simFullState.simulate(circuit, engine='factored')
+        np.testing.assert_allclose(factored.expectations(terms), tensor.expectations(terms),
+                                   atol=1e-12)
+
+def testMidCircuitMeasurement():
+    circuit = randomCircuit(6, 40, seed=5, midMeasure=3)
+    tensor = simFullState.simulate(circuit, engine='tensor', seed=6)
+    factored = simFullState.simulate(circuit, engine='factored', seed=6)
+    assert factored.previousMeasurements() == tensor.previousMeasurements()
+    assertSameState(factored.jointState(), tensor.psi)
+
+def testMaxComponentQubits():
+    with pytest.raises(SimulationError):
+        simFullState.simulate(groupedCircuit(2, 4), engine='factored', maxComponentQubits=3)
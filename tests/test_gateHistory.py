@@ -0,0 +1,58 @@
+import numpy as np
+
+from circuit import QuantumCircuit
+from gate import *
+from gateHistory import GateHistory
+
+
+def mixedArgsCircuit():
+    circuit = QuantumCircuit(3)
+    reg = circuit[:]
+    H(reg)
+    Rz(1)(reg[0])
+    Ry(0.5)(reg[1])
+    Rx(np.float64(0.25))(reg[2])
+    CRz(0.1)(reg[0], reg[2])
+    Rz(1+0.5j)(reg[1])
+    Ry(Param('theta'))(reg[0])
+    CX(reg[0], reg[1])
+    return circuit
+
+def testArgsRoundTrip():
+    gateInsts = list(mixedArgsCircuit().history)
+    history = GateHistory(gateInsts, qubits=mixedArgsCircuit())
+    assert list(history) == gateInsts
+    assert [repr(g) for g in history] == [repr(g) for g in gateInsts]
+    for g, original in zip(history, gateInsts):
+        assert [type(a) for a in g.args] == [type(a) for a in original.args]
+    assert history[4] == gateInsts[4]
+
+def testFloatArgsAreColumnar():
+    history = GateHistory(mixedArgsCircuit().history)
+    assert history.columns()[4].tolist() == [0.5, 0.25, 0.1]
+    assert sorted(history._objArgs) == [3, 7, 8]  # Rz(1), Rz(1+0.5j), Ry(theta)
+
+def testAppendAfterReading():
+    circuit = mixedArgsCircuit()
+    gateInsts = list(circuit.history)
+    history = GateHistory(qubits=circuit)
+    for i, g in enumerate(gateInsts):
+        history.append(g)
+        assert history[i] == g
+        assert len(history) == i+1
+    assert list(history) == gateInsts
+    assert history.countName('H') == 3
+
+def testManyAppends():
+    circuit = QuantumCircuit(4)
+    reg = circuit[:]
+    angles = np.linspace(0, 1, 5000)
+    for i, angle in enumerate(angles):
+        Rz(angle)(reg[i%4])
+        CX(reg[i%4], reg[(i+1)%4])
+    history = circuit.history
+    assert len(history) == 10000
+    assert history.countName('Rz') == history.countName('CX') == 5000
+    assert not history._objArgs
+    np.testing.assert_array_equal(history.columns()[4], angles)
+    assert history[-2] == Rz(angles[-1]).makeInstance((reg[3],))
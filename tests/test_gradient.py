@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+from gradient import adjointGradient
+from observable import pauliExpectations
+from simFullState import SimulationError
+import sweep
+
+
+terms = [(1.0, 'ZZIZ'), (0.5, 'XIXI'), (-0.7, 'IYZX'), (0.3, {2: 'Y'})]
+
+def paramCircuit():
+    ''' Every differentiable gate, with theta used twice '''
+    circuit = QuantumCircuit(4)
+    reg = circuit[:]
+    H(reg)
+    theta = Param('theta')
+    Rx(theta)(reg[0])
+    Ry(Param('ry'))(reg[1])
+    CX(reg[0], reg[2])
+    Rz(Param('rz'))(reg[2])
+    CRz(Param('crz'))(reg[1], reg[3])
+    Ry(0.4)(reg[3])
+    CCRz(Param('ccrz'))(reg[3], reg[0], reg[1])
+    P(Param('p'))(reg[0])
+    H(reg[2])
+    Ry(theta)(reg[2])
+    CX(reg[2], reg[3])
+    M(reg)
+    return circuit
+
+def energy(circuit, values):
+    psi = sweep.sweep(circuit, values[None, :], ignoreMGates=True).psi[0]
+    return pauliExpectations(psi, terms).sum()
+
+def finiteDifferences(circuit, values, eps=1e-6):
+    steps = np.identity(len(values)) * eps
+    return np.array([(energy(circuit, values + d) - energy(circuit, values - d)) / (2*eps)
+                     for d in steps])
+
+@pytest.mark.parametrize('seed', range(3))
+def testMatchesFiniteDifferences(seed):
+    circuit = paramCircuit()
+    params = sweep.circuitParams(circuit)
+    assert sorted(p.name for p in params) == ['ccrz', 'crz', 'p', 'ry', 'rz', 'theta']
+    values = np.random.default_rng(seed).uniform(0, 2*np.pi, len(params))
+    value, grad = adjointGradient(circuit, values, terms)
+    assert value == pytest.approx(energy(circuit, values))
+    np.testing.assert_allclose(grad, finiteDifferences(circuit, values), atol=1e-8)
+    assert grad[params.index(Param('p'))] == pytest.approx(0)  # Global phase
+
+def testValuesByName():
+    circuit = paramCircuit()
+    params = sweep.circuitParams(circuit)
+    values = np.linspace(0.1, 1.2, len(params))
+    byName = {p.name: v for p, v in zip(params, values)}
+    np.testing.assert_allclose(adjointGradient(circuit, byName, terms)[1],
+                               adjointGradient(circuit, values, terms)[1])
+
+def testMissingValues():
+    circuit = paramCircuit()
+    with pytest.raises(SimulationError):
+        adjointGradient(circuit, [0.1, 0.2], terms)
+    with pytest.raises(SimulationError):
+        adjointGradient(circuit, {'theta': 0.1}, terms)
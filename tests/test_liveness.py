@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+from liveness import RemapStats, allocateQubits, liveRanges, remapCircuit
+import simFullState
+from randomCircuits import randomCircuit
+
+
+def ancillaCircuit(n=4, rounds=5):
+    ''' Each ancilla pair is held until the next pair is borrowed '''
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg)
+    held = None
+    for i in range(rounds):
+        anc = circuit.borrowAncilla(2)
+        CCX(reg[i%n], reg[(i+1)%n], anc[0])
+        CX(anc[0], anc[1])
+        CRz(0.3)(anc[1], reg[(i+2)%n])
+        CX(anc[0], anc[1])
+        CCX(reg[i%n], reg[(i+1)%n], anc[0])
+        Ry(0.2)(reg[i%n])
+        if held:
+            circuit.returnAncilla(held)
+        held = anc
+    circuit.returnAncilla(held)
+    M(circuit[:])
+    return circuit
+
+def testLiveRangesSplitAtReturns():
+    circuit = QuantumCircuit(2)
+    r0, r1 = circuit[:]
+    anc, = circuit.borrowAncilla(1)
+    H(r0)
+    CX(r0, anc)
+    CX(r0, anc)
+    circuit.returnAncilla([anc])
+    anc, = circuit.borrowAncilla(1)
+    CX(r1, anc)
+    CX(r1, anc)
+    circuit.returnAncilla([anc])
+    assert circuit.ancillaReturns == [(3, 2), (5, 2)]
+    rangeOf, first, last, released = liveRanges(circuit.history, 3,
+                                                returns=circuit.ancillaReturns)
+    # Three ranges per qubit: before, between and after the two returns
+    assert rangeOf.tolist() == [0, 0, 6, 0, 6, 3, 7, 3, 7]
+    assert first.tolist() == [0, -1, -1, 3, -1, -1, 1, 3, -1]
+    assert last.tolist() == [2, -1, -1, 4, -1, -1, 2, 4, -1]
+    assert released.tolist() == [False]*6 + [True, True, False]
+    physicalOf, width = allocateQubits(first, last, released)
+    assert width == 3  # r1 and the second use of anc start together
+
+def testReturnedAncillaIsReused():
+    circuit = QuantumCircuit(2)
+    r0, r1 = circuit[:]
+    anc, = circuit.borrowAncilla(1)
+    H(r0)
+    CX(r0, anc)
+    CX(r0, anc)
+    circuit.returnAncilla([anc])
+    H(r1)
+    CX(r1, r0)
+    M(circuit[:])
+    stats = RemapStats()
+    remapped = remapCircuit(circuit, stats=stats)
+    assert (stats.n, stats.width) == (3, 2)
+    assert stats.qubitMap.tolist() == [0, 1, -1]
+    assert [g.bits for g in remapped.history] == [(0,), (0, 1), (0, 1), (1,), (1, 0),
+                                                  (0,), (1,)]
+
+@pytest.mark.parametrize('seed', range(4))
+def testNoSavingKeepsQubitOrder(seed):
+    circuit = randomCircuit(7, 40, seed=seed)
+    stats = RemapStats()
+    remapped = remapCircuit(circuit, stats=stats)
+    assert stats.width == 7
+    assert stats.qubitMap.tolist() == list(range(7))
+    assert list(remapped.history) == list(circuit.history)
+
+def testRemapMatchesOriginal():
+    circuit = ancillaCircuit()
+    result = simFullState.simulate(circuit)
+    remapped = simFullState.simulate(circuit, remap=True)
+    stats = remapped.remapStats
+    assert stats.width < stats.n
+    assert stats.qubitMap[:4].tolist() == [0, 1, 2, 3]
+    # Returned ancillas read 0 and are measured last in the remapped circuit
+    k = stats.width - 4
+    expected = {}
+    for key, p in result.registerProbs().items():
+        assert not any(key[4:])
+        expected[key[:4] + (0,)*k] = p
+    assert expected.keys() == remapped.registerProbs().keys()
+    for key, p in remapped.registerProbs().items():
+        assert p == pytest.approx(expected[key])
+    np.testing.assert_allclose(remapped.marginalProbs(range(4)),
+                               result.marginalProbs(range(4)), atol=1e-12)
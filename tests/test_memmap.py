@@ -0,0 +1,60 @@
+import numpy as np
+
+import simFullState
+from randomCircuits import randomCircuit, assertSameState
+
+
+n = 12
+memoryBudget = 2**12  # Chunks of 2**5 amplitudes, so gates span chunks
+
+
+def simulateBoth(circuit, tmp_path, **kwargs):
+    tensor = simFullState.simulate(circuit, engine='tensor', **kwargs)
+    memmap = simFullState.simulate(circuit, engine='memmap', memoryBudget=memoryBudget,
+                                   tempDir=str(tmp_path), **kwargs)
+    return tensor, memmap
+
+def testChunksAreSmall(tmp_path):
+    _, memmap = simulateBoth(randomCircuit(n, 10), tmp_path)
+    assert memmap.chunkBits < n - 3
+
+def testStateMatchesTensor(tmp_path):
+    for seed in range(3):
+        tensor, memmap = simulateBoth(randomCircuit(n, 80, seed=seed), tmp_path)
+        assertSameState(np.array(memmap.psi), tensor.psi)
+
+def testProbsMatchTensor(tmp_path):
+    tensor, memmap = simulateBoth(randomCircuit(n, 80, seed=3), tmp_path)
+    assert isinstance(memmap.probs(), np.memmap)
+    np.testing.assert_allclose(memmap.probs(), tensor.probs(), atol=1e-12)
+    np.testing.assert_allclose(memmap.bitProbs(), tensor.bitProbs(), atol=1e-12)
+    bits = [11, 0, 6]
+    np.testing.assert_allclose(memmap.marginalProbs(bits), tensor.marginalProbs(bits),
+                               atol=1e-12)
+    tIndices, tProbs = tensor.registerProbs(asArrays=True)
+    mIndices, mProbs = memmap.registerProbs(asArrays=True)
+    np.testing.assert_array_equal(mIndices, tIndices)
+    np.testing.assert_allclose(mProbs, tProbs, atol=1e-12)
+
+def testSamplesMatchTensor(tmp_path):
+    tensor, memmap = simulateBoth(randomCircuit(n, 80, seed=4), tmp_path)
+    tOutputs, tCounts = tensor.sample(2000, seed=5)
+    mOutputs, mCounts = memmap.sample(2000, seed=5)
+    np.testing.assert_array_equal(mOutputs, tOutputs)
+    np.testing.assert_array_equal(mCounts, tCounts)
+
+def testMidCircuitMeasurement(tmp_path):
+    circuit = randomCircuit(n, 60, seed=6, midMeasure=3)
+    tensor, memmap = simulateBoth(circuit, tmp_path, seed=7)
+    assert memmap.previousMeasurements() == tensor.previousMeasurements()
+    assertSameState(np.array(memmap.psi), tensor.psi)
+
+def testContinueOnMoreQubits(tmp_path):
+    first, second = randomCircuit(6, 40, seed=8, measure=False), randomCircuit(9, 40, seed=9)
+    tensor = simFullState.simulate(first, engine='tensor').continueSim(second)
+    memmap = simFullState.simulate(first, engine='memmap', memoryBudget=2**14,
+                                   tempDir=str(tmp_path)).continueSim(second)
+    assert isinstance(memmap.psi, np.memmap)
+    assert memmap.chunkBits == 7  # 6 before resizing
+    assertSameState(np.array(memmap.psi), tensor.psi)
+    np.testing.assert_allclose(memmap.probs(), tensor.probs(), atol=1e-12)
@@ -0,0 +1,41 @@
+import functools
+import numpy as np
+import pytest
+
+from observable import applyPauliSum, pauliExpectations
+from randomCircuits import randomTerms
+
+
+pauliMatrices = {'I': np.identity(2), 'X': np.array([[0, 1], [1, 0]]),
+                 'Y': np.array([[0, -1j], [1j, 0]]), 'Z': np.diag([1, -1])}
+
+def pauliMatrix(pauli, n):
+    if isinstance(pauli, dict):
+        pauli = ''.join(pauli.get(q, 'I') for q in range(n))
+    return functools.reduce(np.kron, (pauliMatrices[letter] for letter in pauli))
+
+def randomState(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=2**n) + 1j*rng.normal(size=2**n)
+
+def withCoefs(terms):
+    return [term if isinstance(term, tuple) else (1.0, term) for term in terms]
+
+@pytest.mark.parametrize('chunkBits', (2, 4, 20))
+def testExpectationsMatchMatrices(chunkBits):
+    n = 6
+    psi = randomState(n)
+    terms = withCoefs(randomTerms(n, 30))
+    values = pauliExpectations(psi, terms, chunkBits=chunkBits)
+    expected = [coef * np.vdot(psi, pauliMatrix(p, n) @ psi).real / np.vdot(psi, psi).real
+                for coef, p in terms]
+    np.testing.assert_allclose(values, expected, atol=1e-12)
+
+@pytest.mark.parametrize('chunkBits', (2, 4, 20))
+def testApplyPauliSumMatchesMatrices(chunkBits):
+    n = 6
+    psi = randomState(n, seed=1)
+    terms = withCoefs(randomTerms(n, 10, seed=1))
+    expected = sum(coef * pauliMatrix(p, n) @ psi for coef, p in terms)
+    np.testing.assert_allclose(applyPauliSum(psi, terms, chunkBits=chunkBits), expected,
+                               atol=1e-12)
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+from optimize import OptimizeStats, checkEquivalence, optimizeCircuit
+from randomCircuits import randomCircuit
+
+
+def optimized(build, n=3):
+    ''' Return (names of the optimized gates, stats, circuit, optimized circuit) '''
+    circuit = QuantumCircuit(n)
+    build(circuit[:])
+    stats = OptimizeStats()
+    other = optimizeCircuit(circuit, stats=stats)
+    return [(g.name, tuple(int(b) for b in g.bits)) for g in other.history], stats, circuit, other
+
+def withInversePairs(seed, n=6, numGates=60):
+    ''' A random circuit with inverse pairs and split rotations mixed in '''
+    rng = np.random.default_rng(seed)
+    circuit = randomCircuit(n, numGates, seed=seed, measure=False)
+    reg = circuit[:]
+    for _ in range(numGates // 2):
+        a, b, c = (reg[int(q)] for q in rng.choice(n, 3, replace=False))
+        kind = int(rng.integers(6))
+        if kind == 0:
+            H(a); H(a)
+        elif kind == 1:
+            CX(a, b); Rz(0.4)(c); CX(a, b)
+        elif kind == 2:
+            S(a); Sd(a)
+        elif kind == 3:
+            Ry(0.7)(a); Ry(-0.2)(a)
+        elif kind == 4:
+            CCX(a, b, c); CCX(b, a, c)
+        else:
+            Rx(np.pi)(a); Rx(np.pi)(a)
+    return circuit
+
+
+@pytest.mark.parametrize('seed', range(8))
+def testRandomCircuitsStayEquivalent(seed):
+    circuit = withInversePairs(seed)
+    stats = OptimizeStats()
+    other = optimizeCircuit(circuit, stats=stats)
+    assert stats.gatesOut < stats.gatesIn
+    assert checkEquivalence(circuit, other)
+
+@pytest.mark.parametrize('seed', range(4))
+def testRandomCircuitsWithMidMeasurement(seed):
+    circuit = randomCircuit(5, 60, seed=seed, midMeasure=3)
+    other = optimizeCircuit(circuit)
+    assert checkEquivalence(circuit, other)
+    assert other.countM() == circuit.countM()
+
+def testCancelSelfInverse():
+    for gate in (H, X, Y, Z):
+        gates, stats, _, _ = optimized(lambda reg: (gate(reg[0]), gate(reg[0])))
+        assert gates == [] and stats.cancelled == 2
+    gates, _, _, _ = optimized(lambda reg: (CX(reg[0], reg[1]), CX(reg[0], reg[1])))
+    assert gates == []
+
+def testCancelInversePairs():
+    for a, b in ((S, Sd), (Sd, S), (T, Td), (Td, T)):
+        gates, _, _, _ = optimized(lambda reg: (a(reg[1]), b(reg[1])))
+        assert gates == []
+    gates, _, _, _ = optimized(lambda reg: (S(reg[1]), S(reg[1])))
+    assert gates == [('S', (1,)), ('S', (1,))]
+
+def testBitOrder():
+    gates, _, _, _ = optimized(lambda reg: (CX(reg[0], reg[1]), CX(reg[1], reg[0])))
+    assert len(gates) == 2
+    gates, _, _, _ = optimized(lambda reg: (SWAP(reg[0], reg[1]), SWAP(reg[1], reg[0])))
+    assert gates == []
+    gates, _, _, _ = optimized(lambda reg: (CCX(reg[0], reg[1], reg[2]),
+                                            CCX(reg[1], reg[0], reg[2])))
+    assert gates == []
+    gates, _, _, _ = optimized(lambda reg: (CCX(reg[0], reg[1], reg[2]),
+                                            CCX(reg[0], reg[2], reg[1])))
+    assert len(gates) == 2
+
+def testMergeRotations():
+    gates, stats, circuit, other = optimized(lambda reg: (Rz(0.3)(reg[0]), Rz(0.4)(reg[0])))
+    assert gates == [('Rz', (0,))] and stats.merged == 1
+    assert other.history[0].args[0] == pytest.approx(0.7)
+    gates, _, _, _ = optimized(lambda reg: (CRz(0.3)(reg[0], reg[1]), CRz(0.2)(reg[1], reg[0])))
+    assert gates == [('CRz', (0, 1))]
+    gates, _, _, _ = optimized(lambda reg: (Rx(0.3)(reg[0]), Ry(0.4)(reg[0])))
+    assert len(gates) == 2
+
+def testDropTrivialRotations():
+    gates, stats, _, _ = optimized(lambda reg: (Rz(0.5)(reg[0]), Rz(-0.5)(reg[0])))
+    assert gates == [] and stats.dropped == 1
+    gates, _, _, _ = optimized(lambda reg: Ry(4*np.pi)(reg[0]))
+    assert gates == []
+    gates, _, _, _ = optimized(lambda reg: I1(reg[0]))
+    assert gates == []
+
+def testParamsAreNotMerged():
+    theta = Param('theta')
+    gates, _, _, _ = optimized(lambda reg: (Rz(theta)(reg[0]), Rz(0.2)(reg[0])))
+    assert len(gates) == 2
+
+def testAdjacencyThroughOtherQubits():
+    gates, _, circuit, other = optimized(lambda reg: (H(reg[0]), X(reg[1]), H(reg[0])))
+    assert gates == [('X', (1,))]
+    assert checkEquivalence(circuit, other)
+    gates, _, _, _ = optimized(lambda reg: (H(reg[0]), CX(reg[0], reg[1]), H(reg[0])))
+    assert len(gates) == 3
+
+def testCancellationExposesEarlierGates():
+    gates, _, circuit, other = optimized(lambda reg: (H(reg[0]), S(reg[0]), Sd(reg[0]),
+                                                      H(reg[0])))
+    assert gates == []
+
+def testMeasurementIsBarrier():
+    gates, _, _, _ = optimized(lambda reg: (H(reg[0]), M(reg[0]), H(reg[0])))
+    assert gates == [('H', (0,)), ('M', (0,)), ('H', (0,))]
+    gates, _, _, _ = optimized(lambda reg: (Rz(0.3)(reg[0]), M(reg[0]), Rz(-0.3)(reg[0])))
+    assert len(gates) == 3
+    gates, _, _, _ = optimized(lambda reg: (H(reg[0]), M(reg[1]), H(reg[0])))
+    assert gates == [('M', (1,))]
+
+def testAncillaReturnIsBarrier():
+    circuit = QuantumCircuit(2)
+    reg = circuit[:]
+    H(reg[0])
+    H(reg[0])
+    anc, = circuit.borrowAncilla(1)
+    CX(reg[0], anc)
+    X(anc)
+    circuit.returnAncilla([anc])
+    anc2, = circuit.borrowAncilla(1)
+    assert anc2 == anc
+    X(anc2)
+    CX(reg[1], anc2)
+    circuit.returnAncilla([anc2])
+    other = optimizeCircuit(circuit)
+    names = [g.name for g in other.history]
+    assert names == ['CX', 'X', 'X', 'CX']
+    # Return positions move with the gates removed before them
+    assert circuit.ancillaReturns == [(4, int(anc)), (6, int(anc))]
+    assert other.ancillaReturns == [(2, int(anc)), (4, int(anc))]
+    assert checkEquivalence(circuit, other)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from gate import *
+from prefixCache import PrefixCache
+import simFullState
+from randomCircuits import randomCircuit, assertSameState
+
+
+def circuitWithSuffix(suffixSeed, angle=0.3):
+    circuit = randomCircuit(8, 60, seed=0, measure=False)
+    Ry(angle)(circuit[3])
+    circuit.history += randomCircuit(8, 10, seed=suffixSeed, measure=False).history
+    return circuit
+
+def testCachedMatchesUncached():
+    cache = PrefixCache(snapshotEvery=20)
+    for suffixSeed in range(4):
+        circuit = circuitWithSuffix(suffixSeed)
+        reference = simFullState.simulate(circuit)
+        cached = simFullState.simulate(circuit, cache=cache)
+        assertSameState(cached.psi, reference.psi)
+    assert cache.hits == 3
+
+def testDistinctPrefixesHaveDistinctKeys():
+    a, b = circuitWithSuffix(1, 0.3), circuitWithSuffix(1, 0.3 + 1e-12)
+    hashesA = PrefixCache.prefixHashes(8, np.complex128, a.history, len(a.history))
+    hashesB = PrefixCache.prefixHashes(8, np.complex128, b.history, len(b.history))
+    assert hashesA[60] == hashesB[60]
+    assert hashesA[61] != hashesB[61]
+    cache = PrefixCache()
+    simFullState.simulate(a, cache=cache)
+    resumed = simFullState.simulate(b, cache=cache)
+    assertSameState(resumed.psi, simFullState.simulate(b).psi)
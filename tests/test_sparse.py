@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+import simFullState
+from simFullState import SimulationError
+from randomCircuits import randomCircuit, randomTerms, assertSameState
+
+
+def classicalCircuit(n, seed):
+    ''' A reversible circuit with a few branching gates '''
+    rng = np.random.default_rng(seed)
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg[0])
+    Ry(0.4)(reg[1])
+    for _ in range(60):
+        a, b, c = (reg[int(q)] for q in rng.choice(n, 3, replace=False))
+        kind = int(rng.integers(5))
+        if kind == 0:
+            X(a)
+        elif kind == 1:
+            CX(a, b)
+        elif kind == 2:
+            CCX(a, b, c)
+        elif kind == 3:
+            SWAP(a, c)
+        else:
+            T(a)
+    M(reg)
+    return circuit
+
+@pytest.mark.parametrize('seed', range(3))
+def testClassicalCircuitStaysSparse(seed):
+    circuit = classicalCircuit(12, seed)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    sparse = simFullState.simulate(circuit, engine='sparse')
+    assert not sparse.isDense
+    assert len(sparse.indices) <= 4
+    assertSameState(sparse.toDense(), tensor.psi)
+    np.testing.assert_allclose(sparse.probs(), tensor.probs(), atol=1e-12)
+    np.testing.assert_allclose(sparse.bitProbs(), tensor.bitProbs(), atol=1e-12)
+    np.testing.assert_allclose(sparse.marginalProbs([5, 0]), tensor.marginalProbs([5, 0]),
+                               atol=1e-12)
+    assert sparse.registerProbs() == tensor.registerProbs()
+
+def testExpectationsMatchTensor():
+    circuit = classicalCircuit(10, 3)
+    terms = randomTerms(10, 40, seed=3) + [{0: 'X'}, {1: 'Y'}, {0: 'X', 1: 'Z'}]
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    sparse = simFullState.simulate(circuit, engine='sparse')
+    assert not sparse.isDense
+    np.testing.assert_allclose(sparse.expectations(terms), tensor.expectations(terms),
+                               atol=1e-12)
+
+@pytest.mark.parametrize('seed', range(3))
+def testRandomCircuitMatchesTensor(seed):
+    circuit = randomCircuit(8, 60, seed=seed)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    sparse = simFullState.simulate(circuit, engine='sparse')
+    psi = sparse.psi if sparse.isDense else sparse.toDense()
+    assertSameState(psi, tensor.psi)
+    assert sparse.registerProbs() == tensor.registerProbs()
+
+def testMidCircuitMeasurement():
+    circuit = randomCircuit(8, 50, seed=4, midMeasure=3)
+    tensor = simFullState.simulate(circuit, engine='tensor', seed=5)
+    sparse = simFullState.simulate(circuit, engine='sparse', seed=5)
+    assert sparse.previousMeasurements() == tensor.previousMeasurements()
+    psi = sparse.psi if sparse.isDense else sparse.toDense()
+    assertSameState(psi, tensor.psi)
+
+def testDenseBeforeMaxTerms():
+    circuit = QuantumCircuit(10)
+    H(circuit[:])
+    result = simFullState.simulate(circuit, engine='sparse', denseFraction=1, maxTerms=8)
+    assert result.isDense
+    assertSameState(result.psi, np.ones(2**10))
+
+def testMaxTermsBeyondDenseQubits():
+    circuit = QuantumCircuit(10)
+    H(circuit[:])
+    with pytest.raises(SimulationError):
+        simFullState.simulate(circuit, engine='sparse', maxTerms=8, maxDenseQubits=5)
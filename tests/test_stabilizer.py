@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+import simFullState
+from simFullState import SimulationError
+from randomCircuits import randomCircuit, randomTerms
+
+
+def ghzCircuit(n):
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    H(reg[0])
+    for i in range(n-1):
+        CX(reg[i], reg[i+1])
+    M(reg)
+    return circuit
+
+@pytest.mark.parametrize('seed', range(6))
+def testRandomCliffordMatchesTensor(seed):
+    circuit = randomCircuit(7, 60, seed=seed, clifford=True)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    stabilizer = simFullState.simulate(circuit, engine='stabilizer')
+    assert stabilizer.registerProbs() == tensor.registerProbs()
+    tIndices, tProbs = tensor.registerProbs(asArrays=True)
+    sIndices, sProbs = stabilizer.registerProbs(asArrays=True)
+    np.testing.assert_array_equal(sIndices, tIndices)
+    np.testing.assert_allclose(sProbs, tProbs, atol=1e-12)
+    np.testing.assert_allclose(stabilizer.probs(), tensor.probs(), atol=1e-12)
+    np.testing.assert_allclose(stabilizer.bitProbs(), tensor.bitProbs(), atol=1e-12)
+    for bits in ([0], [3, 1], [6, 2, 4, 0]):
+        np.testing.assert_allclose(stabilizer.marginalProbs(bits), tensor.marginalProbs(bits),
+                                   atol=1e-12)
+    outputs, counts = stabilizer.sample(500, seed=seed)
+    assert counts.sum() == 500
+    assert set(outputs.tolist()) <= set(tIndices.tolist())
+
+@pytest.mark.parametrize('seed', range(6))
+def testExpectationsMatchTensor(seed):
+    circuit = randomCircuit(6, 50, seed=seed, clifford=True)
+    terms = randomTerms(6, 40, seed=seed)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    stabilizer = simFullState.simulate(circuit, engine='stabilizer')
+    np.testing.assert_allclose(stabilizer.expectations(terms), tensor.expectations(terms),
+                               atol=1e-12)
+
+@pytest.mark.parametrize('seed', range(3))
+def testBranchesMatchTensor(seed):
+    circuit = randomCircuit(6, 40, seed=seed, clifford=True, midMeasure=3)
+    def branches(engine):
+        return sorted((r.previousMeasurements(), round(r.probOfPreviousMeasurements(), 10),
+                       sorted(r.registerProbs().items()))
+                      for r in simFullState.simulateBranches(circuit, engine=engine))
+    assert branches('stabilizer') == branches('tensor')
+
+def testDefaultEngineIsTensor():
+    result = simFullState.simulate(ghzCircuit(20))
+    assert result.engine == 'tensor'
+    assert result.psi is not None
+    assert simFullState.simulateBranches(ghzCircuit(20))[0].engine == 'tensor'
+
+def testProbsTooLarge():
+    with pytest.raises(SimulationError):
+        simFullState.simulate(ghzCircuit(40), engine='stabilizer').probs()
+
+def testAutoEngine():
+    assert simFullState.simulate(ghzCircuit(20), engine='auto').engine == 'stabilizer'
+    assert simFullState.simulate(ghzCircuit(8), engine='auto').engine == 'tensor'
+    circuit = ghzCircuit(20)
+    T(circuit[0])
+    assert simFullState.simulate(circuit, engine='auto').engine == 'tensor'
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+import simFullState
+from randomCircuits import randomCircuit, assertSameState
+
+
+def simulateBoth(circuit, **kwargs):
+    result = simFullState.simulate(circuit, **kwargs)
+    stream = simFullState.simulateStream(list(circuit.history), circuit.n, **kwargs)
+    return result, stream
+
+@pytest.mark.parametrize('seed', range(4))
+def testRandomCircuitMatchesSimulate(seed):
+    result, stream = simulateBoth(randomCircuit(6, 60, seed=seed))
+    assertSameState(stream.psi, result.psi)
+    assert stream.registerProbs() == result.registerProbs()
+
+@pytest.mark.parametrize('seed', range(8))
+def testMidCircuitMeasurementsInCircuitOrder(seed):
+    circuit = QuantumCircuit(3)
+    r0, r1, r2 = circuit[:]
+    H(r1)
+    M(r0)
+    M(r1)
+    X(r1)
+    X(r0)
+    H(r2)
+    result, stream = simulateBoth(circuit, seed=seed)
+    assert stream.previousMeasurements()[0] == 0
+    assert stream.previousMeasurements() == result.previousMeasurements()
+    assertSameState(stream.psi, result.psi)
+
+@pytest.mark.parametrize('seed', range(4))
+def testRandomMidCircuitMeasurements(seed):
+    circuit = randomCircuit(6, 60, seed=seed, midMeasure=6)
+    for fuse in (None, 2):
+        result, stream = simulateBoth(circuit, seed=seed+10, fuse=fuse)
+        assert stream.previousMeasurements() == result.previousMeasurements()
+        assertSameState(stream.psi, result.psi)
+
+def testRepeatedMeasurement():
+    circuit = QuantumCircuit(2)
+    r0, r1 = circuit[:]
+    H(r0)
+    M(r0)
+    M(r0)
+    X(r1)
+    result, stream = simulateBoth(circuit, seed=3)
+    assert len(stream.previousMeasurements()) == 2
+    assert stream.previousMeasurements() == result.previousMeasurements()
+
+def testCallbacks():
+    circuit = randomCircuit(5, 40, seed=1, measure=False)
+    counts = []
+    simFullState.simulateStream(iter(circuit.history), 5,
+                                callbacks=[(10, lambda result, count: counts.append(count))])
+    assert counts == [10, 20, 30, 40]
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+import gate
+from gate import *
+
+
+@composite('QFT', -1)
+def qftGate(*bits):
+    for i, b in enumerate(bits):
+        H(b)
+        for j in range(i+1, len(bits)):
+            CRz(np.pi/2**(j-i))(bits[j], b)
+
+@compositeGeneric('RotateAll', -1, 2)
+def rotateAll(angle, axis):
+    rotation = {'x': Rx, 'y': Ry, 'z': Rz}[axis]
+    def apply(*bits):
+        for i, b in enumerate(bits):
+            rotation(angle*(i+1))(b)
+        CX(bits[0], bits[-1])
+    return apply
+
+@composite('AndInto', 3)
+def andInto(a, b, out):
+    ''' Toggle out with a and b through a borrowed ancilla '''
+    anc, = a.state.borrowAncilla(1)
+    CCX(a, b, anc)
+    CX(anc, out)
+    CCX(a, b, anc)
+    a.state.returnAncilla([anc])
+
+def build(apply, n=8):
+    circuit = QuantumCircuit(n)
+    apply(circuit[:])
+    return circuit
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = TemplateCache()
+    monkeypatch.setattr(gate, 'templateCache', cache)
+    return cache
+
+def buildBoth(apply, cache, monkeypatch, n=8):
+    cached = build(apply, n)
+    monkeypatch.setattr(gate, 'templateCache', TemplateCache(maxTemplates=0))
+    plain = build(apply, n)
+    monkeypatch.setattr(gate, 'templateCache', cache)
+    return cached, plain
+
+def assertSameHistory(cached, plain):
+    assert cached.n == plain.n
+    assert list(cached.history) == list(plain.history)
+    assert [repr(g) for g in cached.history] == [repr(g) for g in plain.history]
+    assert cached.history.counts == plain.history.counts
+    assert cached.ancillaReturns == plain.ancillaReturns
+
+def testCachedMatchesUncached(cache, monkeypatch):
+    def apply(reg):
+        for i in range(4):
+            qftGate(reg[i:i+4])
+            qftGate(reg[4-i:8-i][::-1])
+        qftGate(reg[:3])
+    cached, plain = buildBoth(apply, cache, monkeypatch)
+    assertSameHistory(cached, plain)
+    assert cache.hits == 7 and len(cache) == 2
+
+def testClosureArgs(cache, monkeypatch):
+    def apply(reg):
+        for angle, axis in ((0.1, 'x'), (0.2, 'y'), (0.1, 'x'), (0.1, 'z'), (0.2, 'y')):
+            rotateAll(angle, axis)(reg[1:5])
+            rotateAll(angle, axis)(reg[3:7])
+    cached, plain = buildBoth(apply, cache, monkeypatch)
+    assertSameHistory(cached, plain)
+    assert len(cache) == 3
+    assert cache.hits == 7
+
+def testBorrowedAncillaNotCached(cache, monkeypatch):
+    def apply(reg):
+        for i in range(4):
+            andInto(reg[i], reg[i+1], reg[i+2])
+    cached, plain = buildBoth(apply, cache, monkeypatch, n=6)
+    assertSameHistory(cached, plain)
+    assert cached.n == 7 and len(cached.ancillaReturns) == 4
+    assert len(cache) == 1 and cache.gates == 0  # Only the mark not to record it
+
+def testNotCachedWhenDisabledPerGate(cache):
+    uncached = Gate('QFT', -1, composite=qftGate.composite, cacheTemplate=False)
+    build(lambda reg: (uncached(reg[:4]), uncached(reg[4:])))
+    assert len(cache) == 0 and cache.hits == cache.misses == 0
+
+def testLruEviction(cache):
+    cache.maxTemplates = 2
+    build(lambda reg: [qftGate(reg[:k]) for k in (2, 3, 4, 2)])
+    assert len(cache) == 2 and cache.hits == 0
+    build(lambda reg: qftGate(reg[:4]))
+    assert cache.hits == 1
+    build(lambda reg: qftGate(reg[:3]))
+    assert cache.hits == 1  # Evicted when 2 qubits was stored again
+
+def testMaxGatesEviction(cache):
+    cache.maxGates = 10  # QFT on k bits is k*(k+1)/2 gates
+    build(lambda reg: [qftGate(reg[:k]) for k in (2, 3, 4)])
+    assert cache.gates <= 10
+    assert len(cache) == 1 and cache.gates == 10
+    build(lambda reg: qftGate(reg[:5]))  # 15 gates is never stored
+    assert len(cache) == 1 and cache.gates == 10
+    circuit = build(lambda reg: [qftGate(reg[:4]), qftGate(reg[4:])])
+    assert cache.hits == 2
+    assert len(circuit.history) == 20
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from circuit import QuantumCircuit
+from gate import *
+import simFullState
+from randomCircuits import randomCircuit, layeredCircuit, assertSameState
+
+
+def kernelCircuit(n, seed=0):
+    ''' Every diagonal, permutation and dense gate on random qubits, each
+        after a layer of H so no amplitude is zero '''
+    rng = np.random.default_rng(seed)
+    circuit = QuantumCircuit(n)
+    reg = circuit[:]
+    gates = [Z, S, Sd, T, Td, X, Y, H, CX, SWAP, CCX, Rz(0.3), Rx(0.7), Ry(1.1), CRz(0.9),
+             CCRz(1.3)]
+    for g in gates:
+        H(reg)
+        Ry(0.2)(reg[int(rng.integers(n))])
+        g(*(reg[int(b)] for b in rng.choice(n, g.size, replace=False)))
+    P(0.5)(reg[0])
+    return circuit
+
+@pytest.mark.parametrize('seed', range(4))
+def testKernelsMatchSwap(seed):
+    circuit = kernelCircuit(5, seed=seed)
+    tensor = simFullState.simulate(circuit, engine='tensor')
+    swap = simFullState.simulate(circuit, engine='swap')
+    np.testing.assert_allclose(tensor.psi, swap.psi, atol=1e-12)
+
+@pytest.mark.parametrize('seed', range(4))
+def testRandomCircuitMatchesSwap(seed):
+    circuit = randomCircuit(7, 80, seed=seed, midMeasure=2)
+    tensor = simFullState.simulate(circuit, engine='tensor', seed=seed)
+    swap = simFullState.simulate(circuit, engine='swap', seed=seed)
+    assert tensor.previousMeasurements() == swap.previousMeasurements()
+    np.testing.assert_allclose(tensor.psi, swap.psi, atol=1e-12)
+    assert tensor.registerProbs() == swap.registerProbs()
+
+@pytest.mark.parametrize('fuse', (1, 2, 3))
+def testFusedMatchesSwap(fuse):
+    circuit = randomCircuit(7, 80, seed=fuse, measure=False)
+    fused = simFullState.simulate(circuit, fuse=fuse)
+    swap = simFullState.simulate(circuit, engine='swap')
+    assert fused.fusionStats.gatesOut < fused.fusionStats.gatesIn
+    assertSameState(fused.psi, swap.psi)
+
+def testParallelMatchesSerial(monkeypatch):
+    n = simFullState.parallelMinQubits
+    circuit = layeredCircuit(n, 2)
+    for gate in (S, T, X, CRz(0.4), CCX):
+        gate(*circuit[:gate.size])
+    submitted = []
+    threadPool = simFullState._threadPool
+    monkeypatch.setattr(simFullState, '_threadPool',
+                        lambda workers: submitted.append(workers) or threadPool(workers))
+    parallel = simFullState.simulate(circuit, workers=4)
+    serial = simFullState.simulate(circuit, workers=1)
+    assert submitted and set(submitted) == {4}
+    np.testing.assert_allclose(parallel.psi, serial.psi, atol=1e-12)
@@ -0,0 +1,108 @@
+'''
+Unitary matrix of a whole circuit
+
+All 2**n columns evolve together as one (2**n, columns) block through the same
+gate kernels as the tensor engine, the column axis carried along as an extra
+axis.  The columns can be built in chunks to bound memory.
+
+Example:
+```
+    from unitary import circuitUnitary, unitaryMatches
+
+    u = circuitUnitary(circuit)
+    # Check a compiled circuit against a reference, 256 columns at a time
+    assert unitaryMatches(compiled, reference, chunkColumns=256)
+```
+'''
+
+import numpy as np
+
+from gateFusion import fuseGates
+from simFullState import (SimulationError, applyKernel, findGateOp, findInstKernel,
+                          findMeasureOrder, iterHistory)
+from fullStateUtil import stateDtype
+import util
+
+
+identityGates = {'I1', 'I2', 'I3'}  # Skipped
+
+
+def circuitKernels(circuit, fuse=None, dtype=None, stats=None):
+    ''' Return the list of (kernel, bits) of the circuit gates.  Measurements
+        of every qubit at the end are ignored, other measurements raise
+        SimulationError. '''
+    history = circuit.history
+    stop = len(history)
+    if findMeasureOrder(history, circuit.n, circuit.countM()) is not None:
+        stop -= circuit.n
+    gateInsts = (g for g in iterHistory(history, range(stop))
+                 if g.name not in identityGates)
+    if fuse:
+        gateOps = fuseGates(gateInsts, findGateOp, maxBits=fuse, stats=stats)
+    else:
+        gateOps = ((g, None) for g in gateInsts)
+    kernels = []
+    for gateInst, gateOp in gateOps:
+        if gateInst.measurement:
+            raise SimulationError('A circuit with mid-circuit measurements has no unitary')
+        _, kernel = findInstKernel(gateInst, gateOp, dtype)
+        kernels.append((kernel, tuple(b.__index__() for b in gateInst.bits)))
+    return kernels
+
+def iterUnitaryColumns(circuit, chunkColumns=None, fuse=None, dtype=None):
+    ''' Yield (start, block) with block the columns start:start+chunkColumns
+        of the circuit unitary.  Each block is evolved from the matching
+        columns of the identity by every gate before it is yielded. '''
+    n = circuit.n
+    dtype = np.dtype(stateDtype if dtype is None else dtype)
+    kernels = circuitKernels(circuit, fuse=fuse, dtype=dtype)
+    chunkColumns = 2**n if chunkColumns is None else chunkColumns
+    for start in range(0, 2**n, chunkColumns):
+        columns = min(chunkColumns, 2**n - start)
+        block = np.zeros((2**n, columns), dtype=dtype)
+        block[np.arange(start, start+columns), np.arange(columns)] = 1
+        shaped = block.reshape((2,)*n + (columns,))
+        for kernel, bits in kernels:
+            applyKernel(shaped, kernel, bits)
+        yield start, block
+
+def circuitUnitary(circuit, chunkColumns=None, fuse=None, dtype=None):
+    ''' Return the (2**n, 2**n) unitary of the circuit.  Like the gates it is
+        defined up to a global phase and scale.
+
+        chunkColumns: Evolve this many columns at a time (default all)
+        fuse: Merge runs of gates into unitaries on up to this many qubits
+    '''
+    n = circuit.n
+    out = np.empty((2**n, 2**n), dtype=stateDtype if dtype is None else dtype)
+    for start, block in iterUnitaryColumns(circuit, chunkColumns, fuse, dtype):
+        out[:, start:start+block.shape[1]] = block
+    return out
+
+def unitaryMatches(circuit, reference, chunkColumns=None, fuse=None, dtype=None,
+                   tol=util.floatError):
+    ''' Return whether the unitary of the circuit equals reference, a matrix or
+        another circuit, up to a global phase and scale.  Only chunkColumns
+        columns of each are held at once. '''
+    n = circuit.n
+    columns = iterUnitaryColumns(circuit, chunkColumns, fuse, dtype)
+    if isinstance(reference, np.ndarray):
+        if reference.shape != (2**n, 2**n):
+            return False
+        pairs = ((block, reference[:, start:start+block.shape[1]]) for start, block in columns)
+    else:
+        if reference.n != n:
+            return False
+        refColumns = iterUnitaryColumns(reference, chunkColumns, fuse, dtype)
+        pairs = ((block, refBlock) for (_, block), (_, refBlock) in zip(columns, refColumns))
+    scale = None
+    for block, refBlock in pairs:
+        if scale is None:
+            # The first chunk fixes the phase and scale of the others
+            i = np.unravel_index(np.argmax(np.abs(refBlock)), refBlock.shape)
+            if abs(block[i]) <= tol:
+                return False
+            scale = refBlock[i] / block[i]
+        if not util.isEqualOp(block * scale, refBlock, allowScale=False, tol=tol):
+            return False
+    return True
@@ -57,4 +57,16 @@ def isUnitary(op, allowScale=True):
         a /= a[0,0]
     a -= np.identity(n)
     return nearZero(np.linalg.norm(a))  # / n
+def isEqualOp(op, reference, allowScale=True, tol=floatError):
+    ''' Whether op equals reference relative to its norm.  With allowScale op
+        is first scaled to match the largest entry of reference so a global
+        phase and scale are ignored. '''
+    if op.shape != reference.shape:
+        return False
+    if allowScale:
+        i = np.unravel_index(np.argmax(np.abs(reference)), reference.shape)
+        if abs(op[i]) <= tol:
+            return np.linalg.norm(op) <= tol and np.linalg.norm(reference) <= tol
+        op = op * (reference[i] / op[i])
+    return np.linalg.norm(op - reference) <= tol * max(np.linalg.norm(reference), 1)
 